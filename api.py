@@ -0,0 +1,178 @@
+"""HTTP JSON/SSE API for retrieval and question answering"""
+import argparse
+import json
+from aiohttp import web
+from loguru import logger
+import metrics
+import pipeline
+from generation import FallbackAnswer
+from config import *
+
+DB_KEY = web.AppKey('db')
+
+
+def _bad_request(message):
+    return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+
+async def _read_question(request):
+    """Parse and validate the JSON body of a request, filling in defaults for history and k"""
+    try:
+        body = await request.json()
+    except ValueError:
+        # JSONDecodeError and UnicodeDecodeError for bodies that are not UTF-8
+        raise _bad_request('Body must be JSON')
+    if not isinstance(body, dict):
+        raise _bad_request('Body must be a JSON object')
+    question = body.get('question')
+    if not isinstance(question, str) or not question.strip():
+        raise _bad_request("'question' must be a non-empty string")
+    history = body.setdefault('history', '')
+    if not isinstance(history, str):
+        raise _bad_request("'history' must be a string")
+    k = body.setdefault('k', RETRIEVAL_K)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= API_MAX_K:
+        raise _bad_request(f"'k' must be an integer from 1 to {API_MAX_K}")
+    return body
+
+
+def _overloaded():
+    return web.json_response({'error': 'Service is busy, try again later'}, status=503, headers={'Retry-After': '1'})
+
+
+def create_app(db=None, retrieve=None, answer_stream=None, cached_answer=None):
+    """Build the API application.
+
+    retrieve, answer_stream and cached_answer default to the async pipeline
+    and can be replaced, e.g. with a stubbed LLM in tests. db is loaded on
+    startup when not given.
+    """
+    retrieve = retrieve or pipeline.retrieve
+    answer_stream = answer_stream or pipeline.answer_stream
+    cached_answer = cached_answer or pipeline.cached_answer_async
+    app = web.Application()
+
+    async def load_db(app):
+        if db is None:
+            from database import get_index_db
+            app[DB_KEY] = await pipeline.run_cpu(get_index_db)
+        else:
+            app[DB_KEY] = db
+
+    async def handle_retrieve(request):
+        body = await _read_question(request)
+        try:
+            content, sources, is_cached = await retrieve(body['question'], request.app[DB_KEY], body['k'])
+        except pipeline.Overloaded:
+            return _overloaded()
+        return web.json_response({'context': content, 'sources': sources, 'cached': is_cached})
+
+    async def handle_answer(request):
+        body = await _read_question(request)
+        question, history = body['question'], body['history']
+        try:
+            cached = await cached_answer(question, history)
+            if cached:
+                return web.json_response({'answer': cached['answer'], 'sources': cached['sources'], 'cached': True, 'fallback': False})
+            content, sources, _ = await retrieve(question, request.app[DB_KEY], body['k'])
+            chunks = [chunk async for chunk in answer_stream(question, content, history, sources)]
+        except pipeline.Overloaded:
+            return _overloaded()
+        fallback = any(isinstance(chunk, FallbackAnswer) for chunk in chunks)
+        return web.json_response({'answer': ''.join(chunks), 'sources': sources, 'cached': False, 'fallback': fallback})
+
+    async def handle_answer_stream(request):
+        body = await _read_question(request)
+        question, history = body['question'], body['history']
+        try:
+            cached = await cached_answer(question, history)
+            if cached:
+                sources = cached['sources']
+            else:
+                content, sources, _ = await retrieve(question, request.app[DB_KEY], body['k'])
+        except pipeline.Overloaded:
+            return _overloaded()
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        async def send(event, data):
+            await response.write(f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode())
+
+        fallback = False
+        error = None
+        stream = None
+        try:
+            if cached:
+                await send('token', {'text': cached['answer']})
+            else:
+                stream = answer_stream(question, content, history, sources)
+                async for chunk in stream:
+                    fallback = fallback or isinstance(chunk, FallbackAnswer)
+                    await send('token', {'text': chunk})
+            await send('done', {'cached': bool(cached), 'fallback': fallback, 'sources': sources})
+        except ConnectionResetError:
+            # The client went away (aiohttp's ClientConnectionResetError is a subclass)
+            logger.debug('Client disconnected while streaming an answer')
+            return response
+        except pipeline.Overloaded:
+            error = 'Service is busy, try again later'
+        except Exception as e:
+            logger.error(f'Error streaming answer: {e}')
+            error = 'Failed to generate answer'
+        finally:
+            if stream is not None:
+                # Leave a shared answer now rather than when the generator is collected
+                await stream.aclose()
+
+        try:
+            if error:
+                await send('error', {'error': error})
+            await response.write_eof()
+        except ConnectionResetError:
+            logger.debug('Client disconnected while streaming an answer')
+        return response
+
+    async def handle_stats(request):
+        from database import embedding_batch_stats
+        from llm_client import get_llm_client
+        from reranker import rerank_batch_stats, rerank_stats
+        return web.json_response({
+            'query_embeddings': embedding_batch_stats(),
+            'rerank': rerank_batch_stats(),
+            'rerank_paths': rerank_stats(),
+            'retrieval_stage': pipeline.retrieval_limit.stats(),
+            'generation_stage': pipeline.generation_limit.stats(),
+            'coalescing': {'retrieval': pipeline.retrieval_flights.stats(), 'generation': pipeline.answer_flights.stats()},
+            'latency': metrics.snapshot(),
+            'llm': get_llm_client().stats(),
+        })
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.prometheus_text(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app.on_startup.append(load_db)
+    app.router.add_post('/retrieve', handle_retrieve)
+    app.router.add_post('/answer', handle_answer)
+    app.router.add_post('/answer/stream', handle_answer_stream)
+    app.router.add_get('/stats', handle_stats)
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+def serve(host=API_HOST, port=API_PORT):
+    """Run the API server until interrupted"""
+    web.run_app(create_app(), host=host, port=port)
+
+
+def main():
+    """Run the API server from the command line"""
+    parser = argparse.ArgumentParser(description='HTTP API for KR laws retrieval and QA')
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
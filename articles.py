@@ -0,0 +1,124 @@
+"""Exact (law, article) lookup for questions that cite an article"""
+import json
+import re
+from loguru import logger
+
+# Law references in Russian, English and Kyrgyz, the law's case-sensitive
+# abbreviation, and a pattern matching the law's file name. More specific laws
+# come first ("уголовно-процессуальный" before "уголовный").
+LAW_PATTERNS = [
+    (r'уголовно[-\s]?процессуальн|criminal\s+procedur|кылмыш[-\s]жаза\s+процесс|кылмыш[-\s]процесс', 'УПК', r'Уголовно-процессуальный'),
+    (r'гражданск\w*\s+процессуальн|civil\s+procedur|жарандык\s+процесс', 'ГПК', r'Гражданский процессуальный'),
+    (r'правонарушени|offen[cs]es?\s+code|code\s+(?:of|on)\s+(?:administrative\s+)?offen[cs]es|violations|укук\s+бузуу', 'КоП', r'о правонарушениях'),
+    (r'уголовн|criminal|кылмыш', 'УК', r'Уголовный кодекс'),
+    (r'гражданск|civil|жарандык', 'ГК', r'Гражданский Кодекс'),
+    (r'трудов|labou?r|employment|эмгек', 'ТК', r'Трудовой'),
+    (r'налогов|\btax|салык', 'НК', r'Налоговый'),
+    (r'семейн|family|үй[-\s]бүлө', 'СК', r'Семейный'),
+    (r'земельн|\bland\s+code|жер\s+кодекс', 'ЗК', r'Земельный'),
+    (r'водн|\bwater\s+code|суу\s+кодекс', 'ВК', r'Водный'),
+]
+LAW_PATTERNS = [
+    (re.compile(rf'(?i:{words})|\b{abbreviation}\b'), re.compile(file))
+    for words, abbreviation, file in LAW_PATTERNS
+]
+
+ARTICLE_NUMBER = r'\d+(?:\s*[-–]\s*\d+|[¹²³⁴⁵⁶⁷⁸⁹⁰]+)?'
+# One or more numbers: "статьи 22, 23 и 24", "articles 10 and 11", "10 жана 11-беренелер"
+ARTICLE_LIST = rf'({ARTICLE_NUMBER}(?:\s*(?:,|;|&|\bи\b|\band\b|\bжана\b)\s*{ARTICLE_NUMBER})*)'
+ARTICLE_PATTERNS = [
+    re.compile(r'(?:стать[яиеюей]|\bст\b\.?)\s*№?\s*' + ARTICLE_LIST, re.IGNORECASE),
+    re.compile(r'(?:\barticles?|\barts?\.)\s*№?\s*' + ARTICLE_LIST, re.IGNORECASE),
+    re.compile(ARTICLE_LIST + r'\s*-?\s*берене', re.IGNORECASE),
+    re.compile(r'берене\w*\s*№?\s*' + ARTICLE_LIST, re.IGNORECASE),
+]
+
+SUPERSCRIPTS = str.maketrans('¹²³⁴⁵⁶⁷⁸⁹⁰', '1234567890')
+
+
+def normalize_article(article):
+    """Canonical article number: '240¹' and '240 – 1' become '240-1'"""
+    article = article.replace('–', '-').replace(' ', '')
+    match = re.match(r'(\d+)([¹²³⁴⁵⁶⁷⁸⁹⁰]+)$', article)
+    if match:
+        article = f'{match.group(1)}-{match.group(2).translate(SUPERSCRIPTS)}'
+    return article
+
+
+def parse_article_reference(query):
+    """Detect an article reference, returning (law file pattern, [articles]) or None"""
+    articles = []
+    for pattern in ARTICLE_PATTERNS:
+        for match in pattern.finditer(query):
+            for number in re.findall(ARTICLE_NUMBER, match.group(1)):
+                article = normalize_article(number)
+                if article not in articles:
+                    articles.append(article)
+    if not articles:
+        return None
+
+    for query_pattern, file_pattern in LAW_PATTERNS:
+        if query_pattern.search(query):
+            return file_pattern, articles
+    # An article number alone is ambiguous across codes
+    return None
+
+
+class ArticleIndex:
+    """Map of law file -> article number -> chunk IDs in document order"""
+
+    def __init__(self, articles):
+        self.articles = articles
+
+    def __len__(self):
+        return sum(len(file_articles) for file_articles in self.articles.values())
+
+    @classmethod
+    def build(cls, chunks):
+        """Build from (chunk_id, document) pairs"""
+        entries = {}
+        for chunk_id, doc in chunks:
+            article = doc.metadata.get('article')
+            if not article:
+                continue
+            source = doc.metadata.get('source_file', 'unknown')
+            key = normalize_article(article)
+            entries.setdefault(source, {}).setdefault(key, []).append((doc.metadata.get('start_index', 0), chunk_id))
+
+        articles = {
+            source: {article: [chunk_id for _, chunk_id in sorted(items)] for article, items in file_articles.items()}
+            for source, file_articles in entries.items()
+        }
+        return cls(articles)
+
+    def lookup(self, query):
+        """Return chunk IDs of the articles cited in query, or an empty list.
+
+        With several articles, their chunks are interleaved (the first
+        chunk of each, then the second of each, ...) so that every cited
+        article gets into a size-limited context.
+        """
+        reference = parse_article_reference(query)
+        if reference is None:
+            return []
+        file_pattern, articles = reference
+        per_article = []
+        for source, file_articles in self.articles.items():
+            if file_pattern.search(source):
+                per_article.extend(file_articles[article] for article in articles if article in file_articles)
+        chunk_ids = []
+        for rank in range(max(map(len, per_article), default=0)):
+            chunk_ids.extend(ids[rank] for ids in per_article if rank < len(ids))
+        return chunk_ids
+
+    def save(self, path):
+        """Save index as JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.articles, f, ensure_ascii=False)
+        logger.info(f'Article index saved: {len(self)} articles')
+
+    @classmethod
+    def load(cls, path):
+        """Load index saved with save()"""
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
@@ -0,0 +1,122 @@
+"""Micro-batching of model calls from concurrent requests"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from loguru import logger
+
+
+class MicroBatcher:
+    """Merge concurrent calls to a batch function into one call per tick.
+
+    Callers submit a list of items from any thread and block until their
+    results are ready. A worker thread takes the first waiting request,
+    collects more for up to max_wait seconds or until max_batch_size items
+    are queued, calls fn once on all items and hands each caller its slice
+    of the results. fn must return one result per item, in order;
+    otherwise every caller in the batch gets a ValueError.
+
+    A request that would overflow the batch is held for the next one, so
+    batches exceed max_batch_size only when a single request does.
+    """
+
+    def __init__(self, fn, max_batch_size=32, max_wait=0.005, name='batcher', window=1000):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._held = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+        # Metrics over all batches and the last `window` batches/requests
+        self.batches = 0
+        self.items = 0
+        self._batch_sizes = deque(maxlen=window)
+        self._queue_waits = deque(maxlen=window)
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit(self, items):
+        """Run fn on items as part of a batch and return their results"""
+        items = list(items)
+        if not items:
+            return []
+        if self._worker is None:
+            self._start()
+        future = Future()
+        self._queue.put((items, future, time.monotonic()))
+        return future.result()
+
+    def _next_request(self, timeout=None):
+        if self._held is not None:
+            request, self._held = self._held, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        requests = [self._next_request()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._next_request(timeout)
+            except queue.Empty:
+                break
+            if size + len(request[0]) > self.max_batch_size:
+                self._held = request
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            started = time.monotonic()
+            items = [item for request_items, _, _ in requests for item in request_items]
+            self.batches += 1
+            self.items += len(items)
+            self._batch_sizes.append(len(items))
+            self._queue_waits.extend(started - enqueued for _, _, enqueued in requests)
+            logger.debug(f'{self.name}: batch of {len(items)} items from {len(requests)} requests')
+
+            try:
+                results = list(self.fn(items))
+                if len(results) != len(items):
+                    # Slices would silently shift onto the wrong callers
+                    raise ValueError(f'{self.name}: fn returned {len(results)} results for {len(items)} items')
+            except Exception as e:
+                logger.warning(f'{self.name}: batch of {len(items)} failed: {e}')
+                for _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for request_items, future, _ in requests:
+                future.set_result(results[start:start + len(request_items)])
+                start += len(request_items)
+
+    def stats(self):
+        """Batch size and queue wait metrics"""
+        sizes = np.array(list(self._batch_sizes) or [0])
+        waits = np.array(list(self._queue_waits) or [0.0]) * 1000
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'batch_size_mean': round(float(sizes.mean()), 2),
+            'batch_size_max': int(sizes.max()),
+            'queue_wait_ms_p50': round(float(np.percentile(waits, 50)), 3),
+            'queue_wait_ms_p95': round(float(np.percentile(waits, 95)), 3),
+            'queued': self._queue.qsize(),
+        }
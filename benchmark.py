@@ -0,0 +1,168 @@
+"""Offline retrieval benchmark on the golden question set.
+
+Each question is run through search_documents under several retrieval
+configurations and index backends, reporting recall@k, MRR and latency
+per stage. Needs no Gemini key. Run `python benchmark.py --json report.json`
+and pass an earlier report with --baseline to see what a change cost.
+"""
+import argparse
+import copy
+import json
+import time
+from datetime import datetime, timezone
+import numpy as np
+from loguru import logger
+import metrics
+from config import *
+
+CONFIGURATIONS = {
+    'vector': {'use_bm25': False, 'use_reranking': False},
+    'vector_rerank': {'use_bm25': False, 'use_reranking': True},
+    'hybrid': {'use_bm25': True, 'use_reranking': False},
+    'hybrid_rerank': {'use_bm25': True, 'use_reranking': True},
+}
+
+# Settings recorded in the report, so results are compared like for like
+REPORT_SETTINGS = ('EMBEDDING_MODEL', 'RERANKER_MODEL', 'INFERENCE_BACKEND', 'CHUNK_SIZE', 'CHUNK_OVERLAP',
+                   'RERANK_TOP_N', 'MMR_LAMBDA', 'FUSION_METHOD', 'BM25_CANDIDATES', 'FUSION_POOL_RATIO',
+                   'RERANK_SKIP_MARGIN', 'RERANK_KEEP_MARGIN', 'IVF_NPROBE', 'HNSW_EF_SEARCH')
+
+
+def load_golden_set(path=GOLDEN_QUESTIONS_PATH):
+    """Load the versioned golden question set"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def first_relevant_rank(docs, expected):
+    """1-based rank of the first chunk from an expected article, or None"""
+    for rank, doc in enumerate(docs, start=1):
+        if doc.metadata.get('source_file') == expected['law'] and doc.metadata.get('article') in expected['articles']:
+            return rank
+    return None
+
+
+def run_configuration(db, questions, k, options, repeats=1):
+    """Retrieval quality and latency of one configuration over the questions"""
+    from reranker import score_cache
+    from retrieval import search_documents
+
+    # Warm-up loads the models outside the timings
+    search_documents(questions[0]['question'], db, k, **options)
+    metrics.reset()
+
+    latencies, ranks, law_hits, misses = [], {}, 0, []
+    started = time.perf_counter()
+    for repeat in range(repeats):
+        for question in questions:
+            score_cache.clear()
+            start = time.perf_counter()
+            docs = search_documents(question['question'], db, k, **options)
+            latencies.append(time.perf_counter() - start)
+            if repeat == 0:
+                expected = question['expected']
+                ranks[question['id']] = first_relevant_rank(docs, expected)
+                law_hits += any(doc.metadata.get('source_file') == expected['law'] for doc in docs)
+                if ranks[question['id']] is None:
+                    misses.append(question['id'])
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    stages = metrics.snapshot()['stages_ms']
+    return {
+        'recall_at_k': round(sum(rank is not None for rank in ranks.values()) / len(questions), 4),
+        'mrr': round(float(np.mean([1 / rank if rank else 0.0 for rank in ranks.values()])), 4),
+        'law_recall_at_k': round(law_hits / len(questions), 4),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'qps': round(len(latencies) / elapsed, 2),
+        'stages_ms': {stage: {'p50': stats['p50'], 'p95': stats['p95']} for stage, stats in stages.items()},
+        'misses': misses,
+    }
+
+
+def with_backend(db, backend, vectors):
+    """Shallow copy of db searching an index of the given backend, built from vectors"""
+    from vector_index import build_index
+    start = time.perf_counter()
+    bench_db = copy.copy(db)
+    bench_db.index = build_index(vectors, backend)
+    logger.info(f'Built {backend} index in {time.perf_counter() - start:.1f}s')
+    return bench_db
+
+
+def run_benchmark(db, golden, k=RETRIEVAL_K, configurations=tuple(CONFIGURATIONS), backends=(INDEX_BACKEND,), repeats=1):
+    """Run every configuration on every backend and return the report"""
+    from vector_index import all_vectors, index_backend
+    vectors = None
+    results = []
+    for backend in backends:
+        bench_db = db
+        if index_backend(db.index) != backend:
+            if vectors is None:
+                vectors = all_vectors(db.index)
+            bench_db = with_backend(db, backend, vectors)
+        for name in configurations:
+            logger.info(f'Benchmarking {name} on {backend}')
+            results.append({'config': name, 'backend': backend,
+                            **run_configuration(bench_db, golden['questions'], k, CONFIGURATIONS[name], repeats)})
+    return {
+        'golden_version': golden['version'],
+        'questions': len(golden['questions']),
+        'k': k,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'settings': {name: globals()[name] for name in REPORT_SETTINGS},
+        'results': results,
+    }
+
+
+def print_report(report, baseline=None):
+    """Print the results, with differences to a baseline report if given"""
+    previous = {}
+    if baseline:
+        if baseline['golden_version'] != report['golden_version'] or baseline['k'] != report['k']:
+            print(f"Baseline used golden set v{baseline['golden_version']} with k={baseline['k']}, not comparable")
+        else:
+            previous = {(row['config'], row['backend']): row for row in baseline['results']}
+
+    print(f"Golden set v{report['golden_version']}: {report['questions']} questions, k={report['k']}")
+    print(f"{'config':<15}{'backend':<10}{'recall@k':>10}{'MRR':>8}{'law@k':>8}{'p50 ms':>9}{'p95 ms':>9}{'q/s':>8}")
+    for row in report['results']:
+        print(f"{row['config']:<15}{row['backend']:<10}{row['recall_at_k']:>10.3f}{row['mrr']:>8.3f}"
+              f"{row['law_recall_at_k']:>8.3f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['qps']:>8.1f}")
+        old = previous.get((row['config'], row['backend']))
+        if old:
+            print(f"{'  vs baseline':<25}{row['recall_at_k'] - old['recall_at_k']:>+10.3f}{row['mrr'] - old['mrr']:>+8.3f}"
+                  f"{row['law_recall_at_k'] - old['law_recall_at_k']:>+8.3f}{row['p50_ms'] - old['p50_ms']:>+9.1f}"
+                  f"{row['p95_ms'] - old['p95_ms']:>+9.1f}{row['qps'] - old['qps']:>+8.1f}")
+
+
+def main():
+    """Run the benchmark from the command line"""
+    from vector_index import INDEX_BACKENDS
+    parser = argparse.ArgumentParser(description='Offline retrieval quality and latency benchmark')
+    parser.add_argument('--golden', default=GOLDEN_QUESTIONS_PATH)
+    parser.add_argument('--k', type=int, default=RETRIEVAL_K)
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGURATIONS), choices=CONFIGURATIONS)
+    parser.add_argument('--backends', nargs='+', default=[INDEX_BACKEND], choices=INDEX_BACKENDS)
+    parser.add_argument('--repeats', type=int, default=1, help='Passes over the questions for latency')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare with')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    from database import get_index_db
+    report = run_benchmark(get_index_db(), load_golden_set(args.golden), args.k, args.configs, args.backends, args.repeats)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
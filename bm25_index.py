@@ -0,0 +1,127 @@
+"""Persistent BM25 keyword index"""
+import json
+import os
+import re
+import shutil
+from collections import Counter
+import numpy as np
+from loguru import logger
+from config import *
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a compact inverted index.
+
+    Postings are stored CSR-style: the documents containing term ``t`` are
+    ``postings[offsets[t]:offsets[t + 1]]`` with matching ``term_freqs``.
+    Scoring touches only the postings of the query terms.
+    """
+
+    def __init__(self, vocab, offsets, postings, term_freqs, doc_lengths, doc_ids, k1=BM25_K1, b=BM25_B):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.doc_ids = doc_ids
+        self.k1 = k1
+
+        n_docs = len(doc_lengths)
+        avg_length = float(np.mean(doc_lengths)) if n_docs else 1.0
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        # Lucene-style idf, always positive so rare and common terms both contribute
+        self.idf = np.log(1.0 + (n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        self.length_norm = (k1 * (1.0 - b + b * doc_lengths / max(avg_length, 1.0))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, doc_ids, texts):
+        """Build the index from parallel lists of document ids and texts"""
+        vocab = {}
+        rows, cols, freqs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(position)
+                freqs.append(count)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind='stable')
+        postings = np.asarray(cols, dtype=np.int32)[order]
+        term_freqs = np.asarray(freqs, dtype=np.float32)[order]
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(vocab)), out=offsets[1:])
+
+        return cls(vocab, offsets, postings, term_freqs, doc_lengths, np.asarray(doc_ids, dtype=np.int64))
+
+    def search(self, query, k):
+        """Return up to k (doc_id, score) pairs with the highest BM25 score"""
+        rows = [self.vocab[term] for term in set(tokenize(query)) if term in self.vocab]
+        if not rows or k <= 0:
+            return []
+
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for row in rows:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            docs = self.postings[start:end]
+            tf = self.term_freqs[start:end]
+            # Each document appears once per term, so fancy-index accumulation is safe
+            scores[docs] += self.idf[row] * tf * (self.k1 + 1.0) / (tf + self.length_norm[docs])
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        """Save index arrays under path.
+
+        Files are written to a temporary directory that then replaces path,
+        so indexes still memory-mapping the old arrays keep valid data.
+        """
+        tmp_path, old_path = path + '.tmp', path + '.old'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(tmp_path, 'postings.npy'), self.postings)
+        np.save(os.path.join(tmp_path, 'term_freqs.npy'), self.term_freqs)
+        np.save(os.path.join(tmp_path, 'doc_lengths.npy'), self.doc_lengths)
+        np.save(os.path.join(tmp_path, 'doc_ids.npy'), self.doc_ids)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'terms': terms}, f, ensure_ascii=False)
+        # A directory cannot replace a non-empty one, so move the old one aside
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info(f'BM25 index saved: {len(self.doc_ids)} docs, {len(terms)} terms')
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(); postings are memory-mapped"""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        vocab = {term: row for row, term in enumerate(meta['terms'])}
+        return cls(
+            vocab,
+            np.load(os.path.join(path, 'offsets.npy')),
+            np.load(os.path.join(path, 'postings.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'term_freqs.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'doc_lengths.npy')),
+            np.load(os.path.join(path, 'doc_ids.npy')),
+        )
@@ -0,0 +1,77 @@
+"""Caching utilities for retrieval results"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    """Normalize question text so trivial variations share a cache key"""
+    text = unicodedata.normalize('NFKC', text).lower().replace('ё', 'е')
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL and hit/miss/eviction counters"""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return cached value and mark it recently used"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        """Store value, evicting least recently used entries when full"""
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def validate(self, fingerprint):
+        """Drop all entries if the index they were computed from has changed"""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._data.clear()
+                self.fingerprint = fingerprint
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
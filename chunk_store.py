@@ -0,0 +1,135 @@
+"""Pickle-free on-disk vector store: memory-mapped FAISS index plus SQLite chunk store"""
+import json
+import os
+import sqlite3
+import threading
+import faiss
+from loguru import logger
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_FILE = 'index.faiss'
+CHUNKS_FILE = 'chunks.sqlite'
+
+# Zero-copy mapping of index data (faiss >= 1.10); older versions only map IVF lists
+MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore that fetches chunks from SQLite by ID on demand.
+
+    Each thread gets its own connection; worker processes opening the same
+    file share the OS page cache instead of holding private copies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def search(self, search):
+        """Fetch a chunk by ID (LangChain returns a message string when missing)"""
+        row = self._connection().execute('SELECT text, metadata FROM chunks WHERE id = ?', (search,)).fetchone()
+        if row is None:
+            return f'ID {search} not found.'
+        return Document(id=str(search), page_content=row[0], metadata=json.loads(row[1]))
+
+    def search_many(self, ids):
+        """Fetch several chunks in one query, in the order of ids"""
+        ids = list(ids)
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            query = f'SELECT id, text, metadata FROM chunks WHERE id IN ({",".join("?" * len(batch))})'
+            for chunk_id, text, metadata in self._connection().execute(query, batch):
+                found[chunk_id] = Document(id=str(chunk_id), page_content=text, metadata=json.loads(metadata))
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def positions(self):
+        """Map of FAISS position -> chunk ID"""
+        return dict(self._connection().execute('SELECT position, id FROM positions'))
+
+    def all(self):
+        """All chunks as a dict, for loading into memory"""
+        rows = self._connection().execute('SELECT id, text, metadata FROM chunks')
+        return {chunk_id: Document(id=str(chunk_id), page_content=text, metadata=json.loads(metadata)) for chunk_id, text, metadata in rows}
+
+
+def store_exists(path):
+    """True if a vector store was saved under path"""
+    return os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(os.path.join(path, CHUNKS_FILE))
+
+
+def save_vectorstore(db, path):
+    """Write index and chunks to path.
+
+    Both files are written to temporary names and renamed, so processes
+    that already mapped the old files keep a consistent snapshot.
+    """
+    os.makedirs(path, exist_ok=True)
+    index_path = os.path.join(path, INDEX_FILE)
+    faiss.write_index(db.index, index_path + '.tmp')
+
+    chunks_path = os.path.join(path, CHUNKS_FILE)
+    if os.path.exists(chunks_path + '.tmp'):
+        os.remove(chunks_path + '.tmp')
+    connection = sqlite3.connect(chunks_path + '.tmp')
+    with connection:
+        connection.execute('CREATE TABLE chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)')
+        connection.execute('CREATE TABLE positions (position INTEGER PRIMARY KEY, id INTEGER NOT NULL)')
+        positions = sorted(db.index_to_docstore_id.items())
+        connection.executemany('INSERT INTO positions VALUES (?, ?)', positions)
+        connection.executemany(
+            'INSERT INTO chunks VALUES (?, ?, ?)',
+            ((chunk_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+             for chunk_id, doc in ((chunk_id, db.docstore.search(chunk_id)) for _, chunk_id in positions)),
+        )
+    connection.close()
+
+    os.replace(index_path + '.tmp', index_path)
+    os.replace(chunks_path + '.tmp', chunks_path)
+
+
+def load_vectorstore(path, embeddings, writable=False):
+    """Load a store saved with save_vectorstore.
+
+    By default the index is memory-mapped read-only and chunks are read
+    lazily from SQLite. With writable=True everything is loaded into memory
+    so chunks can be added and deleted.
+    """
+    index_path = os.path.join(path, INDEX_FILE)
+    docstore = SQLiteDocstore(os.path.join(path, CHUNKS_FILE))
+    index_to_docstore_id = docstore.positions()
+    if writable:
+        index = faiss.read_index(index_path)
+        docstore = InMemoryDocstore(docstore.all())
+    else:
+        index = faiss.read_index(index_path, MMAP_FLAGS)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def has_legacy_ids(path):
+    """True if the store under path still uses random string chunk IDs"""
+    connection = sqlite3.connect(f'file:{os.path.join(path, CHUNKS_FILE)}?mode=ro', uri=True)
+    try:
+        row = connection.execute('SELECT typeof(id) FROM positions LIMIT 1').fetchone()
+    finally:
+        connection.close()
+    return row is not None and row[0] == 'text'
+
+
+def load_pickle_store(path, embeddings):
+    """Load a store saved by FAISS.save_local, for converting it to this format.
+
+    This is the only place the pickled docstore is still read, once.
+    """
+    logger.warning(f'Converting pickled vector store in {path} to the memory-mapped format')
+    return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
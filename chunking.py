@@ -0,0 +1,164 @@
+"""Structural chunking of law codes along Раздел/Глава/Статья boundaries"""
+import hashlib
+import re
+from collections import Counter
+from langchain_core.documents import Document
+from config import *
+
+# Headings need a number (or a spelled-out ordinal for chapters), so body lines
+# such as "Раздел имущества..." are not mistaken for structure
+SECTION_PATTERN = re.compile(r'(?:РАЗДЕЛ|Раздел)\s+[IVXLC\d]+\b')
+SUBSECTION_PATTERN = re.compile(r'(?:ПОДРАЗДЕЛ|Подраздел)\s+[IVXLC\d]+\b')
+CHAPTER_PATTERN = re.compile(r'(?:ГЛАВА|Глава)\s+(?:[IVXLC\d]+\b|(?:\w+\s)?\w+(?:ая|ья)\b)')
+ARTICLE_PATTERN = re.compile(r'Статья\s+(\d+(?:[-–]\d+|[¹²³⁴⁵⁶⁷⁸⁹⁰]+)?)\.')
+
+# Preferred places to cut an article that does not fit into one chunk
+SPLIT_POINTS = ('\n', '. ', '; ', ' ')
+
+# Stored in the ingestion manifest; changing it re-chunks every file on the next sync
+CHUNKER_VERSION = f'structural-1:{CHUNK_SIZE}:{CHUNK_OVERLAP}'
+
+
+def parse_units(text):
+    """Split a code into structural units in a single pass over its lines.
+
+    A unit is one article together with any section and chapter headings
+    directly above it, or a run of text outside articles (preamble).
+    Units are dicts with start/end character offsets and the article,
+    chapter and section they belong to.
+    """
+    units = []
+    section = subsection = chapter = None
+    awaiting_title = None  # Heading whose title is on the next line
+    unit = {'start': 0, 'article': None, 'has_body': False}
+    position = 0
+
+    def close(end):
+        if end > unit['start']:
+            units.append({
+                'start': unit['start'],
+                'end': end,
+                'article': unit['article'],
+                'chapter': chapter,
+                'section': ' / '.join(part for part in (section, subsection) if part) or None,
+            })
+
+    for line in text.splitlines(keepends=True):
+        line_start = position
+        position += len(line)
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        article_match = ARTICLE_PATTERN.match(stripped)
+        heading = heading_match = None
+        if not article_match:
+            for kind, pattern in (('section', SECTION_PATTERN), ('subsection', SUBSECTION_PATTERN), ('chapter', CHAPTER_PATTERN)):
+                heading_match = pattern.match(stripped)
+                if heading_match:
+                    heading = kind
+                    break
+
+        if article_match or heading:
+            awaiting_title = None
+            # Headings between articles open the next unit rather than trailing the previous one
+            if unit['article'] or unit['has_body']:
+                close(line_start)
+                unit = {'start': line_start, 'article': None, 'has_body': False}
+            if article_match:
+                unit['article'] = article_match.group(1)
+                unit['has_body'] = True
+                continue
+
+            title = stripped.rstrip('. ')
+            if heading == 'section':
+                section, subsection, chapter = title, None, None
+            elif heading == 'subsection':
+                subsection, chapter = title, None
+            else:
+                chapter = title
+            if heading_match.end() >= len(title):
+                awaiting_title = heading
+        elif awaiting_title:
+            title = stripped.rstrip('. ')
+            if awaiting_title == 'section':
+                section = f'{section}. {title}'
+            elif awaiting_title == 'subsection':
+                subsection = f'{subsection}. {title}'
+            else:
+                chapter = f'{chapter}. {title}'
+            awaiting_title = None
+        else:
+            unit['has_body'] = True
+
+    close(len(text))
+    return units
+
+
+def split_span(text, start, end, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Cut text[start:end] into (start, end) windows of at most size characters.
+
+    Cuts prefer line, sentence, clause and word boundaries, and consecutive
+    windows share up to overlap characters starting at a word boundary.
+    """
+    spans = []
+    while start < end:
+        while start < end and text[start].isspace():
+            start += 1
+        if start >= end:
+            break
+        if end - start <= size:
+            cut = end
+        else:
+            cut = start + size
+            for separator in SPLIT_POINTS:
+                found = text.rfind(separator, start + size // 2, start + size)
+                if found != -1:
+                    cut = found + len(separator)
+                    break
+
+        chunk_end = cut
+        while chunk_end > start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        spans.append((start, chunk_end))
+        if cut >= end:
+            break
+
+        next_start = max(cut - overlap, start + 1)
+        space = text.find(' ', next_start, cut)
+        start = space + 1 if space != -1 else cut
+    return spans
+
+
+def chunk_law_text(text, file, file_path):
+    """Split one code into chunks carrying article, chapter, section and offsets"""
+    base_metadata = {
+        'source': file_path,
+        'source_file': file,
+        'law_name': file.replace('.txt', '').replace('_', ' '),
+    }
+    chunks = []
+    for unit in parse_units(text):
+        for start, end in split_span(text, unit['start'], unit['end']):
+            metadata = dict(base_metadata, start_index=start, end_index=end)
+            for key in ('article', 'chapter', 'section'):
+                if unit[key]:
+                    metadata[key] = unit[key]
+            chunks.append(Document(page_content=text[start:end], metadata=metadata))
+    return chunks
+
+
+def chunk_ids(file, texts):
+    """Content-addressed 63-bit IDs for one file's chunks, in order.
+
+    An ID hashes the file name and chunk text, so it does not depend on
+    chunk position or on when the file was indexed. Identical text repeated
+    within a file is told apart by its occurrence number.
+    """
+    occurrences = Counter()
+    ids = []
+    for text in texts:
+        occurrences[text] += 1
+        digest = hashlib.blake2b(f'{file}\0{occurrences[text]}\0{text}'.encode(), digest_size=8).digest()
+        ids.append(int.from_bytes(digest, 'big') & 0x7FFF_FFFF_FFFF_FFFF)
+    return ids
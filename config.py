@@ -12,14 +12,61 @@ CHUNK_SIZE = 600
 CHUNK_OVERLAP = 100
 RETRIEVAL_K = 8  # Reduced from 10 for speed
 RERANK_TOP_N = 15  # Reduced from 20 for speed
+RERANK_CACHE_SIZE = 5000  # Cached (query, chunk) cross-encoder scores
+RERANK_SKIP_MARGIN = 0.08  # Skip reranking when the vector top k lead the rest by this cosine margin
+RERANK_KEEP_MARGIN = 0.15  # Otherwise rerank only candidates within this margin of the k-th score
+MMR_LAMBDA = 0.5  # 1 = pure relevance, 0 = pure diversity
+
+# Local model inference (see `python onnx_backend.py`)
+INFERENCE_BACKEND = "torch"  # torch | onnx_int8 (ONNX Runtime, dynamic int8 quantization)
+ONNX_MODEL_DIR = "db/onnx"  # Exported models, next to DB_PATH
+ONNX_QUANTIZATION = "avx2"  # arm64 | avx2 | avx512 | avx512_vnni, match the CPU
+ONNX_MIN_COSINE = 0.98  # Quantized vs float embeddings, worst text
+ONNX_MIN_RANK_OVERLAP = 0.8  # Quantized vs float top-k results, mean over sample questions
+
+# Vector index settings
+INDEX_BACKEND = "flat"  # flat | ivf_flat | hnsw | ivf_pq | sq8 (see `python vector_index.py`)
+IVF_NLIST = 256  # Inverted lists (capped by corpus size)
+IVF_NPROBE = 16  # Lists scanned per query
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+PQ_M = 48  # Sub-quantizers, must divide the embedding dimension (384)
+PQ_NBITS = 8
+INDEX_TRAIN_SIZE = 50000  # Max vectors sampled to train IVF/PQ/SQ indexes
+
+# Ingestion settings
+INGEST_WORKERS = 4  # Processes reading and splitting law files
+EMBED_BATCH_SIZE = 64  # Chunks embedded per batch when building the index
 
 # Generation settings
+LLM_BACKEND = "gemini"  # gemini | fake (local stand-in for load tests); the LLM_BACKEND env var overrides
 TEMPERATURES = [0.1, 0.2, 0.15]  # Multiple temps for self-consistency mode
+SELF_CONSISTENCY_DEADLINE = 20  # Seconds to wait for self-consistency variants before voting on what arrived
+SELF_CONSISTENCY_AGREEMENT = 0.6  # Word overlap (Jaccard) at which two variants count as agreeing
 STREAMING_TEMPERATURE = 0.1
 MAX_OUTPUT_TOKENS = 2048
 TOP_P = 0.95
 TOP_K = 40
 
+# LLM client (rate limiting, deadlines, circuit breaker)
+LLM_REQUESTS_PER_MINUTE = 1000  # Gemini request quota; requests above it wait for the token bucket
+LLM_BURST = 20  # Requests that may start at once above the steady rate
+LLM_MAX_RATE_WAIT = 5  # Seconds a request may wait for quota before getting the fallback answer
+LLM_DEADLINE_SECONDS = 45  # Whole answer, including retries
+LLM_FIRST_TOKEN_TIMEOUT = 20  # Seconds to wait for the first streamed token of an attempt
+LLM_RETRY_BASE_DELAY = 0.5  # Seconds, doubled per retry, with jitter
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive upstream failures that open the circuit
+CIRCUIT_RESET_SECONDS = 30  # How long the circuit stays open before a trial call
+FALLBACK_CONTEXT_CHARS = 1200  # Law text shown instead of an answer when the LLM is unavailable
+
+# Fake LLM used with LLM_BACKEND = "fake" (see `python loadtest.py`)
+FAKE_LLM_FIRST_TOKEN_MS = 600
+FAKE_LLM_TOKEN_MS = 25
+FAKE_LLM_JITTER = 0.3  # Relative random spread of both delays
+FAKE_LLM_ERROR_RATE = 0.0  # Share of calls failing before the first token
+FAKE_LLM_STREAM_ERROR_RATE = 0.0  # Share of streams breaking off midway
+
 # Response quality settings
 MIN_ANSWER_LENGTH = 20
 MAX_ANSWER_LENGTH = 1500
@@ -27,19 +74,73 @@ REQUIRE_LEGAL_REFERENCES = True  # Require article/law citations
 MAX_GENERATION_RETRIES = 3
 
 # Speed optimizations
-USE_SELF_CONSISTENCY = False  # Disable for speed (enable for max quality)
+USE_SELF_CONSISTENCY = False  # Variants run concurrently; costs len(TEMPERATURES)x quota, not latency
 USE_RERANKING = True  # Keep for quality
 USE_BM25 = True  # Keep for quality
 LAZY_LOAD_RERANKER = True  # Load once, reuse
+USE_ARTICLE_LOOKUP = True  # Answer "статья N <code>" questions straight from the article index
+SYNC_ON_STARTUP = True  # Re-embed only added/changed law files when loading the index
+
+# BM25 settings
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Hybrid fusion settings
+FUSION_METHOD = "rrf"  # rrf (reciprocal rank fusion) | weighted (min-max normalized scores)
+RRF_K = 60
+VECTOR_WEIGHT = 0.7
+BM25_WEIGHT = 0.3
+BM25_CANDIDATES = 16  # BM25 hits entering fusion
+FUSION_POOL_RATIO = 0.25  # Weighted fusion: rerank candidates scoring at least this share of the best fused score
+
+# Context packing
+CONTEXT_TOKEN_BUDGET = 1600  # Estimated tokens of law text sent to the LLM per question
+CONTEXT_CHARS_PER_TOKEN = 3.5  # Rough ratio for Cyrillic legal text
+CONTEXT_MAX_CHUNKS_PER_LAW = 3
 
 # Paths
 LAWS_DIR = "laws"
 DB_PATH = "db/laws_db"
+BM25_PATH = DB_PATH + "/bm25"
+ARTICLE_INDEX_PATH = DB_PATH + "/articles.json"
+MANIFEST_PATH = DB_PATH + "/manifest.json"  # Per-file content hashes and chunk IDs
+BUILD_CHECKPOINT_PATH = DB_PATH + "_partial"  # Progress of an interrupted build
 LOG_PATH = "log/kyrgyz_laws_rag.log"
+GOLDEN_QUESTIONS_PATH = "benchmarks/golden_questions.json"  # Retrieval benchmark set (see `python benchmark.py`)
 
 # Cache settings
 MAX_CACHE_SIZE = 100
+CACHE_TTL_SECONDS = 3600  # None disables expiry
+
+# Semantic answer cache (reuses answers for paraphrased questions)
+USE_SEMANTIC_CACHE = True
+SEMANTIC_CACHE_THRESHOLD = 0.9  # Cosine similarity between questions
+SEMANTIC_CACHE_SIZE = 500
+SEMANTIC_CACHE_PATH = "db/semantic_cache"
+SEMANTIC_CACHE_SAVE_INTERVAL = 30  # Seconds between writes of new answers to disk
 
 # Server settings
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 7860
+GRADIO_CONCURRENCY_LIMIT = 64  # Web requests handled at once
+GRADIO_QUEUE_SIZE = 256  # Web requests waiting before Gradio rejects new ones
+API_HOST = "127.0.0.1"
+API_PORT = 8000
+API_MAX_K = 50  # Largest k accepted by /retrieve
+
+# Concurrency settings
+CPU_WORKERS = 4  # Threads for embedding, search and reranking
+MAX_CONCURRENT_RETRIEVALS = 4  # Retrievals running at once
+MAX_CONCURRENT_GENERATIONS = 32  # Gemini streams open at once
+MAX_PENDING_PER_STAGE = 64  # Requests waiting for a stage before new ones are turned away
+USE_REQUEST_COALESCING = True  # Identical questions in flight at once share one retrieval and one Gemini stream
+
+# Micro-batching of model calls across concurrent requests
+USE_MICRO_BATCHING = True
+BATCH_MAX_SIZE = 64  # Query texts per embedding call
+BATCH_MAX_WAIT_MS = 5  # How long the first request waits for others to join
+RERANK_BATCH_SIZE = 64  # (query, chunk) pairs per cross-encoder call
+RERANK_BATCH_WAIT_MS = 10
+
+# Metrics
+METRICS_WINDOW = 2000  # Recent samples per stage used for p50/p95/p99
@@ -2,7 +2,7 @@
 from loguru import logger
 from database import get_index_db
 from retrieval import get_message_content
-from generation import get_model_response
+from generation import get_model_response, get_cached_answer
 from config import *
 import random
 
@@ -68,10 +68,6 @@ def interactive_chat():
         try:
             print(random.choice(FUNNY_MESSAGES))
             
-            message_content, is_cached, confidence_score = get_message_content(topic, db, RETRIEVAL_K)
-            if is_cached:
-                print("⚡ Using cached results...")
-            
             # Build history (last 2 Q&A pairs, preserve full last exchange)
             history_text = ""
             if len(conversation_history) > 2:
@@ -84,7 +80,15 @@ def interactive_chat():
                 for h in conversation_history[-2:]:
                     history_text += f"{h['role']}: {h['content']}\n"
             
-            answer = get_model_response(topic, message_content, history_text)
+            answer = get_cached_answer(topic, history_text)
+            if answer:
+                print("⚡ Using cached answer...")
+            else:
+                message_content, sources, is_cached = get_message_content(topic, db, RETRIEVAL_K)
+                if is_cached:
+                    print("⚡ Using cached results...")
+                
+                answer = get_model_response(topic, message_content, history_text, sources)
             
             print(f"\n📋 Legal Expert Answer:")
             print(f"{'='*50}")
@@ -104,8 +108,10 @@ def single_question():
     """Single question mode"""
     db = get_index_db()
     topic = input("Enter your legal question: ")
-    message_content, _ = get_message_content(topic, db, RETRIEVAL_K)
-    answer = get_model_response(topic, message_content)
+    answer = get_cached_answer(topic)
+    if not answer:
+        message_content, sources, _ = get_message_content(topic, db, RETRIEVAL_K)
+        answer = get_model_response(topic, message_content, sources=sources)
     print("\n📋 Model Answer:")
     print(f"{'='*50}")
     print(answer)
@@ -0,0 +1,116 @@
+"""Token-budgeted packing of retrieved chunks into the prompt context"""
+import math
+import re
+from config import *
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate from the character count"""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+def _uncovered(start, end, spans):
+    """Trim [start, end) to the part not covered by spans already packed from the same file.
+
+    Chunks of one article overlap by up to CHUNK_OVERLAP characters, so
+    only a prefix or suffix is ever covered.
+    """
+    spans = sorted(spans)
+    for span_start, span_end in spans:
+        if span_start <= start < span_end:
+            start = span_end
+    for span_start, span_end in reversed(spans):
+        if span_start < end <= span_end:
+            end = span_start
+    return start, end
+
+
+def pack_context(docs, budget=CONTEXT_TOKEN_BUDGET, max_per_law=CONTEXT_MAX_CHUNKS_PER_LAW):
+    """Pack chunks, most relevant first, into at most budget estimated tokens.
+
+    Text already packed from an overlapping neighbour is cut from each
+    chunk, chunks that no longer fit are skipped, and at most max_per_law
+    chunks are taken from one law (no limit when it is None). The context
+    lists laws in order of their best chunk and each law's chunks in
+    document order. Adjacent pieces of an article share a line; a piece
+    following a gap starts a new line with '…'.
+
+    Returns (context, sources): sources has one dict per packed chunk, in
+    relevance order, with its chunk ID, law, article, offsets and tokens.
+    """
+    laws = {}
+    spans = {}
+    sources = []
+    used = 0
+    for doc in docs:
+        metadata = doc.metadata
+        source = metadata.get('source_file', 'unknown')
+        law = laws.get(source)
+        if law is not None and max_per_law is not None and len(law['pieces']) >= max_per_law:
+            continue
+
+        raw = doc.page_content
+        start, end = metadata.get('start_index'), metadata.get('end_index')
+        mapped = start is not None and end is not None and end - start == len(raw)
+        if mapped:
+            trimmed_start, trimmed_end = _uncovered(start, end, spans.get(source, []))
+            if trimmed_start >= trimmed_end:
+                continue
+            raw = raw[trimmed_start - start:trimmed_end - start]
+            start, end = trimmed_start, trimmed_end
+        text = WHITESPACE.sub(' ', raw).strip()
+        if not text:
+            continue
+
+        law_name = metadata.get('law_name', source)
+        article = metadata.get('article') or None
+        header = estimate_tokens(f'=== {law_name} ===') if law is None else 0
+        label = f'[Статья {article}] ' if article and not text.startswith('Статья') else ''
+        tokens = header + estimate_tokens(label + text)
+        if used + tokens > budget:
+            if sources:
+                continue
+            # Always keep the best chunk, cut to the budget. The raw text is
+            # cut so that end still points just past what was packed.
+            raw = raw[:max(0, int((budget - header) * CONTEXT_CHARS_PER_TOKEN) - len(label))]
+            text = WHITESPACE.sub(' ', raw).strip()
+            end = start + len(raw) if mapped else None
+            tokens = header + estimate_tokens(label + text)
+
+        if law is None:
+            law = laws[source] = {'law_name': law_name, 'pieces': []}
+        law['pieces'].append({'start': start or 0, 'end': end, 'article': article, 'text': text})
+        if start is not None and end is not None:
+            spans.setdefault(source, []).append((start, end))
+        used += tokens
+        sources.append({
+            'chunk_id': int(doc.id) if doc.id else None,
+            'law_name': law_name,
+            'source_file': source,
+            'article': article,
+            'start_index': start,
+            'end_index': end,
+            'tokens': tokens,
+        })
+
+    blocks = []
+    for law in laws.values():
+        lines = [f"=== {law['law_name']} ==="]
+        previous = None
+        for piece in sorted(law['pieces'], key=lambda piece: piece['start']):
+            article, text = piece['article'], piece['text']
+            if previous is not None and article and article == previous['article']:
+                if previous['end'] is not None and piece['start'] == previous['end']:
+                    # Continue the article above on the same line
+                    lines[-1] += ' ' + text
+                    previous = piece
+                    continue
+                # Text between the two pieces was left out
+                text = '… ' + text
+            label = f'[Статья {article}] ' if article and not text.startswith('Статья') else ''
+            lines.append(label + text)
+            previous = piece
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks), sources
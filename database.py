@@ -1,13 +1,16 @@
 """Database initialization and management"""
 import os
 import ssl
+import hashlib
 import certifi
 from loguru import logger
-from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import re
+from batching import MicroBatcher
+from bm25_index import BM25Index
+from articles import ArticleIndex
+from vector_index import apply_search_params, convert_vectorstore, index_backend
+from ingestion import build_vectorstore, discard_build_checkpoint, sync_vectorstore, load_manifest, save_manifest, bootstrap_manifest, plan_sync, assign_content_ids
+from chunk_store import has_legacy_ids, load_pickle_store, load_vectorstore, save_vectorstore, store_exists
 from config import *
 
 # Disable SSL verification warnings
@@ -19,74 +22,212 @@ os.environ['CURL_CA_BUNDLE'] = ''
 os.environ['REQUESTS_CA_BUNDLE'] = ''
 
 
+# Lazy load embedding model
+_embeddings_cache = None
+
 def get_embeddings():
-    """Initialize embedding model"""
-    return HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'},
-    )
+    """Get or create embedding model instance"""
+    global _embeddings_cache
+    if _embeddings_cache is None and INFERENCE_BACKEND == 'onnx_int8':
+        from onnx_backend import get_onnx_embeddings
+        _embeddings_cache = get_onnx_embeddings()
+    if _embeddings_cache is None:
+        _embeddings_cache = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={'device': 'cpu'},
+        )
+    return _embeddings_cache
+
+
+# Query embeddings from concurrent requests, merged into one model call
+_query_batcher = None
+
+def embed_queries(texts):
+    """Embed query texts, batched with other requests' queries"""
+    global _query_batcher
+    if not USE_MICRO_BATCHING:
+        return get_embeddings().embed_documents(texts)
+    if _query_batcher is None:
+        _query_batcher = MicroBatcher(
+            lambda batch: get_embeddings().embed_documents(batch),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait=BATCH_MAX_WAIT_MS / 1000,
+            name='query-embeddings',
+        )
+    return _query_batcher.submit(texts)
+
+
+def embedding_batch_stats():
+    """Metrics of query embedding batches, or None before the first batch"""
+    return _query_batcher.stats() if _query_batcher else None
+
+
+def upgrade_legacy_store(embeddings):
+    """Convert an index saved by an older version in place.
+
+    Pickled stores are moved to the memory-mapped format and random chunk
+    IDs are replaced with content-addressed ones, without re-embedding.
+    """
+    pickle_path = os.path.join(DB_PATH, 'index.pkl')
+    if os.path.exists(pickle_path):
+        db = load_pickle_store(DB_PATH, embeddings)
+    elif store_exists(DB_PATH) and has_legacy_ids(DB_PATH):
+        db = load_vectorstore(DB_PATH, embeddings, writable=True)
+    else:
+        return
+    manifest = load_manifest() or bootstrap_manifest(db)
+    assign_content_ids(db, manifest)
+    save_index_db(db, manifest)
+    if os.path.exists(pickle_path):
+        os.remove(pickle_path)
 
 
 def get_index_db():
-    """Load or create FAISS vector database"""
+    """Load or create FAISS vector database.
+
+    Building, syncing and backend conversion work on a writable in-memory
+    copy; the returned store is memory-mapped read-only for serving.
+    """
     logger.debug('...get_index_db')
     embeddings = get_embeddings()
-    file_path = DB_PATH + "/index.faiss"
-    
-    if os.path.exists(file_path):
-        logger.debug('Loading existing database')
-        db = FAISS.load_local(DB_PATH, embeddings, allow_dangerous_deserialization=True)
+
+    upgrade_legacy_store(embeddings)
+    if store_exists(DB_PATH):
+        if SYNC_ON_STARTUP:
+            sync_index_db()
+        db = load_vectorstore(DB_PATH, embeddings)
+        if index_backend(db.index) != INDEX_BACKEND:
+            db = load_vectorstore(DB_PATH, embeddings, writable=True)
+            convert_vectorstore(db)
+            save_vectorstore(db, DB_PATH)
     else:
-        logger.debug('Creating new knowledge base from .txt files')
-        documents = []
-        loaded_files = []
-        
-        for root, dirs, files in os.walk(LAWS_DIR):
-            for file in files:
-                if file.endswith(".txt"):
-                    try:
-                        logger.debug(f'Loading file: {file}')
-                        file_path = os.path.join(root, file)
-                        loader = TextLoader(file_path, encoding='utf-8')
-                        file_docs = loader.load()
-                        
-                        for doc in file_docs:
-                            doc.metadata['source_file'] = file
-                            doc.metadata['law_name'] = file.replace('.txt', '').replace('_', ' ')
-                            # Extract article numbers
-                            article_match = re.search(r'Статья\s+(\d+)', doc.page_content)
-                            if article_match:
-                                doc.metadata['article'] = article_match.group(1)
-                        
-                        documents.extend(file_docs)
-                        loaded_files.append(file)
-                    except Exception as e:
-                        logger.error(f'Error loading file {file}: {e}')
-
-        logger.info(f'Files loaded: {len(loaded_files)}')
-        logger.info(f'Files: {loaded_files}')
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            separators=["\n\nСтатья", "\n\n", "\n", ". ", " "],
-            keep_separator=True
-        )
-        source_chunks = text_splitter.split_documents(documents)
-        
-        logger.info(f'Chunks created: {len(source_chunks)}')
+        db, manifest = build_vectorstore(embeddings)
+        # Built as a flat index, then trained for the configured backend on the full corpus
+        if index_backend(db.index) != INDEX_BACKEND:
+            convert_vectorstore(db)
+        save_index_db(db, manifest)
+        discard_build_checkpoint()
 
-        db = FAISS.from_documents(source_chunks, embeddings)
-        db.save_local(DB_PATH)
+    logger.debug('Mapping vector store')
+    db = load_vectorstore(DB_PATH, embeddings)
+    apply_search_params(db.index)
 
+    # Load keyword and article indexes into memory once per process
+    get_bm25_index(db)
+    get_article_index(db)
+    update_index_fingerprint()
     return db
 
 
+def save_index_db(db, manifest):
+    """Save vector store, manifest, BM25 and article indexes"""
+    save_vectorstore(db, DB_PATH)
+    save_manifest(manifest)
+    build_bm25_index(db)
+    build_article_index(db)
+
+
+def iter_chunks(db):
+    """Yield (chunk_id, document) for every chunk in index order"""
+    for doc_id in db.index_to_docstore_id.values():
+        yield doc_id, db.docstore.search(doc_id)
+
+
+def sync_index_db():
+    """Apply changes in LAWS_DIR to the saved index, re-embedding only changed files.
+
+    The store is loaded writable only when there is something to apply.
+    Returns True if the index was modified.
+    """
+    upgrade_legacy_store(get_embeddings())
+    if not store_exists(DB_PATH):
+        get_index_db()
+        return True
+
+    manifest = load_manifest() or bootstrap_manifest(load_vectorstore(DB_PATH, get_embeddings()))
+    plan = plan_sync(manifest)
+    if not any(plan):
+        logger.debug('Knowledge base is up to date')
+        if not os.path.exists(MANIFEST_PATH):
+            save_manifest(manifest)
+        return False
+
+    db = load_vectorstore(DB_PATH, get_embeddings(), writable=True)
+    apply_search_params(db.index)
+    sync_vectorstore(db, manifest, plan)
+    # BM25 idf and document lengths are corpus-wide, so it is rebuilt from stored chunk text
+    save_index_db(db, manifest)
+    return True
+
+
+# Identifies the index currently loaded, used to invalidate caches
+_index_fingerprint = None
+
+def update_index_fingerprint():
+    """Recompute fingerprint from the saved index files"""
+    global _index_fingerprint
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(DB_PATH):
+        dirs.sort()
+        for file in sorted(files):
+            stat = os.stat(os.path.join(root, file))
+            digest.update(f'{file}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    _index_fingerprint = digest.hexdigest()
+    logger.debug(f'Index fingerprint: {_index_fingerprint}')
+    return _index_fingerprint
+
+
+def get_index_fingerprint():
+    """Get fingerprint of the loaded index"""
+    return _index_fingerprint
+
+
+# BM25 index shared by all requests
+_bm25_cache = None
+
+def build_bm25_index(db):
+    """Build BM25 index over the vector store chunks and save it next to FAISS"""
+    global _bm25_cache
+    logger.debug('Building BM25 index')
+    doc_ids, texts = [], []
+    for doc_id, doc in iter_chunks(db):
+        doc_ids.append(doc_id)
+        texts.append(doc.page_content)
+    _bm25_cache = BM25Index.build(doc_ids, texts)
+    _bm25_cache.save(BM25_PATH)
+    return _bm25_cache
+
+
 def get_bm25_index(db):
-    """Create BM25 index for keyword search"""
-    from rank_bm25 import BM25Okapi
-    
-    docs = db.docstore._dict.values()
-    corpus = [doc.page_content.lower().split() for doc in docs]
-    bm25 = BM25Okapi(corpus)
-    return bm25, list(docs)
+    """Get BM25 index for keyword search, loading or building it on first use"""
+    global _bm25_cache
+    if _bm25_cache is None:
+        if os.path.exists(os.path.join(BM25_PATH, 'doc_ids.npy')):
+            logger.debug('Loading BM25 index')
+            _bm25_cache = BM25Index.load(BM25_PATH)
+        if _bm25_cache is None or len(_bm25_cache) != len(db.index_to_docstore_id):
+            _bm25_cache = build_bm25_index(db)
+    return _bm25_cache
+
+
+# Article index shared by all requests
+_article_index_cache = None
+
+def build_article_index(db):
+    """Build (law, article) -> chunk IDs index and save it next to FAISS"""
+    global _article_index_cache
+    logger.debug('Building article index')
+    _article_index_cache = ArticleIndex.build(iter_chunks(db))
+    _article_index_cache.save(ARTICLE_INDEX_PATH)
+    return _article_index_cache
+
+
+def get_article_index(db):
+    """Get article index, loading or building it on first use"""
+    global _article_index_cache
+    if _article_index_cache is None:
+        if os.path.exists(ARTICLE_INDEX_PATH):
+            _article_index_cache = ArticleIndex.load(ARTICLE_INDEX_PATH)
+        else:
+            _article_index_cache = build_article_index(db)
+    return _article_index_cache
@@ -0,0 +1,133 @@
+"""Local stand-in for the Gemini model, for load tests without API quota.
+
+FakeGenerativeModel has the parts of genai.GenerativeModel that
+llm_client.py uses. It answers with a canned text built from the prompt,
+streamed word by word after a first-token delay, and can be told to fail
+a share of calls. Select it with LLM_BACKEND = "fake" (or the
+LLM_BACKEND environment variable).
+"""
+import asyncio
+import random
+import re
+import time
+from config import *
+
+# Current behaviour, changeable at runtime with configure()
+settings = {
+    'first_token_ms': FAKE_LLM_FIRST_TOKEN_MS,
+    'token_ms': FAKE_LLM_TOKEN_MS,
+    'jitter': FAKE_LLM_JITTER,
+    'error_rate': FAKE_LLM_ERROR_RATE,
+    'stream_error_rate': FAKE_LLM_STREAM_ERROR_RATE,
+}
+
+ANSWERS = {
+    'English': ("Article {article} of the {law} covers this question: {question} "
+                "The law sets out the rights and duties of the people involved. "
+                "If the rules are broken, a fine or another penalty may apply. "
+                "See Article {article} for the details."),
+    'Russian': ("Этот вопрос регулирует статья {article} ({law}): {question} "
+                "Закон определяет права и обязанности сторон. "
+                "За нарушение может грозить штраф или другое наказание. "
+                "Подробности смотрите в статье {article}."),
+    'Kyrgyz': ("Бул маселени {law} жөнгө салат (статья {article}): {question} "
+               "Мыйзам тараптардын укуктарын жана милдеттерин аныктайт. "
+               "Бузуу үчүн айып пул же башка жаза каралышы мүмкүн."),
+}
+
+
+class FakeLLMError(Exception):
+    """Injected failure of the fake model"""
+
+
+def configure(**changes):
+    """Change latency or failure settings, e.g. configure(error_rate=0.05)"""
+    unknown = set(changes) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown fake LLM settings: {sorted(unknown)}')
+    settings.update(changes)
+
+
+def canned_answer(prompt):
+    """Answer in the prompt's language that cites its first law and article"""
+    language = re.search(r'The question is asked in: (\w+)', prompt)
+    question = re.search(r'^QUESTION: (.*)$', prompt, re.MULTILINE)
+    law = re.search(r'^=== (.+) ===$', prompt, re.MULTILINE)
+    article = re.search(r'(?:\[Статья |Статья )(\d+)', prompt)
+    template = ANSWERS.get(language.group(1) if language else 'English', ANSWERS['English'])
+    return template.format(
+        question=question.group(1).strip() if question else '',
+        law=law.group(1) if law else 'law',
+        article=article.group(1) if article else '1',
+    )
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    """Complete or streamed response; iterate it (sync or async) for chunks"""
+
+    def __init__(self, tokens, fail_at=None):
+        self._tokens = tokens
+        self._fail_at = fail_at
+
+    @property
+    def text(self):
+        return ''.join(self._tokens)
+
+    def _token_delay(self):
+        return _jittered(settings['token_ms'])
+
+    def __iter__(self):
+        for i, token in enumerate(self._tokens):
+            if i == self._fail_at:
+                raise FakeLLMError('Injected stream failure')
+            if i:
+                time.sleep(self._token_delay())
+            yield _Chunk(token)
+
+    async def __aiter__(self):
+        for i, token in enumerate(self._tokens):
+            if i == self._fail_at:
+                raise FakeLLMError('Injected stream failure')
+            if i:
+                await asyncio.sleep(self._token_delay())
+            yield _Chunk(token)
+
+
+def _jittered(ms):
+    spread = settings['jitter']
+    return max(0.0, ms * random.uniform(1 - spread, 1 + spread)) / 1000
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel with canned, delayed answers"""
+
+    def __init__(self, temperature=STREAMING_TEMPERATURE):
+        self.temperature = temperature
+
+    def _respond(self, prompt, stream):
+        if random.random() < settings['error_rate']:
+            raise FakeLLMError('Injected model failure')
+        tokens = re.findall(r'\S+\s*', canned_answer(prompt))
+        fail_at = None
+        if stream and random.random() < settings['stream_error_rate']:
+            fail_at = random.randrange(1, len(tokens))
+        return _Response(tokens, fail_at)
+
+    def generate_content(self, prompt, stream=False):
+        time.sleep(_jittered(settings['first_token_ms']))
+        response = self._respond(prompt, stream)
+        if not stream:
+            time.sleep(_jittered(settings['token_ms']) * len(response._tokens))
+        return response
+
+    async def generate_content_async(self, prompt, stream=False):
+        await asyncio.sleep(_jittered(settings['first_token_ms']))
+        response = self._respond(prompt, stream)
+        if not stream:
+            await asyncio.sleep(_jittered(settings['token_ms']) * len(response._tokens))
+        return response
@@ -0,0 +1,69 @@
+"""Score-level fusion of vector and BM25 rankings by chunk ID"""
+from config import *
+
+
+def reciprocal_rank_fusion(rankings, weights, k=RRF_K):
+    """Fuse ranked lists of chunk IDs: score = sum of weight / (k + rank)"""
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight / (k + rank)
+    return fused
+
+
+def min_max(scores):
+    """Scale a chunk ID -> score map to [0, 1]"""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {chunk_id: 1.0 for chunk_id in scores}
+    return {chunk_id: (score - low) / (high - low) for chunk_id, score in scores.items()}
+
+
+def weighted_fusion(score_maps, weights):
+    """Fuse chunk ID -> score maps as a weighted sum of min-max normalized scores"""
+    fused = {}
+    for scores, weight in zip(score_maps, weights):
+        for chunk_id, score in min_max(scores).items():
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight * score
+    return fused
+
+
+def fuse(vector_rankings, vector_scores, bm25_hits, method=FUSION_METHOD):
+    """Fuse vector and BM25 results into one ranking of (chunk_id, score).
+
+    vector_rankings holds one list of chunk IDs per expanded query, which
+    share VECTOR_WEIGHT; vector_scores maps chunk IDs to their similarity
+    with the question. bm25_hits is a list of (chunk_id, score).
+    """
+    vector_rankings = [ranking for ranking in vector_rankings if ranking]
+    if method == 'rrf':
+        rankings = vector_rankings + [[chunk_id for chunk_id, _ in bm25_hits]]
+        weights = [VECTOR_WEIGHT / max(len(vector_rankings), 1)] * len(vector_rankings) + [BM25_WEIGHT]
+        fused = reciprocal_rank_fusion(rankings, weights)
+    elif method == 'weighted':
+        vector_ids = {chunk_id for ranking in vector_rankings for chunk_id in ranking}
+        vector = {chunk_id: vector_scores.get(chunk_id, 0.0) for chunk_id in vector_ids}
+        fused = weighted_fusion([vector, dict(bm25_hits)], [VECTOR_WEIGHT, BM25_WEIGHT])
+    else:
+        raise ValueError(f"Unknown fusion method {method!r}, expected 'rrf' or 'weighted'")
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def candidate_pool(fused, k, max_size=RERANK_TOP_N, min_ratio=FUSION_POOL_RATIO, method=FUSION_METHOD):
+    """Chunk IDs worth reranking: the top max_size, and with weighted fusion
+    only those scoring at least min_ratio of the best, but no fewer than k.
+
+    RRF scores of any listed chunk lie within a few percent of each other
+    (weight / (RRF_K + rank)), so a score ratio would never cut the pool.
+    """
+    if not fused:
+        return []
+    if method == 'rrf':
+        return [chunk_id for chunk_id, _ in fused[:max(max_size, k)]]
+    threshold = fused[0][1] * min_ratio
+    pool = [chunk_id for chunk_id, score in fused[:max_size] if score >= threshold]
+    if len(pool) < k:
+        pool = [chunk_id for chunk_id, _ in fused[:k]]
+    return pool
@@ -1,74 +1,111 @@
 """LLM response generation"""
 from loguru import logger
-import google.generativeai as genai
-from collections import Counter
+import asyncio
 import re
-import os
-from dotenv import load_dotenv
+import time
+from articles import parse_article_reference
+from context import estimate_tokens
+from llm_client import LLMUnavailable, get_llm_client, run_sync
+from metrics import record_cache, record_fallback, record_prompt_tokens, record_stage, timed
 from config import *
 
-# Load environment variables
-load_dotenv()
+# Shown instead of an answer when the LLM is unavailable, before the retrieved law text
+FALLBACK_MESSAGES = {
+    'English': "The answering service is busy or unavailable right now, so here are the provisions that look most relevant to your question:",
+    'Russian': "Сервис ответов сейчас перегружен или недоступен, поэтому вот положения, которые больше всего относятся к вашему вопросу:",
+    'Kyrgyz': "Жооп берүү кызматы азыр бош эмес же жеткиликсиз, ошондуктан сурооңузга эң тиешелүү жоболор:",
+}
+CUT_OFF_MESSAGES = {
+    'English': "(The answer was cut off. Please try again in a moment.)",
+    'Russian': "(Ответ прервался. Пожалуйста, повторите вопрос чуть позже.)",
+    'Kyrgyz': "(Жооп үзүлүп калды. Бир аздан кийин кайра аракет кылыңыз.)",
+}
 
-# Configure Gemini
-api_key = os.getenv('GEMINI_API_KEY') or GEMINI_API_KEY
-if not api_key:
-    logger.warning("GEMINI_API_KEY not found in .env file or config.py. Please set it.")
-else:
-    genai.configure(api_key=api_key)
 
-# Lazy load LLM for reuse
-_llm_cache = None
+class FallbackAnswer(str):
+    """Text of a fallback answer, so callers can tell it from a generated one"""
 
-def get_llm(temperature=None):
-    """Get or create LLM instance"""
-    global _llm_cache
-    if temperature is None:
-        temperature = STREAMING_TEMPERATURE
-    
-    # Reuse cached LLM if same temperature
-    if _llm_cache and _llm_cache[0] == temperature:
-        return _llm_cache[1]
-    
-    # Safety settings to allow legal content
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
-    
-    model = genai.GenerativeModel(
-        model_name=GEMINI_MODEL_NAME,
-        generation_config={
-            'temperature': temperature,
-            'max_output_tokens': 2048,
-            'top_p': 0.95,
-            'top_k': 40,
-        },
-        safety_settings=safety_settings
-    )
-    _llm_cache = (temperature, model)
-    return model
-
-
-def _generate_with_retry(model, prompt, max_retries=3, base_delay=1):
-    """Generate content with exponential backoff retry logic"""
-    import time
-    
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            if response.text:  # Check if response has content
-                return response
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            delay = base_delay * (2 ** attempt)
-            logger.warning(f"Generation failed (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s...")
-            time.sleep(delay)
+
+def fallback_answer(topic, message_content, partial=False):
+    """Fast answer when the LLM is unavailable: the most relevant retrieved
+    law text, or only a note if part of the answer was already sent"""
+    record_fallback(partial)
+    language = detect_language(topic)
+    if partial:
+        return FallbackAnswer("\n\n" + CUT_OFF_MESSAGES[language])
+    excerpt = message_content[:FALLBACK_CONTEXT_CHARS]
+    if len(message_content) > FALLBACK_CONTEXT_CHARS:
+        excerpt = excerpt[:excerpt.rfind('\n')] if '\n' in excerpt else excerpt
+        excerpt += "\n..."
+    return FallbackAnswer(f"{FALLBACK_MESSAGES[language]}\n\n{excerpt}")
+
+
+def _generate(prompt, temperature):
+    """Answer text from the shared LLM client, for synchronous callers"""
+    return run_sync(get_llm_client().generate(prompt, temperature))
+
+
+ANSWER_WORDS = re.compile(r'\w+')
+
+
+def answer_similarity(a, b):
+    """Jaccard similarity of the lowercased word sets of two answers"""
+    a, b = set(ANSWER_WORDS.findall(a.lower())), set(ANSWER_WORDS.findall(b.lower()))
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def vote(answers, threshold=SELF_CONSISTENCY_AGREEMENT):
+    """Pick the answer most others agree with, the earliest on ties.
+
+    Returns (index, votes), counting the answer itself as one vote.
+    """
+    votes = [sum(answer_similarity(a, b) >= threshold for b in answers) for a in answers]
+    best = max(range(len(answers)), key=lambda i: (votes[i], -i))
+    return best, votes[best]
+
+
+async def self_consistent_answer_async(prompt, temperatures=TEMPERATURES, deadline=SELF_CONSISTENCY_DEADLINE):
+    """Generate one answer per temperature concurrently and return the agreed one.
+
+    Returns as soon as a majority of the variants agree, cancelling the
+    rest. At the deadline, votes among the answers received so far.
+    Returns None if no variant produced an answer.
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    majority = len(temperatures) // 2 + 1
+    client = get_llm_client()
+    tasks = {asyncio.create_task(client.generate(prompt, temp)): temp for temp in temperatures}
+    pending = set(tasks)
+    answers = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0, end - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"Self-consistency deadline reached with {len(answers)} of {len(tasks)} answers")
+                break
+            for task in done:
+                try:
+                    answer = post_process_answer(task.result())
+                except Exception as e:
+                    logger.error(f"Error at temp {tasks[task]}: {e}")
+                    continue
+                if answer:
+                    answers.append(answer)
+            if answers:
+                best, votes = vote(answers)
+                if votes >= majority:
+                    logger.debug(f"{votes} of {len(tasks)} variants agree, {len(pending)} cancelled")
+                    return answers[best]
+    finally:
+        for task in pending:
+            task.cancel()
     
-    raise Exception("Failed to generate response after all retries")
+    if not answers:
+        return None
+    return answers[vote(answers)[0]]
 
 
 def detect_language(text):
@@ -163,8 +200,13 @@ ANSWER IN {language}:
 ANSWER IN {language}:"""
 
 
-def get_model_response(topic, message_content, history=""):
-    """Generate response with optional self-consistency and retry logic"""
+@timed('generation')
+def get_model_response(topic, message_content, history="", sources=()):
+    """Generate response with optional self-consistency and retry logic.
+
+    sources (see context.pack_context) are stored with the answer in the
+    semantic cache.
+    """
     logger.debug('...get_model_response')
     
     base_temp = TEMPERATURES[0]
@@ -173,38 +215,24 @@ def get_model_response(topic, message_content, history=""):
     language = detect_language(topic)
     logger.info(f"Detected question language: {language}")
     
+    prompt = RAG_PROMPT.format(context=message_content, question=topic, history=history, language=language)
+    record_prompt_tokens(estimate_tokens(prompt))
+    
     if USE_SELF_CONSISTENCY:
-        # Quality mode: multiple temperatures
-        answers = []
-        for temp in TEMPERATURES:
-            model = get_llm(temp)
-            prompt = RAG_PROMPT.format(context=message_content, question=topic, history=history, language=language)
-            
-            try:
-                response = _generate_with_retry(model, prompt)
-                answer = post_process_answer(response.text)
-                answers.append(answer)
-            except Exception as e:
-                logger.error(f"Error at temp {temp}: {e}")
+        # Quality mode: multiple temperatures generated concurrently
+        try:
+            answer = run_sync(self_consistent_answer_async(prompt))
+        except Exception as e:
+            logger.error(f"Error generating self-consistent response: {e}")
+            answer = None
         
-        if len(answers) > 0:
-            answer_counts = Counter(answers)
-            if answer_counts.most_common(1)[0][1] > 1:
-                return answer_counts.most_common(1)[0][0]
-            return answers[0]
+        if answer:
+            cache_answer(topic, answer, message_content, history, sources)
+            return answer
     else:
         # Speed mode: single temperature with validation
-        model = get_llm(base_temp)
-        
-        # Detect question language
-        language = detect_language(topic)
-        logger.info(f"Detected question language: {language}")
-        
-        prompt = RAG_PROMPT.format(context=message_content, question=topic, history=history, language=language)
-        
         try:
-            response = _generate_with_retry(model, prompt)
-            answer = post_process_answer(response.text)
+            answer = post_process_answer(_generate(prompt, base_temp))
             
             # Validate answer
             is_valid, reason = validate_answer(answer, topic, message_content)
@@ -212,63 +240,43 @@ def get_model_response(topic, message_content, history=""):
                 logger.warning(f"Answer validation failed: {reason}, retrying with adjusted prompt")
                 # Retry with enhanced prompt
                 enhanced_prompt = prompt + f"\n\nNote: Please provide a detailed response in {language} with specific article references from the context."
-                response = _generate_with_retry(model, enhanced_prompt)
-                answer = post_process_answer(response.text)
+                answer = post_process_answer(_generate(enhanced_prompt, base_temp))
             
+            cache_answer(topic, answer, message_content, history, sources)
             return answer
+        except LLMUnavailable as e:
+            logger.error(f"LLM unavailable: {e}")
         except Exception as e:
             logger.error(f"Error generating response: {e}")
     
-    return "Sorry, an error occurred while processing your request."
+    return fallback_answer(topic, message_content)
 
 
-def get_model_response_stream(topic, message_content, history=""):
-    """Generate streaming response for Gradio with improved error handling"""
-    logger.debug('...get_model_response_stream')
-    
-    temp = STREAMING_TEMPERATURE
-    model = get_llm(temp)
-    
-    # Detect question language
+async def get_model_response_stream_async(topic, message_content, history=""):
+    """Stream the answer through the shared LLM client.
+
+    Raises LLMUnavailable if the model cannot answer (circuit open, no
+    quota, deadline passed, or the stream broke off); the caller shows
+    fallback_answer instead. Does not touch the semantic cache: embedding
+    the question would block the event loop, so the caller stores the
+    answer (see pipeline.py).
+    """
+    logger.debug('...get_model_response_stream_async')
+
     language = detect_language(topic)
     logger.info(f"Detected question language: {language}")
-    
+
     prompt = RAG_PROMPT.format(context=message_content, question=topic, history=history, language=language)
-    
-    max_retries = 2
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt, stream=True)
-            
-            accumulated_text = ""
-            has_content = False
-            
-            for chunk in response:
-                if chunk.text:
-                    has_content = True
-                    accumulated_text += chunk.text
-                    yield chunk.text
-            
-            if has_content:
-                # Validate accumulated response
-                is_valid, reason = validate_answer(accumulated_text, topic, message_content)
-                if not is_valid:
-                    logger.warning(f"Streamed answer validation failed: {reason}")
-                return  # Success, exit retry loop
-            else:
-                if attempt < max_retries - 1:
-                    logger.warning("No content generated, retrying...")
-                    continue
-                else:
-                    yield "I couldn't generate a response. Please try rephrasing your question."
-                    
-        except Exception as e:
-            logger.error(f"Error getting model response (attempt {attempt + 1}/{max_retries}): {type(e).__name__}: {str(e)}")
-            if attempt < max_retries - 1:
-                logger.info("Retrying...")
-                continue
-            else:
-                yield "Sorry, an error occurred while processing your request. Please try again."
+    record_prompt_tokens(estimate_tokens(prompt))
+    start = time.perf_counter()
+
+    has_content = False
+    async for chunk in get_llm_client().stream(prompt, STREAMING_TEMPERATURE):
+        if not has_content:
+            record_stage('llm_first_token', time.perf_counter() - start)
+            has_content = True
+        yield chunk
+    record_stage('generation', time.perf_counter() - start)
 
 
 def validate_answer(answer, question, context):
@@ -330,3 +338,48 @@ def validate_answer(answer, question, context):
         return False, "Answer lacks proper sentence structure"
     
     return True, "OK"
+
+
+def _semantic_cacheable(topic, history):
+    """Whether answers to this question may come from the semantic cache"""
+    # Answers given inside a conversation depend on it, so only fresh
+    # questions are cached; questions citing an article use the exact lookup
+    return USE_SEMANTIC_CACHE and not history and parse_article_reference(topic) is None
+
+
+def get_cached_result(topic, history=""):
+    """Return the cached answer for the same or a paraphrased question, if any,
+    as a dict with the answer, its context and the context's sources"""
+    if not _semantic_cacheable(topic, history):
+        return None
+    try:
+        from semantic_cache import get_semantic_cache, embed_question, question_numbers
+        entry = get_semantic_cache().lookup(embed_question(topic), detect_language(topic), question_numbers(topic))
+        record_cache('answer', entry is not None)
+        if entry is None:
+            return None
+        return {'answer': entry['answer'], 'context': entry['context'], 'sources': entry['sources']}
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        return None
+
+
+def get_cached_answer(topic, history=""):
+    """Return cached answer for the same or a paraphrased question, if any"""
+    result = get_cached_result(topic, history)
+    return result['answer'] if result else None
+
+
+def cache_answer(topic, answer, message_content, history="", sources=()):
+    """Store a validated answer in the semantic cache with its context and sources"""
+    if not _semantic_cacheable(topic, history):
+        return
+    is_valid, _ = validate_answer(answer, topic, message_content)
+    if not is_valid:
+        return
+    try:
+        from semantic_cache import get_semantic_cache, embed_question, question_numbers
+        get_semantic_cache().add(embed_question(topic), topic, detect_language(topic), answer, question_numbers(topic),
+                                 context=message_content, sources=sources)
+    except Exception as e:
+        logger.warning(f"Semantic cache update failed: {e}")
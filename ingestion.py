@@ -0,0 +1,325 @@
+"""Law file ingestion and incremental knowledge base updates"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import faiss
+import numpy as np
+from loguru import logger
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from chunking import CHUNKER_VERSION, chunk_ids, chunk_law_text
+from chunk_store import store_exists
+from vector_index import delete_chunks
+from config import *
+
+
+def list_law_files():
+    """Map law file names to their paths under LAWS_DIR"""
+    law_files = {}
+    for root, dirs, files in os.walk(LAWS_DIR):
+        for file in files:
+            if file.endswith(".txt"):
+                law_files[file] = os.path.join(root, file)
+    return law_files
+
+
+def file_hash(file_path):
+    """SHA-256 of file contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_law_chunks(file, file_path):
+    """Load one law file and split it into article-aware chunks with metadata"""
+    logger.debug(f'Loading file: {file}')
+    with open(file_path, encoding='utf-8') as f:
+        text = f.read()
+    return chunk_law_text(text, file, file_path)
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load ingestion manifest, or None if the index predates it"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Save ingestion manifest atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def bootstrap_manifest(db):
+    """Create manifest for an index built before manifests existed.
+
+    Assumes the index matches the current law files.
+    """
+    logger.info('No ingestion manifest found, recording current law files')
+    chunk_ids = {}
+    for doc_id in db.index_to_docstore_id.values():
+        source = db.docstore.search(doc_id).metadata.get('source_file', 'unknown')
+        chunk_ids.setdefault(source, []).append(doc_id)
+
+    # Chunker unknown, so every file is re-chunked on the first sync
+    manifest = {'chunker': None, 'files': {}}
+    for file, file_path in list_law_files().items():
+        if file in chunk_ids:
+            manifest['files'][file] = {'hash': file_hash(file_path), 'chunk_ids': chunk_ids[file]}
+    return manifest
+
+
+def plan_sync(manifest):
+    """Compare law files against manifest, returning added, changed and removed file names"""
+    law_files = list_law_files()
+    known = manifest['files']
+    rechunk = manifest.get('chunker') != CHUNKER_VERSION
+    if rechunk:
+        logger.info(f'Chunker changed to {CHUNKER_VERSION}, re-chunking all files')
+        manifest['chunker'] = CHUNKER_VERSION
+    added, changed = [], []
+    for file, file_path in sorted(law_files.items()):
+        if file not in known:
+            added.append(file)
+        elif rechunk or known[file]['hash'] != file_hash(file_path):
+            changed.append(file)
+    removed = sorted(file for file in known if file not in law_files)
+    return added, changed, removed
+
+
+def _split_file_task(file, file_path):
+    """Worker process: read and split one file into picklable (text, metadata) pairs"""
+    chunks = load_law_chunks(file, file_path)
+    return file, file_hash(file_path), [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def _split_files(files):
+    """Yield split files from a process pool, keeping at most two files per worker in flight"""
+    law_files = list_law_files()
+    pending = list(files)
+    with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as executor:
+        in_flight = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < INGEST_WORKERS * 2:
+                file = pending.pop(0)
+                in_flight[executor.submit(_split_file_task, file, law_files[file])] = file
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f'Error loading file {file}: {e}')
+
+
+def new_vectorstore(embeddings, dim):
+    """Empty flat-L2 vector store, like FAISS.from_embeddings creates"""
+    return FAISS(embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore(), {})
+
+
+def add_chunks(db, ids, texts, metadatas, vectors):
+    """Append embedded chunks to a vector store under their content-addressed IDs"""
+    db.index.add(np.asarray(vectors, dtype=np.float32))
+    db.docstore.add({
+        chunk_id: Document(id=str(chunk_id), page_content=text, metadata=metadata)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    start = len(db.index_to_docstore_id)
+    db.index_to_docstore_id.update((start + i, chunk_id) for i, chunk_id in enumerate(ids))
+
+
+def assign_content_ids(db, manifest):
+    """Replace the random chunk IDs of an index built by an older version.
+
+    IDs are recomputed from the stored chunk text in document order, as
+    ingestion would assign them, so nothing is re-embedded.
+    """
+    files = {}
+    for position, old_id in sorted(db.index_to_docstore_id.items()):
+        doc = db.docstore.search(old_id)
+        files.setdefault(doc.metadata.get('source_file', 'unknown'), []).append((doc.metadata.get('start_index', 0), position, old_id, doc))
+
+    new_ids, docs = {}, {}
+    for file, entries in files.items():
+        entries.sort(key=lambda entry: entry[:2])
+        for (_, _, old_id, doc), chunk_id in zip(entries, chunk_ids(file, [entry[3].page_content for entry in entries])):
+            new_ids[old_id] = chunk_id
+            docs[chunk_id] = Document(id=str(chunk_id), page_content=doc.page_content, metadata=doc.metadata)
+
+    db.index_to_docstore_id = {position: new_ids[old_id] for position, old_id in db.index_to_docstore_id.items()}
+    db.docstore = InMemoryDocstore(docs)
+    for entry in manifest['files'].values():
+        entry['chunk_ids'] = [new_ids[old_id] for old_id in entry['chunk_ids'] if old_id in new_ids]
+    logger.info(f'Assigned content-addressed IDs to {len(docs)} chunks')
+
+
+def _embed_files(embeddings, files):
+    """Split and embed files, yielding (file, content hash, chunk IDs, texts, metadatas, vectors) per file.
+
+    Chunks are embedded in batches of EMBED_BATCH_SIZE.
+    """
+    for file, content_hash, chunks in _split_files(files):
+        texts = [text for text, _ in chunks]
+        metadatas = [metadata for _, metadata in chunks]
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+        yield file, content_hash, chunk_ids(file, texts), texts, metadatas, vectors
+
+
+def _ingest_files(db, embeddings, manifest, files):
+    """Embed files and append them to the vector store, recording them in the manifest"""
+    for file, content_hash, ids, texts, metadatas, vectors in _embed_files(embeddings, files):
+        if vectors:
+            if db is None:
+                db = new_vectorstore(embeddings, len(vectors[0]))
+            add_chunks(db, ids, texts, metadatas, vectors)
+        manifest['files'][file] = {'hash': content_hash, 'chunk_ids': ids}
+        logger.info(f'Indexed {file}: {len(ids)} chunks')
+    return db
+
+
+class BuildCheckpoint:
+    """Append-only SQLite record of a build in progress.
+
+    Each indexed file is written in one transaction with its chunks and
+    vectors, so a checkpoint costs as much as the file, never records a
+    partially indexed file, and the build holds no vector store until the
+    chunks are merged at the end.
+    """
+
+    FILE = 'checkpoint.sqlite'
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, self.FILE))
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, hash TEXT NOT NULL, chunk_ids TEXT NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS chunks (seq INTEGER PRIMARY KEY AUTOINCREMENT, file TEXT NOT NULL, '
+                                    'id INTEGER NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)')
+
+    def manifest(self):
+        """Manifest of the files indexed so far"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'chunker'").fetchone()
+        files = {
+            file: {'hash': content_hash, 'chunk_ids': json.loads(ids)}
+            for file, content_hash, ids in self.connection.execute('SELECT file, hash, chunk_ids FROM files')
+        }
+        return {'chunker': row[0] if row else CHUNKER_VERSION, 'files': files}
+
+    def set_chunker(self, version):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('chunker', ?)", (version,))
+
+    def add_file(self, file, content_hash, ids, texts, metadatas, vectors):
+        """Record one indexed file with its chunks"""
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO chunks (file, id, text, metadata, vector) VALUES (?, ?, ?, ?, ?)',
+                ((file, chunk_id, text, json.dumps(metadata, ensure_ascii=False), np.asarray(vector, dtype=np.float32).tobytes())
+                 for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, vectors)),
+            )
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (file, content_hash, json.dumps(ids)))
+
+    def remove_files(self, files):
+        """Forget files, e.g. ones edited since they were indexed"""
+        with self.connection:
+            for file in files:
+                self.connection.execute('DELETE FROM chunks WHERE file = ?', (file,))
+                self.connection.execute('DELETE FROM files WHERE file = ?', (file,))
+
+    def to_vectorstore(self, embeddings):
+        """Flat vector store of all recorded chunks in the order they were added, or None if there are none"""
+        db = None
+        rows = self.connection.execute('SELECT id, text, metadata, vector FROM chunks ORDER BY seq')
+        while batch := rows.fetchmany(EMBED_BATCH_SIZE * 16):
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, _, _, vector in batch])
+            if db is None:
+                db = new_vectorstore(embeddings, vectors.shape[1])
+            add_chunks(db, [chunk_id for chunk_id, _, _, _ in batch], [text for _, text, _, _ in batch],
+                       [json.loads(metadata) for _, _, metadata, _ in batch], vectors)
+        return db
+
+    def close(self):
+        self.connection.close()
+
+
+def build_vectorstore(embeddings):
+    """Build vector store from all law files, returning it with its manifest.
+
+    Every indexed file is appended to a checkpoint under
+    BUILD_CHECKPOINT_PATH, and an interrupted build resumes from there.
+    """
+    logger.debug('Creating new knowledge base from .txt files')
+    if store_exists(BUILD_CHECKPOINT_PATH):
+        # Whole-store checkpoints of older versions are not resumed
+        logger.info('Discarding checkpoint in an older format')
+        discard_build_checkpoint()
+
+    checkpoint = BuildCheckpoint(BUILD_CHECKPOINT_PATH)
+    try:
+        manifest = checkpoint.manifest()
+        if manifest['files']:
+            logger.info(f'Resuming build, {len(manifest["files"])} files already indexed')
+            # Files edited since the checkpoint are replaced like in a regular sync
+            added, changed, removed = plan_sync(manifest)
+            checkpoint.remove_files(changed + removed)
+            for file in changed + removed:
+                del manifest['files'][file]
+        else:
+            added, changed = sorted(list_law_files()), []
+        checkpoint.set_chunker(manifest['chunker'])
+
+        for file, content_hash, ids, texts, metadatas, vectors in _embed_files(embeddings, added + changed):
+            checkpoint.add_file(file, content_hash, ids, texts, metadatas, vectors)
+            manifest['files'][file] = {'hash': content_hash, 'chunk_ids': ids}
+            logger.info(f'Indexed {file}: {len(ids)} chunks')
+
+        db = checkpoint.to_vectorstore(embeddings)
+    finally:
+        checkpoint.close()
+    if db is None:
+        raise ValueError(f'No law files could be loaded from {LAWS_DIR}')
+
+    logger.info(f'Files loaded: {len(manifest["files"])}')
+    logger.info(f'Files: {list(manifest["files"])}')
+    logger.info(f'Chunks created: {len(db.index_to_docstore_id)}')
+    return db, manifest
+
+
+def discard_build_checkpoint():
+    """Remove checkpoint of a finished build"""
+    shutil.rmtree(BUILD_CHECKPOINT_PATH, ignore_errors=True)
+
+
+def sync_vectorstore(db, manifest, plan=None):
+    """Re-embed only added or changed law files and drop removed ones.
+
+    plan is the result of plan_sync(manifest) if already computed.
+    Returns True if the vector store was modified.
+    """
+    added, changed, removed = plan or plan_sync(manifest)
+    if not (added or changed or removed):
+        logger.debug('Knowledge base is up to date')
+        return False
+    logger.info(f'Updating knowledge base: added {added}, changed {changed}, removed {removed}')
+
+    stale_ids = [doc_id for file in changed + removed for doc_id in manifest['files'][file]['chunk_ids']]
+    if stale_ids:
+        delete_chunks(db, stale_ids)
+    for file in changed + removed:
+        del manifest['files'][file]
+
+    _ingest_files(db, db.embedding_function, manifest, added + changed)
+    return True
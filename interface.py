@@ -2,8 +2,8 @@
 import gradio as gr
 from loguru import logger
 from database import get_index_db
-from retrieval import get_message_content
-from generation import get_model_response_stream
+from metrics import record_stage
+from pipeline import Overloaded, answer_stream, cached_answer_async, retrieve_stream
 from config import *
 import random
 import time
@@ -27,6 +27,15 @@ FUNNY_MESSAGES = [
     "🚪 Knocking on Supreme Court doors...",
 ]
 
+# Status shown while a retrieval stage runs
+STAGE_MESSAGES = {
+    'article_lookup': "📖 Looking up the cited article...",
+    'vector_search': "🔍 Searching the codes...",
+    'keyword_search': "📚 Matching legal terms...",
+    'rerank': "⚖️ Picking the most relevant articles...",
+    'generate': "✍️ Drafting the answer...",
+}
+
 
 def initialize_db():
     """Initialize database on application startup"""
@@ -58,12 +67,14 @@ def truncate_at_sentence(text, max_length=200):
     return truncated + '...'
 
 
-def process_question(question, history):
+async def process_question(question, history):
     """Process questions in Gradio interface"""
     if not question.strip():
         history.append({"role": "assistant", "content": "❌ Please enter a question"})
-        return history
+        yield history
+        return
     
+    start = time.perf_counter()
     try:
         history.append({"role": "user", "content": question})
         
@@ -85,38 +96,45 @@ def process_question(question, history):
         history.append({"role": "assistant", "content": random.choice(FUNNY_MESSAGES)})
         yield history
         
-        # Start retrieval and generation in background
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            db = initialize_db()
-            
-            # Retrieval phase
-            future = executor.submit(get_message_content, question, db, RETRIEVAL_K)
-            while not future.done():
-                time.sleep(1)
-                history[-1]["content"] = random.choice(FUNNY_MESSAGES)
+        # Reuse answer to the same or a paraphrased question
+        db = initialize_db()
+        cached = await cached_answer_async(question, conv_history)
+        if cached:
+            history[-1]["content"] = cached['answer']
+            record_stage('request_first_token', time.perf_counter() - start)
+            yield history
+            return
+        
+        # Retrieval runs off the event loop; status follows its stage events
+        async for kind, value in retrieve_stream(question, db, RETRIEVAL_K):
+            if kind == 'stage':
+                history[-1]["content"] = STAGE_MESSAGES.get(value, history[-1]["content"])
                 yield history
-            message_content, is_cached = future.result()
-            
-            # Keep rotating during generation startup (skip if cached)
-            if not is_cached:
-                for _ in range(4):
-                    time.sleep(3)
-                    history[-1]["content"] = random.choice(FUNNY_MESSAGES)
-                    yield history
+            else:
+                message_content, sources, is_cached = value
+        
+        history[-1]["content"] = STAGE_MESSAGES['generate']
+        yield history
         
         # Start answer streaming
         answer = ""
-        for chunk in get_model_response_stream(question, message_content, conv_history):
+        async for chunk in answer_stream(question, message_content, conv_history, sources):
+            if not answer:
+                record_stage('request_first_token', time.perf_counter() - start)
             answer += chunk
             history[-1]["content"] = answer
             yield history
         
+    except Overloaded:
+        history[-1]["content"] = "⏳ The service is busy right now. Please try again in a moment."
+        yield history
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         error_msg = "❌ An error occurred while processing your request. Please try rephrasing your question."
         history[-1]["content"] = error_msg
         yield history
+    finally:
+        record_stage('request', time.perf_counter() - start)
 
 
 def create_gradio_interface():
@@ -165,8 +183,8 @@ def create_gradio_interface():
         def clear_chat():
             return []
         
-        def submit_and_clear(message, history):
-            for updated_history in process_question(message, history):
+        async def submit_and_clear(message, history):
+            async for updated_history in process_question(message, history):
                 yield updated_history, ""
         
         submit_btn.click(
@@ -186,4 +204,6 @@ def create_gradio_interface():
             outputs=[chatbot]
         )
     
+    # Bound concurrent handlers and the queue behind them
+    interface.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT, max_size=GRADIO_QUEUE_SIZE)
     return interface
@@ -0,0 +1,336 @@
+"""Shared LLM client: model pool, rate limiting, circuit breaking and async retries.
+
+All Gemini calls go through one LLMClient. A token bucket keeps requests
+within the API quota, a circuit breaker fails fast while Gemini keeps
+failing, and retries back off with asyncio.sleep inside a per-request
+deadline, so a slow upstream never ties up threads. When a request cannot
+be served it raises LLMUnavailable and the caller answers with a fallback.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import Counter
+from dotenv import load_dotenv
+from google.api_core import exceptions as api_exceptions
+import google.generativeai as genai
+from loguru import logger
+from metrics import record_stage
+from config import *
+
+load_dotenv()
+
+# Gemini, or the local stand-in used for load tests
+llm_backend = os.getenv('LLM_BACKEND') or LLM_BACKEND
+api_key = os.getenv('GEMINI_API_KEY') or GEMINI_API_KEY
+if llm_backend == 'fake':
+    logger.warning("LLM_BACKEND is 'fake': answers are canned, not generated by Gemini")
+elif not api_key:
+    logger.warning("GEMINI_API_KEY not found in .env file or config.py. Please set it.")
+else:
+    genai.configure(api_key=api_key)
+
+# Safety settings to allow legal content
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+
+class LLMUnavailable(Exception):
+    """The LLM could not answer in time; the caller should fall back"""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Calls are short-circuited after repeated upstream failures"""
+
+
+class RateLimited(LLMUnavailable):
+    """No request quota within the time the caller can wait"""
+
+
+class EmptyResponse(Exception):
+    """The model returned no text, or its answer was blocked"""
+
+
+def response_text(response):
+    """Text of a response or stream chunk, raising EmptyResponse if it was blocked"""
+    try:
+        return response.text
+    except ValueError as e:
+        # Gemini raises ValueError for answers blocked by safety filters or
+        # stopped for another finish_reason without text
+        raise EmptyResponse(f'Answer was blocked: {e}') from e
+
+
+def create_model(temperature):
+    """A model configured with the generation settings and temperature"""
+    if llm_backend == 'fake':
+        from fake_llm import FakeGenerativeModel
+        return FakeGenerativeModel(temperature)
+    return genai.GenerativeModel(
+        model_name=GEMINI_MODEL_NAME,
+        generation_config={
+            'temperature': temperature,
+            'max_output_tokens': MAX_OUTPUT_TOKENS,
+            'top_p': TOP_P,
+            'top_k': TOP_K,
+        },
+        safety_settings=SAFETY_SETTINGS,
+    )
+
+
+class ModelPool:
+    """One configured model per event loop and temperature, created on first use and kept.
+
+    A model's async client is bound to the loop it first ran on, so models
+    are not shared between loops.
+    """
+
+    def __init__(self):
+        self._models = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, temperature):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            models = self._models.setdefault(loop, {})
+            model = models.get(temperature)
+            if model is None:
+                model = models[temperature] = create_model(temperature)
+        return model
+
+
+class TokenBucket:
+    """Request quota: rate tokens per second, up to capacity saved for bursts"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token, returning seconds to wait until it is due, or None
+        (taking nothing) if that is longer than max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def available(self):
+        with self._lock:
+            return round(min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate), 2)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and rejects calls
+    for reset_timeout seconds, then lets one trial call through"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.reset_timeout else 'half_open'
+
+    def allow(self):
+        """True if a call may go upstream now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # One trial at a time; a trial that never reported back expires
+            if self._trial_at is not None and now - self._trial_at < self.reset_timeout:
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info('LLM circuit closed')
+            self.failures = 0
+            self.opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_at is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.warning(f'LLM circuit open for {self.reset_timeout}s after {self.failures} consecutive failures')
+                self.opened_at = time.monotonic()
+                self._trial_at = None
+
+
+def is_retryable(error):
+    """Upstream and transient errors; bad requests, auth errors and empty
+    or blocked answers are not retried"""
+    if isinstance(error, EmptyResponse):
+        return False
+    if isinstance(error, api_exceptions.TooManyRequests):
+        return True
+    return not isinstance(error, api_exceptions.ClientError)
+
+
+class LLMClient:
+    """Rate-limited, circuit-broken access to the model pool"""
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, burst=LLM_BURST, max_retries=MAX_GENERATION_RETRIES):
+        self.pool = ModelPool()
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.breaker = CircuitBreaker()
+        self.max_retries = max_retries
+        self.counts = Counter()
+        self._counts_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    async def _admit(self, deadline):
+        """Wait for the circuit and the quota, or raise LLMUnavailable"""
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpen('LLM circuit is open')
+        remaining = deadline - asyncio.get_running_loop().time()
+        wait = self.bucket.reserve(min(LLM_MAX_RATE_WAIT, remaining))
+        if wait is None:
+            self._count('rate_limited')
+            raise RateLimited('LLM request quota exhausted')
+        if wait:
+            record_stage('llm_rate_wait', wait)
+            await asyncio.sleep(wait)
+        self._count('calls')
+
+    async def _after_failure(self, error, attempt, deadline):
+        """Record a failed attempt and back off, or raise LLMUnavailable if it should not be retried.
+
+        Only retryable errors count towards opening the circuit: a bad
+        request or a blocked answer says nothing about Gemini's health.
+        """
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        if not retryable or attempt == self.max_retries - 1:
+            self._count('failed')
+            raise LLMUnavailable(f'LLM call failed: {type(error).__name__}: {error}') from error
+        delay = LLM_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if asyncio.get_running_loop().time() + delay >= deadline:
+            self._count('failed')
+            raise LLMUnavailable(f'LLM deadline reached after {attempt + 1} attempts') from error
+        logger.warning(f"Generation failed (attempt {attempt + 1}/{self.max_retries}): {error}. Retrying in {delay:.1f}s...")
+        self._count('retries')
+        await asyncio.sleep(delay)
+
+    async def generate(self, prompt, temperature=STREAMING_TEMPERATURE, timeout=LLM_DEADLINE_SECONDS):
+        """Complete answer text"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        model = self.pool.get(temperature)
+        for attempt in range(self.max_retries):
+            await self._admit(deadline)
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(prompt), max(0, deadline - loop.time()))
+                text = response_text(response)
+                if not text:
+                    raise EmptyResponse('No content generated')
+            except Exception as e:
+                await self._after_failure(e, attempt, deadline)
+                continue
+            self.breaker.record_success()
+            return text
+
+    async def stream(self, prompt, temperature=STREAMING_TEMPERATURE, timeout=LLM_DEADLINE_SECONDS):
+        """Yield answer text as it arrives.
+
+        Attempts that fail before the first token are retried; a stream
+        breaking off after output raises LLMUnavailable, since retrying
+        would repeat what the caller already has.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        model = self.pool.get(temperature)
+        for attempt in range(self.max_retries):
+            await self._admit(deadline)
+            first_token_deadline = min(deadline, loop.time() + LLM_FIRST_TOKEN_TIMEOUT)
+            has_content = False
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True),
+                                                  max(0, first_token_deadline - loop.time()))
+                chunks = response.__aiter__()
+                while True:
+                    limit = deadline if has_content else first_token_deadline
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(0, limit - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    text = response_text(chunk)
+                    if text:
+                        has_content = True
+                        yield text
+                if not has_content:
+                    raise EmptyResponse('No content generated')
+            except Exception as e:
+                if has_content:
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    self._count('failed')
+                    raise LLMUnavailable(f'LLM stream broke off: {type(e).__name__}: {e}') from e
+                await self._after_failure(e, attempt, deadline)
+                continue
+            self.breaker.record_success()
+            return
+
+    def stats(self):
+        """Circuit state, available quota and call outcome counts"""
+        with self._counts_lock:
+            counts = {key: self.counts[key] for key in ('calls', 'retries', 'failed', 'short_circuited', 'rate_limited')}
+        return {'circuit': self.breaker.state, 'quota_available': self.bucket.available(), **counts}
+
+
+_llm_client = None
+_client_lock = threading.Lock()
+_sync_loop = None
+
+def get_llm_client():
+    """Get the shared LLM client"""
+    global _llm_client
+    if _llm_client is None:
+        with _client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
+
+
+def run_sync(coro):
+    """Run a coroutine from synchronous code and return its result.
+
+    All synchronous callers share one event loop on a background thread,
+    so pooled models keep the loop their async client is bound to.
+    """
+    global _sync_loop
+    with _client_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name='llm-sync-loop', daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
@@ -0,0 +1,203 @@
+"""End-to-end load test of the HTTP API.
+
+Replays a mix of questions against /answer/stream with a fixed number of
+concurrent clients and reports throughput, time to first token and tail
+latency. Without --url the API is started in this process with the fake
+LLM (fake_llm.py), so no Gemini quota is used:
+
+    python loadtest.py --requests 500 --concurrency 32 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import aiohttp
+import numpy as np
+from loguru import logger
+from config import *
+
+
+def load_questions(path=GOLDEN_QUESTIONS_PATH):
+    """Questions from a golden set (.json) or a text file with one per line"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return [question['question'] for question in json.load(f)['questions']]
+        return [line.strip() for line in f if line.strip()]
+
+
+def build_mix(questions, requests, repeat_share=0.3, seed=0):
+    """Request sequence cycling through questions, with a share of repeats
+    of earlier ones (as when many users ask about the same thing)"""
+    rng = random.Random(seed)
+    fresh = list(questions)
+    rng.shuffle(fresh)
+    mix = []
+    for i in range(requests):
+        if mix and rng.random() < repeat_share:
+            mix.append(rng.choice(mix))
+        else:
+            mix.append(fresh[i % len(fresh)])
+    return mix
+
+
+async def ask(session, url, question):
+    """Stream one answer, returning its outcome ('ok', 'fallback', 'busy' or 'error') and timings"""
+    start = time.perf_counter()
+    result = {'status': 'ok', 'ttft': None, 'latency': None, 'cached': False}
+    try:
+        async with session.post(f'{url}/answer/stream', json={'question': question}) as response:
+            if response.status == 503:
+                result['status'] = 'busy'
+                return result
+            if response.status != 200:
+                result['status'] = 'error'
+                return result
+            event = None
+            done = False
+            async for line in response.content:
+                line = line.decode().strip()
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: '):
+                    data = json.loads(line[len('data: '):])
+                    if event == 'token' and result['ttft'] is None:
+                        result['ttft'] = time.perf_counter() - start
+                    elif event == 'done':
+                        done = True
+                        result['cached'] = data.get('cached', False)
+                        if data.get('fallback'):
+                            result['status'] = 'fallback'
+                    elif event == 'error':
+                        result['status'] = 'error'
+            if not done:
+                # The stream ended without finishing the answer
+                result['status'] = 'error'
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f'Request failed: {e}')
+        result['status'] = 'error'
+    result['latency'] = time.perf_counter() - start
+    return result
+
+
+def _percentiles(seconds):
+    if not seconds:
+        return None
+    p50, p95, p99 = np.percentile(np.array(seconds) * 1000, [50, 95, 99])
+    return {'p50': round(float(p50), 1), 'p95': round(float(p95), 1), 'p99': round(float(p99), 1)}
+
+
+async def run_load(url, mix, concurrency):
+    """Send the mix with `concurrency` clients, each starting its next request when the last ends"""
+    pending = asyncio.Queue()
+    for question in mix:
+        pending.put_nowait(question)
+    results = []
+
+    async def client(session):
+        while not pending.empty():
+            results.append(await ask(session, url, pending.get_nowait()))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        try:
+            async with session.get(f'{url}/stats') as response:
+                server = await response.json()
+        except (aiohttp.ClientError, ValueError):
+            server = None
+
+    ok = [result for result in results if result['status'] == 'ok']
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'ok': len(ok),
+        'fallback': sum(result['status'] == 'fallback' for result in results),
+        'busy': sum(result['status'] == 'busy' for result in results),
+        'errors': sum(result['status'] == 'error' for result in results),
+        'success_rate': round(len(ok) / len(results), 4) if results else 0.0,
+        'cached': sum(result['cached'] for result in ok),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'ttft_ms': _percentiles([result['ttft'] for result in ok if result['ttft'] is not None]),
+        'latency_ms': _percentiles([result['latency'] for result in ok]),
+        'server': server,
+    }
+
+
+async def start_local_server():
+    """Start the API in this process with the fake LLM and a throwaway answer cache"""
+    from aiohttp import web
+    from aiohttp.test_utils import unused_port
+    import api
+    import semantic_cache
+    # Canned answers must not end up in the persistent answer cache
+    semantic_cache._semantic_cache = semantic_cache.SemanticCache(
+        tempfile.mkdtemp(prefix='loadtest_cache_'), SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    port = unused_port()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner, f'http://127.0.0.1:{port}'
+
+
+async def run(args):
+    mix = build_mix(load_questions(args.questions), args.requests, args.repeat_share, args.seed)
+    runner = None
+    url = args.url
+    if url is None:
+        import fake_llm
+        fake_llm.configure(**{key: value for key, value in {
+            'first_token_ms': args.first_token_ms, 'token_ms': args.token_ms,
+            'error_rate': args.error_rate, 'stream_error_rate': args.stream_error_rate,
+        }.items() if value is not None})
+        runner, url = await start_local_server()
+    try:
+        return await run_load(url.rstrip('/'), mix, args.concurrency)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+
+def main():
+    """Run the load test from the command line"""
+    parser = argparse.ArgumentParser(description='Load test the question answering API')
+    parser.add_argument('--url', help='API to test, e.g. http://127.0.0.1:8000 (default: start one with the fake LLM)')
+    parser.add_argument('--questions', default=GOLDEN_QUESTIONS_PATH, help='Golden set (.json) or text file, one question per line')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--repeat-share', type=float, default=0.3, help='Share of requests repeating an earlier question')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--first-token-ms', type=float, help='Fake LLM delay before the first token')
+    parser.add_argument('--token-ms', type=float, help='Fake LLM delay between tokens')
+    parser.add_argument('--error-rate', type=float, help='Share of fake LLM calls failing up front')
+    parser.add_argument('--stream-error-rate', type=float, help='Share of fake LLM streams breaking off midway')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    if args.url is None:
+        # Must be set before llm_client.py is imported
+        os.environ['LLM_BACKEND'] = 'fake'
+    report = asyncio.run(run(args))
+
+    print(f"{report['requests']} requests at concurrency {report['concurrency']} in {report['elapsed_s']}s: "
+          f"{report['ok']} ok ({report['cached']} cached), {report['fallback']} fallback answers, "
+          f"{report['busy']} busy, {report['errors']} errors")
+    print(f"Success rate: {report['success_rate']:.1%} (fallbacks count as failures; latencies are of ok answers only)")
+    print(f"Throughput: {report['throughput_rps']} answers/s")
+    for name in ('ttft_ms', 'latency_ms'):
+        if report[name]:
+            print(f"{name[:-3]:<8} p50 {report[name]['p50']:>8.1f} ms   p95 {report[name]['p95']:>8.1f} ms   p99 {report[name]['p99']:>8.1f} ms")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
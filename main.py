@@ -2,6 +2,8 @@
 from loguru import logger
 from interface import create_gradio_interface
 from console import interactive_chat, single_question
+from database import sync_index_db
+from api import serve
 from config import *
 
 logger.add(LOG_PATH, format="{time} {level} {message}", level="DEBUG", rotation="100 KB", compression="zip")
@@ -14,8 +16,10 @@ def main():
     print("1 - Gradio Web Interface")
     print("2 - Interactive Console Chat")
     print("3 - Single Question in Console")
+    print("4 - Update Knowledge Base from laws/")
+    print("5 - HTTP API Server")
     
-    mode = input("Enter mode number (1-3): ").strip()
+    mode = input("Enter mode number (1-5): ").strip()
     
     if mode == "1" or mode == "":
         interface = create_gradio_interface()
@@ -33,6 +37,12 @@ def main():
         )
     elif mode == "2":
         interactive_chat()
+    elif mode == "4":
+        sync_index_db()
+        print("✅ Knowledge base is up to date")
+    elif mode == "5":
+        print(f"🔌 API available at: http://{API_HOST}:{API_PORT} (/retrieve, /answer, /answer/stream)")
+        serve()
     else:
         single_question()
 
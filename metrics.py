@@ -0,0 +1,167 @@
+"""Latency histograms and cache counters for the request path, with Prometheus export"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+import numpy as np
+from config import *
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 8000)
+
+HELP = {
+    'rag_stage_seconds': 'Time spent in each stage of answering a question',
+    'rag_prompt_tokens': 'Estimated size of prompts sent to the LLM',
+    'rag_cache_requests_total': 'Cache lookups by cache and result',
+    'rag_fallback_answers_total': 'Answers replaced by retrieved law text (context) or cut off midway (partial) because the LLM was unavailable',
+}
+
+
+class Histogram:
+    """Cumulative bucket counts for Prometheus and a window of recent
+    samples for exact percentiles"""
+
+    def __init__(self, buckets, window=METRICS_WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self._samples.append(value)
+
+    def summary(self, scale=1.0):
+        """Count, mean and p50/p95/p99 of the recent samples, multiplied by scale"""
+        with self._lock:
+            samples = np.array(self._samples or [0.0]) * scale
+            count = self.count
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {'count': count, 'mean': round(float(samples.mean()), 3),
+                'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3)}
+
+
+_stages = {}
+_prompt_tokens = Histogram(TOKEN_BUCKETS)
+_cache_counts = Counter()
+_fallback_counts = Counter()
+_lock = threading.Lock()
+
+
+def record_stage(stage, seconds):
+    """Record how long a stage took"""
+    histogram = _stages.get(stage)
+    if histogram is None:
+        with _lock:
+            histogram = _stages.setdefault(stage, Histogram(LATENCY_BUCKETS))
+    histogram.observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time the enclosed block as stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """Decorator recording each call of a function as stage"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_prompt_tokens(tokens):
+    """Record the estimated size of a prompt"""
+    _prompt_tokens.observe(tokens)
+
+
+def record_cache(cache, hit):
+    """Count a hit or miss of the named cache"""
+    with _lock:
+        _cache_counts[(cache, 'hit' if hit else 'miss')] += 1
+
+
+def record_fallback(partial):
+    """Count an answer the LLM could not give, or could not finish"""
+    with _lock:
+        _fallback_counts['partial' if partial else 'context'] += 1
+
+
+def reset():
+    """Forget all recorded metrics"""
+    global _prompt_tokens
+    with _lock:
+        _stages.clear()
+        _cache_counts.clear()
+        _fallback_counts.clear()
+        _prompt_tokens = Histogram(TOKEN_BUCKETS)
+
+
+def snapshot():
+    """Stage latencies in ms, prompt sizes, cache hit rates and fallback counts as a dict"""
+    with _lock:
+        stages = dict(_stages)
+        counts = dict(_cache_counts)
+        fallbacks = {kind: _fallback_counts[kind] for kind in ('context', 'partial')}
+    caches = {}
+    for (cache, result), count in sorted(counts.items()):
+        caches.setdefault(cache, {'hit': 0, 'miss': 0})[result] = count
+    for stats in caches.values():
+        stats['hit_rate'] = round(stats['hit'] / (stats['hit'] + stats['miss']), 3)
+    return {
+        'stages_ms': {stage: histogram.summary(1000) for stage, histogram in sorted(stages.items())},
+        'prompt_tokens': _prompt_tokens.summary(),
+        'caches': caches,
+        'fallbacks': fallbacks,
+    }
+
+
+def _format_histogram(name, histogram, labels=''):
+    lines = []
+    cumulative = 0
+    with histogram._lock:
+        bucket_counts = list(histogram.bucket_counts)
+        count, total = histogram.count, histogram.sum
+    separator = ',' if labels else ''
+    for bound, bucket_count in zip(list(histogram.buckets) + ['+Inf'], bucket_counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {total}')
+    lines.append(f'{name}_count{suffix} {count}')
+    return lines
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        stages = dict(_stages)
+        counts = dict(_cache_counts)
+        fallbacks = {kind: _fallback_counts[kind] for kind in ('context', 'partial')}
+    lines = [f"# HELP rag_stage_seconds {HELP['rag_stage_seconds']}", '# TYPE rag_stage_seconds histogram']
+    for stage, histogram in sorted(stages.items()):
+        lines.extend(_format_histogram('rag_stage_seconds', histogram, f'stage="{stage}"'))
+    lines += [f"# HELP rag_prompt_tokens {HELP['rag_prompt_tokens']}", '# TYPE rag_prompt_tokens histogram']
+    lines.extend(_format_histogram('rag_prompt_tokens', _prompt_tokens))
+    lines += [f"# HELP rag_cache_requests_total {HELP['rag_cache_requests_total']}", '# TYPE rag_cache_requests_total counter']
+    for (cache, result), count in sorted(counts.items()):
+        lines.append(f'rag_cache_requests_total{{cache="{cache}",result="{result}"}} {count}')
+    lines += [f"# HELP rag_fallback_answers_total {HELP['rag_fallback_answers_total']}", '# TYPE rag_fallback_answers_total counter']
+    for kind, count in fallbacks.items():
+        lines.append(f'rag_fallback_answers_total{{kind="{kind}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,273 @@
+"""ONNX Runtime int8 inference for the embedding model and the reranker.
+
+Models are exported and dynamically quantized once, cached under
+ONNX_MODEL_DIR and checked against the float models before use. Run
+`python onnx_backend.py` to export and compare latency.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from loguru import logger
+from config import *
+
+EMBEDDER_DIR = os.path.join(ONNX_MODEL_DIR, 'embedder')
+RERANKER_DIR = os.path.join(ONNX_MODEL_DIR, 'reranker')
+EMBEDDER_FILE = f'onnx/model_qint8_{ONNX_QUANTIZATION}.onnx'
+RERANKER_FILE = 'model_quantized.onnx'
+REPORT_FILE = 'tolerance.json'
+
+# Questions used to compare quantized and float models
+SAMPLE_QUESTIONS = [
+    'Какое наказание предусмотрено за кражу?',
+    'Срок исковой давности по гражданским делам',
+    'Какие права есть у работника при увольнении?',
+    'Кто может быть опекуном ребенка?',
+    'What rights does a consumer have when purchasing goods?',
+    'What documents are needed to register an LLC?',
+    'Эмгек келишимин бузуу үчүн кандай жоопкерчилик бар?',
+    'Жер участогун ижарага алуу тартиби кандай?',
+]
+
+
+def sample_passages(limit=64):
+    """Chunks from the first law files, for tolerance checks and benchmarks"""
+    from ingestion import list_law_files, load_law_chunks
+    passages = []
+    for file, file_path in sorted(list_law_files().items()):
+        chunks = load_law_chunks(file, file_path)
+        step = max(1, len(chunks) // 16)
+        passages.extend(chunk.page_content for chunk in chunks[::step][:16])
+        if len(passages) >= limit:
+            break
+    return passages[:limit]
+
+
+def export_embedder():
+    """Export EMBEDDING_MODEL to ONNX with dynamic int8 quantization"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    logger.info(f'Exporting {EMBEDDING_MODEL} to ONNX ({ONNX_QUANTIZATION} int8)')
+    model = SentenceTransformer(EMBEDDING_MODEL, backend='onnx', device='cpu')
+    model.save(EMBEDDER_DIR)
+    export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, EMBEDDER_DIR)
+
+
+def export_reranker():
+    """Export RERANKER_MODEL to ONNX with dynamic int8 quantization"""
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    logger.info(f'Exporting {RERANKER_MODEL} to ONNX ({ONNX_QUANTIZATION} int8)')
+    model = ORTModelForSequenceClassification.from_pretrained(RERANKER_MODEL, export=True)
+    model.save_pretrained(RERANKER_DIR)
+    AutoTokenizer.from_pretrained(RERANKER_MODEL).save_pretrained(RERANKER_DIR)
+    quantization_config = getattr(AutoQuantizationConfig, ONNX_QUANTIZATION)(is_static=False, per_channel=False)
+    ORTQuantizer.from_pretrained(model).quantize(save_dir=RERANKER_DIR, quantization_config=quantization_config)
+
+
+def load_onnx_embeddings():
+    """LangChain embeddings backed by the quantized ONNX model"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDER_DIR,
+        model_kwargs={'device': 'cpu', 'backend': 'onnx', 'model_kwargs': {'file_name': EMBEDDER_FILE}},
+    )
+
+
+class OnnxCrossEncoder:
+    """Quantized cross-encoder with the predict() interface of sentence-transformers' CrossEncoder"""
+
+    def __init__(self, path=RERANKER_DIR, file_name=RERANKER_FILE, max_length=512):
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        from transformers import AutoTokenizer
+        self.model = ORTModelForSequenceClassification.from_pretrained(path, file_name=file_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_length = max_length
+        # Same default as CrossEncoder: sigmoid for single-label models unless the config says otherwise
+        activation = getattr(self.model.config, 'sbert_ce_default_activation_function', None) or ''
+        self.sigmoid = self.model.config.num_labels == 1 and not activation.endswith('Identity')
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            features = self.tokenizer(
+                [query for query, _ in batch], [passage for _, passage in batch],
+                padding=True, truncation='longest_first', max_length=self.max_length, return_tensors='np',
+            )
+            logits = self.model(**features).logits
+            logits = logits[:, 0] if logits.shape[1] == 1 else logits
+            scores.append(np.asarray(logits, dtype=np.float32))
+        scores = np.concatenate(scores) if scores else np.array([], dtype=np.float32)
+        return 1 / (1 + np.exp(-scores)) if self.sigmoid else scores
+
+
+def _top_overlap(a, b, k):
+    return len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k
+
+
+def check_embedder(float_embeddings, onnx_embeddings, questions, passages, k=10):
+    """Compare quantized and float embeddings: cosine per text and top-k retrieval overlap"""
+    texts = questions + passages
+    reference = np.asarray(float_embeddings.embed_documents(texts), dtype=np.float32)
+    quantized = np.asarray(onnx_embeddings.embed_documents(texts), dtype=np.float32)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    quantized /= np.linalg.norm(quantized, axis=1, keepdims=True)
+    cosines = np.sum(reference * quantized, axis=1)
+
+    n = len(questions)
+    k = min(k, len(passages))
+    overlaps = [
+        _top_overlap(reference[n:] @ reference[i], quantized[n:] @ quantized[i], k)
+        for i in range(n)
+    ]
+    return {'min_cosine': round(float(cosines.min()), 4), 'mean_cosine': round(float(cosines.mean()), 4),
+            'top_k_overlap': round(float(np.mean(overlaps)), 4)}
+
+
+def check_reranker(float_model, onnx_model, questions, passages, k=5):
+    """Compare quantized and float reranker: top-k overlap of the rankings per question"""
+    k = min(k, len(passages))
+    overlaps = []
+    for question in questions:
+        pairs = [[question, passage] for passage in passages]
+        overlaps.append(_top_overlap(np.asarray(float_model.predict(pairs)), onnx_model.predict(pairs), k))
+    return {'top_k_overlap': round(float(np.mean(overlaps)), 4)}
+
+
+def within_tolerance(report):
+    """True if a tolerance report meets ONNX_MIN_COSINE and ONNX_MIN_RANK_OVERLAP"""
+    return (report.get('min_cosine', 1.0) >= ONNX_MIN_COSINE
+            and report['top_k_overlap'] >= ONNX_MIN_RANK_OVERLAP)
+
+
+def _report_path(kind):
+    return os.path.join(EMBEDDER_DIR if kind == 'embedder' else RERANKER_DIR, REPORT_FILE)
+
+
+def _tolerance_report(kind):
+    """Saved tolerance report, exporting and checking the model first if there is none"""
+    report_path = _report_path(kind)
+    if os.path.exists(report_path):
+        with open(report_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    passages = sample_passages()
+    if kind == 'embedder':
+        from langchain_huggingface import HuggingFaceEmbeddings
+        export_embedder()
+        report = check_embedder(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'}),
+                                load_onnx_embeddings(), SAMPLE_QUESTIONS, passages)
+    else:
+        from sentence_transformers import CrossEncoder
+        export_reranker()
+        report = check_reranker(CrossEncoder(RERANKER_MODEL), OnnxCrossEncoder(), SAMPLE_QUESTIONS, passages)
+    # Written only once the check has run, so a failed export is retried next time
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f'ONNX {kind} tolerance: {report}')
+    return report
+
+
+def _ensure_model(kind):
+    """Export the model if needed and check it once against the float model.
+
+    Returns True if the quantized model may be used. Export or check
+    failures (e.g. optimum or onnxruntime not installed) return False.
+    """
+    try:
+        report = _tolerance_report(kind)
+    except Exception as e:
+        logger.warning(f'Could not export or check the quantized {kind}, using the float model: {e}')
+        return False
+
+    if not within_tolerance(report):
+        logger.warning(f'Quantized {kind} is outside tolerance {report}, using the float model')
+        return False
+    return True
+
+
+def _load(kind, loader):
+    if not _ensure_model(kind):
+        return None
+    try:
+        return loader()
+    except Exception as e:
+        logger.warning(f'Could not load the quantized {kind}, using the float model: {e}')
+        return None
+
+
+def get_onnx_embeddings():
+    """Quantized embeddings, or None if they are not usable or not within tolerance"""
+    return _load('embedder', load_onnx_embeddings)
+
+
+def get_onnx_reranker():
+    """Quantized reranker, or None if it is not usable or not within tolerance"""
+    return _load('reranker', OnnxCrossEncoder)
+
+
+def _latency(fn, runs):
+    fn()  # Warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.percentile(timings, 50)), 2), round(float(np.percentile(timings, 95)), 2)
+
+
+def compare_latency(runs=50):
+    """Latency of float vs quantized models on single queries, query batches and rerank calls"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from sentence_transformers import CrossEncoder
+    passages = sample_passages()
+    question = SAMPLE_QUESTIONS[0]
+    pairs = [[question, passage] for passage in passages[:RERANK_TOP_N]]
+    variants = {
+        'embedder': (HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'}), load_onnx_embeddings()),
+        'reranker': (CrossEncoder(RERANKER_MODEL), OnnxCrossEncoder()),
+    }
+
+    report = []
+    for kind, (float_model, onnx_model) in variants.items():
+        for backend, model in (('torch', float_model), ('onnx_int8', onnx_model)):
+            if kind == 'embedder':
+                cases = {
+                    'single query': lambda: model.embed_query(question),
+                    f'{len(SAMPLE_QUESTIONS)} queries': lambda: model.embed_documents(SAMPLE_QUESTIONS),
+                }
+            else:
+                cases = {f'{len(pairs)} pairs': lambda: model.predict(pairs)}
+            for case, fn in cases.items():
+                p50, p95 = _latency(fn, runs)
+                report.append({'model': kind, 'backend': backend, 'case': case, 'p50_ms': p50, 'p95_ms': p95})
+    return report
+
+
+def main():
+    """Export quantized models, check tolerance and print a latency comparison"""
+    parser = argparse.ArgumentParser(description='Export int8 ONNX models and compare them with the float models')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    tolerance = {}
+    for kind in ('embedder', 'reranker'):
+        # Export errors are raised here rather than logged
+        tolerance[kind] = _tolerance_report(kind)
+        print(f"{kind:<10}{'OK' if within_tolerance(tolerance[kind]) else 'OUT OF TOLERANCE':<18}{tolerance[kind]}")
+
+    latency = compare_latency(args.runs)
+    print(f"\n{'model':<10}{'backend':<11}{'case':<14}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in latency:
+        print(f"{row['model']:<10}{row['backend']:<11}{row['case']:<14}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'tolerance': tolerance, 'latency': latency}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Async request pipeline with per-stage concurrency limits"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from cache import normalize_query
+from retrieval import get_message_content
+from generation import get_model_response_stream_async, get_cached_result, cache_answer, fallback_answer
+from llm_client import LLMUnavailable
+from singleflight import SingleFlight
+from config import *
+
+# Embedding, FAISS search and reranking run here so they never block the event loop
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu')
+
+
+class Overloaded(Exception):
+    """Raised when too many requests are already waiting for a stage"""
+
+
+class StageLimit:
+    """Async context manager allowing limit requests into a stage at once.
+
+    Up to max_pending more may wait; beyond that requests are rejected
+    with Overloaded instead of queueing without bound.
+    """
+
+    def __init__(self, name, limit, max_pending=MAX_PENDING_PER_STAGE):
+        self.name = name
+        self.limit = limit
+        self.max_pending = max_pending
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        """Wait for a slot, raising Overloaded if too many requests are waiting"""
+        if self._semaphore.locked() and self.waiting >= self.max_pending:
+            logger.warning(f'{self.name} stage overloaded: {self.waiting} requests waiting')
+            raise Overloaded(f'Too many requests waiting for {self.name}')
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        """Give back a slot taken with acquire()"""
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def stats(self):
+        """Current usage of the stage"""
+        return {'limit': self.limit, 'waiting': self.waiting, 'locked': self._semaphore.locked()}
+
+
+retrieval_limit = StageLimit('retrieval', MAX_CONCURRENT_RETRIEVALS)
+generation_limit = StageLimit('generation', MAX_CONCURRENT_GENERATIONS)
+
+# Identical questions asked at the same time share one retrieval and one answer
+retrieval_flights = SingleFlight('retrieval')
+answer_flights = SingleFlight('generation')
+
+
+async def run_cpu(func, *args):
+    """Run a blocking function on the CPU executor"""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, func, *args)
+
+
+async def cached_answer_async(question, history=""):
+    """Semantic cache lookup without blocking the event loop.
+
+    Returns a dict with the answer, its context and sources, or None.
+    """
+    return await run_cpu(get_cached_result, question, history)
+
+
+def retrieve_stream(question, db, k=RETRIEVAL_K):
+    """Run retrieval on the CPU executor, yielding its progress.
+
+    Yields ('stage', name) as each retrieval stage starts and finally
+    ('result', (message_content, sources, is_cached)). Concurrent calls
+    for the same normalized question share one retrieval.
+    """
+    if not USE_REQUEST_COALESCING:
+        return _retrieve_stream(question, db, k)
+    return retrieval_flights.stream((normalize_query(question), k), lambda: _retrieve_stream(question, db, k))
+
+
+async def _retrieve_stream(question, db, k):
+    loop = asyncio.get_running_loop()
+    stages = asyncio.Queue()
+
+    def on_stage(stage):
+        loop.call_soon_threadsafe(stages.put_nowait, stage)
+
+    await retrieval_limit.acquire()
+    try:
+        future = loop.run_in_executor(cpu_executor, get_message_content, question, db, k, on_stage)
+    except BaseException:
+        retrieval_limit.release()
+        raise
+    # The slot is held until the job ends, even if the request is cancelled
+    # first, so abandoned requests cannot pile up on the CPU pool
+    future.add_done_callback(lambda _: retrieval_limit.release())
+    future.add_done_callback(lambda _: stages.put_nowait(None))
+    while (stage := await stages.get()) is not None:
+        yield 'stage', stage
+    # Cancelling a plain await would cancel future itself and release the slot early
+    yield 'result', await asyncio.shield(future)
+
+
+async def retrieve(question, db, k=RETRIEVAL_K):
+    """Retrieve context for a question, returning (message_content, sources, is_cached)"""
+    async for kind, value in retrieve_stream(question, db, k):
+        if kind == 'result':
+            return value
+
+
+def answer_stream(question, message_content, history="", sources=()):
+    """Stream the answer from Gemini and store it in the semantic cache.
+
+    sources (see context.pack_context) are cached with the answer. If
+    Gemini is unavailable, finishes with a fallback answer (a
+    generation.FallbackAnswer chunk) that is not cached. Concurrent calls
+    with the same normalized question, history and context share one
+    Gemini stream.
+    """
+    if not USE_REQUEST_COALESCING:
+        return _answer_stream(question, message_content, history, sources)
+    key = (normalize_query(question), history, message_content)
+    return answer_flights.stream(key, lambda: _answer_stream(question, message_content, history, sources))
+
+
+async def _answer_stream(question, message_content, history, sources):
+    answer = ""
+    try:
+        async with generation_limit:
+            async for chunk in get_model_response_stream_async(question, message_content, history):
+                answer += chunk
+                yield chunk
+    except LLMUnavailable as e:
+        logger.error(f"LLM unavailable: {e}")
+        yield fallback_answer(question, message_content, partial=bool(answer))
+        return
+    await run_cpu(cache_answer, question, answer, message_content, history, sources)
@@ -0,0 +1,113 @@
+"""Cross-encoder reranking service shared by concurrent requests"""
+import threading
+from collections import Counter
+from loguru import logger
+from batching import MicroBatcher
+from cache import LRUCache, normalize_query
+from database import get_index_fingerprint
+from config import *
+
+# Cross-encoder scores by (normalized query, chunk ID), cleared when the index changes
+score_cache = LRUCache(RERANK_CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+
+# How often each rerank path is taken, and scored vs cached pairs
+rerank_counts = Counter()
+_counts_lock = threading.Lock()
+
+# Lazy load reranker
+_reranker_cache = None
+
+def get_reranker():
+    """Get or create reranker instance"""
+    global _reranker_cache
+    if _reranker_cache is None and USE_RERANKING and INFERENCE_BACKEND == 'onnx_int8':
+        from onnx_backend import get_onnx_reranker
+        _reranker_cache = get_onnx_reranker()
+    if _reranker_cache is None and USE_RERANKING:
+        from sentence_transformers import CrossEncoder
+        _reranker_cache = CrossEncoder(RERANKER_MODEL)
+    return _reranker_cache
+
+
+class RerankService:
+    """Scores (query, passage) pairs from all requests through one batcher.
+
+    Pairs are collected into batches of up to RERANK_BATCH_SIZE for at most
+    RERANK_BATCH_WAIT_MS, scored with a single predict call, and each
+    caller gets back the scores of its own pairs.
+    """
+
+    def __init__(self, model, max_batch_size=RERANK_BATCH_SIZE, max_wait_ms=RERANK_BATCH_WAIT_MS):
+        self.model = model
+        self.batcher = MicroBatcher(self._predict, max_batch_size, max_wait_ms / 1000, name='rerank')
+
+    def _predict(self, pairs):
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    def score(self, pairs):
+        """Cross-encoder scores for pairs, in order"""
+        return self.batcher.submit(pairs)
+
+    def stats(self):
+        """Batch size and queue wait metrics"""
+        return self.batcher.stats()
+
+
+_rerank_service = None
+
+def get_rerank_service():
+    """Get the shared reranking service, or None if reranking is off"""
+    global _rerank_service
+    if _rerank_service is None:
+        model = get_reranker()
+        if model is None:
+            return None
+        _rerank_service = RerankService(model)
+        logger.debug(f'Rerank service started: batches of {RERANK_BATCH_SIZE} pairs within {RERANK_BATCH_WAIT_MS} ms')
+    return _rerank_service
+
+
+def rerank_batch_stats():
+    """Metrics of the reranking service, or None before its first use"""
+    return _rerank_service.stats() if _rerank_service else None
+
+
+def rerank_scores(pairs):
+    """Score (query, passage) pairs, batched with other requests' pairs"""
+    if not USE_MICRO_BATCHING:
+        return get_reranker().predict(pairs)
+    return get_rerank_service().score(pairs)
+
+
+def rerank_candidates(topic, candidates):
+    """Scores for (chunk_id, document) candidates, reusing cached ones"""
+    score_cache.validate(get_index_fingerprint())
+    query = normalize_query(topic)
+    scores = [score_cache.get((query, chunk_id)) for chunk_id, _ in candidates]
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        new_scores = rerank_scores([[topic, candidates[i][1].page_content] for i in missing])
+        for i, score in zip(missing, new_scores):
+            scores[i] = float(score)
+            score_cache.set((query, candidates[i][0]), scores[i])
+    with _counts_lock:
+        rerank_counts['scored_pairs'] += len(missing)
+        rerank_counts['cached_pairs'] += len(candidates) - len(missing)
+    return scores
+
+
+def record_rerank_path(path):
+    """Count a rerank gate decision, logging totals every 100 requests"""
+    with _counts_lock:
+        rerank_counts[path] += 1
+        requests = sum(rerank_counts[p] for p in ('skip', 'truncate', 'full'))
+    if requests % 100 == 0:
+        logger.info(f'Rerank paths after {requests} requests: {rerank_stats()}')
+
+
+def rerank_stats():
+    """Rerank path counts and score cache usage"""
+    return {
+        **{key: rerank_counts[key] for key in ('skip', 'truncate', 'full', 'scored_pairs', 'cached_pairs')},
+        'score_cache': score_cache.stats(),
+    }
@@ -1,21 +1,21 @@
 """Retrieval and search functionality"""
 from loguru import logger
-import re
+import time
+import weakref
+import numpy as np
+from cache import LRUCache, normalize_query
+from context import pack_context
+from database import embed_queries, get_article_index, get_bm25_index, get_index_fingerprint
+from fusion import candidate_pool, fuse
+from metrics import record_cache, record_stage, stage_timer
+from reranker import get_reranker, record_rerank_path, rerank_candidates
 from config import *
 
 # Cache for query results
-query_cache = {}
+query_cache = LRUCache(MAX_CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
 
-# Lazy load reranker
-_reranker_cache = None
-
-def get_reranker():
-    """Get or create reranker instance"""
-    global _reranker_cache
-    if _reranker_cache is None and USE_RERANKING:
-        from sentence_transformers import CrossEncoder
-        _reranker_cache = CrossEncoder(RERANKER_MODEL)
-    return _reranker_cache
+# Chunk ID -> FAISS position per loaded store
+_position_maps = weakref.WeakKeyDictionary()
 
 
 def expand_query(query):
@@ -43,104 +43,221 @@ def expand_query(query):
     return expansions[:3]
 
 
-def get_message_content(topic, db, k):
-    """Retrieve relevant context using hybrid search"""
-    logger.debug('...get_message_content')
-    
-    # Check cache
-    cache_key = f"{topic}_{k}"
-    if cache_key in query_cache:
-        logger.debug("Using cached results")
-        return query_cache[cache_key], True  # Return with cache flag
-    
+def _mmr_select(query_sims, doc_sims, pool, k, lambda_mult):
+    """Pick k candidates from pool by maximal marginal relevance"""
+    pool = np.asarray(pool)
+    relevance = query_sims[pool]
+    selected = [int(np.argmax(relevance))]
+    redundancy = doc_sims[pool[selected[0]], pool].copy()
+
+    while len(selected) < min(k, len(pool)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, doc_sims[pool[best], pool])
+
+    return pool[selected]
+
+
+def batched_mmr_search(db, queries, k, fetch_k, lambda_mult=MMR_LAMBDA):
+    """Run MMR search for several queries with one embedding pass and one FAISS search.
+
+    Returns one list of chunk IDs per query, in MMR order, a map of chunk
+    ID to cosine similarity with the first query for every candidate
+    fetched, and the first query's normalized vector.
+    """
+    with stage_timer('embedding'):
+        query_vectors = np.asarray(embed_queries(queries), dtype=np.float32)
+    with stage_timer('faiss_search'):
+        _, indices = db.index.search(query_vectors, fetch_k)
+
+    query_vectors = _unit_rows(query_vectors)
+    candidates = np.unique(indices[indices >= 0])
+    if len(candidates) == 0:
+        return [[] for _ in queries], {}, query_vectors[0]
+
+    # Cosine similarities over the merged candidate matrix, shared by all queries
+    vectors = _unit_rows(db.index.reconstruct_batch(candidates))
+    doc_sims = vectors @ vectors.T
+    query_sims = query_vectors @ vectors.T
+    row_of = {int(index): row for row, index in enumerate(candidates)}
+    chunk_ids = [db.index_to_docstore_id[int(index)] for index in candidates]
+    relevance = dict(zip(chunk_ids, query_sims[0].tolist()))
+
+    rankings = []
+    for query_row, hits in enumerate(indices):
+        pool = [row_of[int(i)] for i in hits if i >= 0]
+        rankings.append([chunk_ids[row] for row in _mmr_select(query_sims[query_row], doc_sims, pool, k, lambda_mult)])
+    return rankings, relevance, query_vectors[0]
+
+
+def _unit_rows(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _positions(db):
+    """Map of chunk ID -> FAISS position, rebuilt when the store changes size"""
+    positions = _position_maps.get(db)
+    if positions is None or len(positions) != len(db.index_to_docstore_id):
+        positions = {chunk_id: position for position, chunk_id in db.index_to_docstore_id.items()}
+        _position_maps[db] = positions
+    return positions
+
+
+def vector_relevance(db, query_vector, chunk_ids):
+    """Cosine similarity with query_vector of chunks not fetched by vector search, from their stored vectors"""
+    positions = _positions(db)
+    chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in positions]
+    if not chunk_ids:
+        return {}
+    vectors = _unit_rows(db.index.reconstruct_batch(np.array([positions[chunk_id] for chunk_id in chunk_ids], dtype=np.int64)))
+    return dict(zip(chunk_ids, (vectors @ query_vector).tolist()))
+
+
+def find_article_docs(topic, db):
+    """Fetch chunks of the articles cited in the question from the article index"""
+    chunk_ids = get_article_index(db).lookup(topic)
+    return [db.docstore.search(chunk_id) for chunk_id in chunk_ids]
+
+
+def _notify(on_stage, stage):
+    """Report that a retrieval stage is starting"""
+    if on_stage is not None:
+        on_stage(stage)
+
+
+def _rerank_gate(candidates, relevance, k):
+    """Decide which candidates need cross-encoder scoring.
+
+    Returns (path, candidates). 'skip' means the first-stage top k lead the
+    rest by at least RERANK_SKIP_MARGIN and are returned in first-stage
+    order; 'truncate' drops candidates scoring more than RERANK_KEEP_MARGIN
+    below the k-th; 'full' reranks them all. Candidates without a vector
+    score are always reranked.
+    """
+    scored = sorted((relevance[chunk_id] for chunk_id, _ in candidates if chunk_id in relevance), reverse=True)
+    if len(scored) <= k:
+        return 'full', candidates
+    kth = scored[k - 1]
+    unscored = any(chunk_id not in relevance for chunk_id, _ in candidates)
+    if not unscored and kth - scored[k] >= RERANK_SKIP_MARGIN:
+        return 'skip', sorted(candidates, key=lambda c: relevance[c[0]], reverse=True)[:k]
+    keep = [c for c in candidates if c[0] not in relevance or relevance[c[0]] >= kth - RERANK_KEEP_MARGIN]
+    if len(keep) < len(candidates):
+        return 'truncate', keep
+    return 'full', candidates
+
+
+def search_documents(topic, db, k, on_stage=None, use_bm25=USE_BM25, use_reranking=USE_RERANKING):
+    """Hybrid vector + BM25 search fused by chunk ID, with cross-encoder reranking"""
     # Query expansion
-    queries = expand_query(topic)
-    all_docs = []
+    with stage_timer('query_expansion'):
+        queries = expand_query(topic)
+    rankings, relevance, docs = [], {}, {}
+    query_vector = None
     
-    # Hybrid search: Vector (70%) + BM25 (30%)
-    for query in queries:
-        try:
-            vector_docs = db.max_marginal_relevance_search(query, k=k, fetch_k=k*2)
-        except Exception:
-            vector_docs = db.similarity_search(query, k=k)
-        
-        all_docs.extend(vector_docs)
+    _notify(on_stage, 'vector_search')
+    try:
+        with stage_timer('vector_search'):
+            rankings, relevance, query_vector = batched_mmr_search(db, queries, k=k, fetch_k=k*2)
+    except Exception as e:
+        logger.warning(f"Batched vector search failed: {e}, searching queries one by one")
+        for query in queries:
+            hits = db.similarity_search(query, k=k)
+            docs.update((int(doc.id), doc) for doc in hits)
+            rankings.append([int(doc.id) for doc in hits])
     
     # BM25 keyword search
-    if USE_BM25:
+    bm25_hits = []
+    if use_bm25:
+        _notify(on_stage, 'keyword_search')
         try:
-            from rank_bm25 import BM25Okapi
-            from database import get_bm25_index
-            bm25, corpus_docs = get_bm25_index(db)
-            tokenized_query = topic.lower().split()
-            bm25_scores = bm25.get_scores(tokenized_query)
-            top_bm25_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:k//3]
-            bm25_docs = [corpus_docs[i] for i in top_bm25_indices]
-            all_docs.extend(bm25_docs)
+            with stage_timer('bm25'):
+                bm25_hits = get_bm25_index(db).search(topic, BM25_CANDIDATES)
         except Exception as e:
             logger.warning(f"BM25 search failed: {e}")
     
-    # Remove duplicates
-    seen = set()
-    unique_docs = []
-    for doc in all_docs:
-        content_hash = hash(doc.page_content[:100])
-        if content_hash not in seen:
-            seen.add(content_hash)
-            unique_docs.append(doc)
+    # Fuse per-retriever scores (VECTOR_WEIGHT / BM25_WEIGHT); chunk IDs deduplicate across retrievers
+    fused = fuse(rankings, relevance, bm25_hits)
+    pool = candidate_pool(fused, k)
+    for chunk_id in pool:
+        if chunk_id not in docs:
+            docs[chunk_id] = db.docstore.search(chunk_id)
+    candidates = [(chunk_id, docs[chunk_id]) for chunk_id in pool]
+    logger.debug(f"Fused {len(fused)} chunks ({FUSION_METHOD}), {len(candidates)} candidates")
     
-    # Rerank with cross-encoder
-    if USE_RERANKING and len(unique_docs) > k:
+    # Give candidates found by BM25 only a vector score, so they do not force a full rerank
+    unscored = [chunk_id for chunk_id in pool if chunk_id not in relevance]
+    if unscored and query_vector is not None:
         try:
-            reranker = get_reranker()
-            if reranker:
-                pairs = [[topic, doc.page_content] for doc in unique_docs[:RERANK_TOP_N]]
-                scores = reranker.predict(pairs)
-                ranked_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-                docs = [unique_docs[i] for i in ranked_indices[:k]]
-                logger.debug(f"Reranked {len(unique_docs)} docs to top {k}")
-            else:
-                docs = unique_docs[:k]
+            relevance.update(vector_relevance(db, query_vector, unscored))
         except Exception as e:
-            logger.warning(f"Reranking failed: {e}, using original order")
-            docs = unique_docs[:k]
-    else:
-        docs = unique_docs[:k]
+            logger.warning(f"Scoring BM25-only candidates failed: {e}")
+    
+    # Rerank with cross-encoder, unless the first-stage ranking is already decisive
+    if use_reranking and len(candidates) > k:
+        try:
+            if get_reranker():
+                path, gated = _rerank_gate(candidates, relevance, k)
+                record_rerank_path(path)
+                if path != 'skip':
+                    _notify(on_stage, 'rerank')
+                    with stage_timer('rerank'):
+                        scores = rerank_candidates(topic, gated)
+                    ranked_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+                    gated = [gated[i] for i in ranked_indices]
+                candidates = gated
+                logger.debug(f"Rerank path {path}: {len(pool)} candidates to top {k}")
+        except Exception as e:
+            logger.warning(f"Reranking failed: {e}, using fused order")
+    
+    return [doc for _, doc in candidates[:k]]
+
+
+def get_message_content(topic, db, k, on_stage=None):
+    """Retrieve relevant context using hybrid search.
+
+    Returns (context, sources, is_cached); sources lists the chunks packed
+    into the context (see context.pack_context).
+
+    on_stage, if given, is called with the name of each stage as it starts
+    ('article_lookup', 'vector_search', 'keyword_search', 'rerank').
+    """
+    logger.debug('...get_message_content')
+    start = time.perf_counter()
     
-    # Build context with metadata
-    sources_content = {}
-    for doc in docs:
-        source = doc.metadata.get('source_file', 'unknown')
-        law_name = doc.metadata.get('law_name', source)
-        article = doc.metadata.get('article', '')
-        
-        if source not in sources_content:
-            sources_content[source] = {
-                'law_name': law_name,
-                'chunks': []
-            }
-        
-        chunk_text = doc.page_content
-        if article:
-            chunk_text = f"[Статья {article}] {chunk_text}"
-        
-        sources_content[source]['chunks'].append(chunk_text)
+    # Check cache
+    query_cache.validate(get_index_fingerprint())
+    cache_key = (normalize_query(topic), k)
+    cached = query_cache.get(cache_key)
+    record_cache('retrieval', cached is not None)
+    if cached is not None:
+        logger.debug(f"Using cached results, cache stats: {query_cache.stats()}")
+        record_stage('retrieval', time.perf_counter() - start)
+        return *cached, True  # Return with cache flag
     
-    # Compress context
-    message_content = ""
-    for source, data in sources_content.items():
-        message_content += f"\n=== {data['law_name']} ===\n"
-        for chunk in data['chunks'][:3]:
-            clean_chunk = re.sub(r'\n+', ' ', chunk.strip())
-            clean_chunk = re.sub(r'\s+', ' ', clean_chunk)
-            message_content += f"{clean_chunk}\n"
-        message_content += "\n"
+    # Direct article lookup skips vector search and reranking
+    docs = []
+    if USE_ARTICLE_LOOKUP:
+        _notify(on_stage, 'article_lookup')
+        with stage_timer('article_lookup'):
+            docs = find_article_docs(topic, db)
+    if docs:
+        # Every chunk of the cited articles is wanted; only the budget limits them
+        logger.debug(f"Article lookup returned {len(docs)} chunks")
+        max_per_law = None
+    else:
+        docs = search_documents(topic, db, k, on_stage)
+        max_per_law = CONTEXT_MAX_CHUNKS_PER_LAW
     
-    result = message_content.strip()
+    # Pack the most relevant chunks into the token budget
+    with stage_timer('context_build'):
+        result, sources = pack_context(docs, max_per_law=max_per_law)
     
     # Cache result
-    if len(query_cache) < MAX_CACHE_SIZE:
-        query_cache[cache_key] = result
+    query_cache.set(cache_key, (result, sources))
     
-    logger.debug(f"Relevant sources: {len(sources_content)}, Total chunks: {len(docs)}")
-    return result, False  # Return with cache flag
+    record_stage('retrieval', time.perf_counter() - start)
+    logger.debug(f"Packed {len(sources)} of {len(docs)} chunks, ~{sum(s['tokens'] for s in sources)} tokens")
+    return result, sources, False  # Return with cache flag
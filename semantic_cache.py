@@ -0,0 +1,200 @@
+"""Semantic answer cache keyed on question embeddings"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from loguru import logger
+from articles import normalize_article
+from database import embed_queries, get_index_fingerprint
+from config import *
+
+
+NUMBER = re.compile(r'\d+(?:\s*[-–]\s*\d+|[¹²³⁴⁵⁶⁷⁸⁹⁰]+)?')
+
+
+def question_numbers(question):
+    """Sorted article numbers, years and other numbers in a question.
+
+    Questions differing only in these embed almost identically, so a
+    cached answer is reused only when they match exactly.
+    """
+    return sorted({normalize_article(number) for number in NUMBER.findall(question)})
+
+
+class SemanticCache:
+    """Persistent nearest-neighbour cache of final answers.
+
+    Questions are stored as L2-normalized embeddings, so a single matrix
+    product gives cosine similarity against every cached question.
+    Changes are written to disk at most every save_interval seconds, and
+    on flush(), outside the lock that lookups take.
+    """
+
+    def __init__(self, path, threshold, max_size, save_interval=SEMANTIC_CACHE_SAVE_INTERVAL):
+        self.path = path
+        self.threshold = threshold
+        self.max_size = max_size
+        self.save_interval = save_interval
+        self.fingerprint = None
+        self.vectors = None
+        self.entries = []
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, vector, language, numbers=()):
+        """Return the closest cached entry in the same language, with the
+        same numbers (see question_numbers), above threshold"""
+        vector = _normalize(vector)
+        numbers = list(numbers)
+        with self._lock:
+            if not self.entries:
+                self.misses += 1
+                return None
+            sims = self.vectors @ vector
+            mismatched = np.array([entry['language'] != language or entry['numbers'] != numbers for entry in self.entries])
+            sims[mismatched] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = self.entries[best]
+            entry['last_used'] = time.time()
+            self.hits += 1
+            logger.debug(f"Semantic cache hit ({sims[best]:.3f}): {entry['question']}")
+            return entry
+
+    def add(self, vector, question, language, answer, numbers=(), context='', sources=()):
+        """Store an answer with the context it was generated from and that
+        context's sources, evicting the least recently used entry when full"""
+        vector = _normalize(vector)
+        with self._lock:
+            if self.entries and len(self.entries) >= self.max_size:
+                oldest = min(range(len(self.entries)), key=lambda i: self.entries[i]['last_used'])
+                del self.entries[oldest]
+                self.vectors = np.delete(self.vectors, oldest, axis=0)
+            now = time.time()
+            self.entries.append({
+                'question': question,
+                'language': language,
+                'numbers': list(numbers),
+                'answer': answer,
+                'context': context,
+                'sources': list(sources),
+                'created': now,
+                'last_used': now,
+            })
+            row = vector[np.newaxis, :]
+            self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])
+            self._dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.flush()
+
+    def validate(self, fingerprint):
+        """Drop cached answers built from a different index"""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self.entries:
+                    logger.info('Index changed, clearing semantic cache')
+                self.entries = []
+                self.vectors = None
+                self.fingerprint = fingerprint
+                self._dirty = True
+        self.flush()
+
+    def load(self):
+        """Load cache from disk if present"""
+        entries_path = os.path.join(self.path, 'entries.json')
+        if not os.path.exists(entries_path):
+            return
+        try:
+            with open(entries_path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.fingerprint = data['fingerprint']
+            self.entries = data['entries']
+            for entry in self.entries:
+                # Entries saved by older versions
+                entry.setdefault('numbers', question_numbers(entry['question']))
+                entry.setdefault('context', '')
+                entry.setdefault('sources', [])
+            if self.entries:
+                self.vectors = np.load(os.path.join(self.path, 'vectors.npy'))
+            logger.debug(f'Semantic cache loaded: {len(self.entries)} entries')
+        except Exception as e:
+            logger.warning(f'Could not load semantic cache: {e}')
+            self.entries = []
+            self.vectors = None
+
+    def flush(self):
+        """Write unsaved changes to disk"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                # vectors is replaced, never changed in place, so a reference is a snapshot
+                fingerprint, vectors = self.fingerprint, self.vectors
+                entries = [dict(entry) for entry in self.entries]
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            try:
+                self._save(fingerprint, entries, vectors)
+            except Exception as e:
+                logger.warning(f'Could not save semantic cache: {e}')
+                with self._lock:
+                    self._dirty = True
+
+    def _save(self, fingerprint, entries, vectors):
+        os.makedirs(self.path, exist_ok=True)
+        if vectors is not None:
+            np.save(os.path.join(self.path, 'vectors.tmp.npy'), vectors)
+            os.replace(os.path.join(self.path, 'vectors.tmp.npy'), os.path.join(self.path, 'vectors.npy'))
+        tmp_path = os.path.join(self.path, 'entries.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, 'entries.json'))
+
+    def stats(self):
+        """Return cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+_semantic_cache = None
+
+def get_semantic_cache():
+    """Get semantic cache for the loaded index"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+        atexit.register(_semantic_cache.flush)
+    fingerprint = get_index_fingerprint()
+    # Unknown until the index is loaded; validating then would erase the cache
+    if fingerprint is not None:
+        _semantic_cache.validate(fingerprint)
+    return _semantic_cache
+
+
+def embed_question(question):
+    """Embed question with the retrieval embedding model"""
+    return embed_queries([question])[0]
@@ -0,0 +1,140 @@
+"""Coalescing of identical in-flight requests.
+
+When many users ask the same question at once, the first request starts
+the work and the others subscribe to it: every item the work yields is
+sent to all subscribers, late ones first catching up on what they missed.
+The work is cancelled if every subscriber leaves before it finishes.
+"""
+import asyncio
+from collections import Counter
+
+
+class FlightCancelled(Exception):
+    """The shared work was cancelled before it finished"""
+
+
+class Flight:
+    """One running async iterable, fanned out to any number of subscribers"""
+
+    def __init__(self, source):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+        self.task.add_done_callback(self._finished)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            # Subscribers must not mistake a cancelled flight for a finished one
+            self.error = FlightCancelled('Shared request was cancelled')
+            raise
+        except Exception as e:
+            # Raised to every subscriber instead of left on the task
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _finished(self, task):
+        if not self.done:
+            # Cancelled before _run started
+            self.error = FlightCancelled('Shared request was cancelled')
+            self.done = True
+            self._notify()
+
+    def subscribe(self):
+        """Async iterator over every item of the flight, raising its error, if any, at the end.
+
+        The subscriber counts from this call, so the flight keeps running
+        for callers that joined but have not started iterating yet, until
+        it finishes iterating, is closed or is garbage collected.
+        """
+        return Subscription(self)
+
+    async def _items(self):
+        position = 0
+        while True:
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    def _leave(self):
+        self.subscribers -= 1
+        if not self.subscribers and not self.done:
+            self.task.cancel()
+
+
+class Subscription:
+    """One subscriber's iterator over a flight, leaving it exactly once"""
+
+    def __init__(self, flight):
+        self._flight = flight
+        self._items = flight._items()
+        self._left = False
+        flight.subscribers += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._items.__anext__()
+        except BaseException:
+            # The end of the flight, its error, or this subscriber being cancelled
+            self._leave()
+            raise
+
+    async def aclose(self):
+        await self._items.aclose()
+        self._leave()
+
+    def __del__(self):
+        self._leave()
+
+    def _leave(self):
+        if not self._left:
+            self._left = True
+            self._flight._leave()
+
+
+class SingleFlight:
+    """At most one flight per key; callers with a key already in flight join it"""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = Counter()
+        self._flights = {}
+
+    def stream(self, key, start):
+        """Subscribe to the flight for key, calling start() for its async iterable if there is none"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight(start())
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.counts['flights'] += 1
+        else:
+            self.counts['joined'] += 1
+        return flight.subscribe()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        """Flights started, requests that joined one, and flights running now"""
+        return {'flights': self.counts['flights'], 'joined': self.counts['joined'], 'in_flight': len(self._flights)}
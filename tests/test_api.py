@@ -0,0 +1,148 @@
+"""HTTP API request validation"""
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import api
+
+
+async def fake_retrieve(question, db, k):
+    return 'context', [], False
+
+
+async def fake_answer_stream(question, content, history, sources=()):
+    yield 'answer'
+
+
+async def fake_cached_answer(question, history):
+    return None
+
+
+def post(path, body):
+    async def run():
+        app = api.create_app(db=object(), retrieve=fake_retrieve, answer_stream=fake_answer_stream,
+                             cached_answer=fake_cached_answer)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(path, json=body)
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+
+def test_valid_requests():
+    assert post('/retrieve', {'question': 'кража', 'k': 3})[0] == 200
+    assert post('/answer', {'question': 'кража', 'history': ''}) == (200, {'answer': 'answer', 'sources': [], 'cached': False, 'fallback': False})
+
+
+def test_cached_answers_keep_their_sources():
+    sources = [{'chunk_id': 7, 'law_name': 'Уголовный кодекс', 'article': '158'}]
+
+    async def cached_answer(question, history):
+        return {'answer': 'cached answer', 'context': 'context', 'sources': sources}
+
+    async def run():
+        app = api.create_app(db=object(), retrieve=fake_retrieve, answer_stream=fake_answer_stream,
+                             cached_answer=cached_answer)
+        async with TestClient(TestServer(app)) as client:
+            answer = await (await client.post('/answer', json={'question': 'кража'})).json()
+            stream = await (await client.post('/answer/stream', json={'question': 'кража'})).text()
+            return answer, stream
+    answer, stream = asyncio.run(run())
+    assert answer == {'answer': 'cached answer', 'sources': sources, 'cached': True, 'fallback': False}
+    assert '"cached": true' in stream and '"article": "158"' in stream
+
+
+def test_malformed_bodies_are_rejected():
+    for body in (['кража'], 'кража', None):
+        assert post('/answer', body)[0] == 400
+    assert post('/answer', {'question': 'кража', 'history': ['hi']})[0] == 400
+    for k in ('5', 0, -1, 2.5, True, api.API_MAX_K + 1):
+        status, data = post('/retrieve', {'question': 'кража', 'k': k})
+        assert status == 400 and 'k' in data['error']
+
+
+def test_bodies_that_are_not_utf8_are_rejected():
+    async def run():
+        app = api.create_app(db=object(), retrieve=fake_retrieve, answer_stream=fake_answer_stream,
+                             cached_answer=fake_cached_answer)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/retrieve', data=b'\xff\xfe{', headers={'Content-Type': 'application/json'})
+            return response.status, await response.json()
+    assert asyncio.run(run()) == (400, {'error': 'Body must be JSON'})
+
+
+def test_answers_retrieve_the_requested_number_of_chunks():
+    requested = []
+
+    async def retrieve(question, db, k):
+        requested.append(k)
+        return 'context', [], False
+
+    async def run():
+        app = api.create_app(db=object(), retrieve=retrieve, answer_stream=fake_answer_stream,
+                             cached_answer=fake_cached_answer)
+        async with TestClient(TestServer(app)) as client:
+            await client.post('/answer', json={'question': 'кража', 'k': 3})
+            await (await client.post('/answer/stream', json={'question': 'кража', 'k': 4})).text()
+            await client.post('/answer', json={'question': 'кража'})
+    asyncio.run(run())
+    assert requested == [3, 4, api.RETRIEVAL_K]
+
+
+def test_fallback_answers_are_flagged():
+    from generation import FallbackAnswer
+
+    async def failing_answer_stream(question, content, history, sources=()):
+        yield 'partial answer'
+        yield FallbackAnswer('cut off')
+
+    async def run():
+        app = api.create_app(db=object(), retrieve=fake_retrieve, answer_stream=failing_answer_stream,
+                             cached_answer=fake_cached_answer)
+        async with TestClient(TestServer(app)) as client:
+            answer = await (await client.post('/answer', json={'question': 'кража'})).json()
+            stream = await (await client.post('/answer/stream', json={'question': 'кража'})).text()
+            return answer, stream
+    answer, stream = asyncio.run(run())
+    assert answer['fallback'] is True and answer['answer'] == 'partial answercut off'
+    assert 'event: done\ndata: {"cached": false, "fallback": true, "sources": []}' in stream
+
+
+def test_client_disconnect_closes_the_answer_stream(monkeypatch):
+    events = []
+
+    async def endless_answer_stream(question, content, history, sources=()):
+        try:
+            while True:
+                yield 'token '
+                await asyncio.sleep(0.01)
+        finally:
+            events.append('closed')
+
+    @web.middleware
+    async def record_errors(request, handler):
+        try:
+            return await handler(request)
+        except Exception as e:
+            events.append(type(e).__name__)
+            raise
+
+    write = web.StreamResponse.write
+
+    async def write_until_disconnect(self, data):
+        # The client goes away after the first event
+        if events.count('written'):
+            raise ConnectionResetError('Cannot write to closing transport')
+        events.append('written')
+        await write(self, data)
+
+    monkeypatch.setattr(web.StreamResponse, 'write', write_until_disconnect)
+
+    async def run():
+        app = api.create_app(db=object(), retrieve=fake_retrieve, answer_stream=endless_answer_stream,
+                             cached_answer=fake_cached_answer)
+        app.middlewares.append(record_errors)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/answer/stream', json={'question': 'кража'})
+            await response.read()
+    asyncio.run(run())
+    # The stream was closed at once and no exception escaped the handler
+    assert events == ['written', 'closed']
@@ -0,0 +1,42 @@
+"""Article reference parsing and lookup"""
+from types import SimpleNamespace
+from articles import ArticleIndex, parse_article_reference
+
+
+def test_every_listed_article_is_returned():
+    assert parse_article_reference('статьи 22, 23 УК')[1] == ['22', '23']
+    assert parse_article_reference('articles 10 and 11 of the Labour Code')[1] == ['10', '11']
+    assert parse_article_reference('Эмгек кодексинин 10 жана 11-беренелери')[1] == ['10', '11']
+    assert parse_article_reference('ст. 240¹ УК')[1] == ['240-1']
+
+
+def test_lookup_interleaves_articles():
+    index = ArticleIndex({'Уголовный кодекс.txt': {'22': [1, 2, 3, 4], '23': [5, 6]}})
+    assert index.lookup('статьи 22, 23 УК') == [1, 5, 2, 6, 3, 4]
+
+
+def test_message_content_includes_every_cited_article(monkeypatch):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    import retrieval
+    from chunking import chunk_ids, chunk_law_text
+
+    file = 'Семейный кодекс Кыргызской Республики.txt'
+    text = ''.join(
+        f'Статья {article}. Заголовок статьи {article}\n'
+        + ' '.join(f'Норма {number} статьи {article} о браке.' for number in range(20)) + '\n'
+        for article in ('21', '22', '23', '24', '25', '26')
+    )
+    docs = chunk_law_text(text, file, f'laws/{file}')
+    for chunk_id, doc in zip(chunk_ids(file, [doc.page_content for doc in docs]), docs):
+        doc.id = chunk_id
+    db = SimpleNamespace(docstore=InMemoryDocstore({doc.id: doc for doc in docs}))
+
+    monkeypatch.setattr(retrieval, 'get_article_index', lambda db: ArticleIndex.build((doc.id, doc) for doc in docs))
+    monkeypatch.setattr(retrieval, 'query_cache', retrieval.LRUCache(10))
+    context, sources, is_cached = retrieval.get_message_content('статьи 22, 23, 24 и 25 Семейного кодекса', db, 8)
+
+    assert not is_cached
+    assert {source['article'] for source in sources} == {'22', '23', '24', '25'}
+    for article in ('22', '23', '24', '25'):
+        assert f'Норма 19 статьи {article}' in context
+    assert 'статьи 21' not in context and 'статьи 26' not in context
@@ -0,0 +1,29 @@
+"""Micro-batching of concurrent calls"""
+from concurrent.futures import ThreadPoolExecutor
+from batching import MicroBatcher
+
+
+def test_callers_get_their_own_results():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=8, max_wait=0.05)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(batcher.submit, [[1, 2], [3], [4, 5, 6], [7]]))
+    assert results == [[2, 4], [6], [8, 10, 12], [14]]
+    assert batcher.items == 7
+
+
+def test_wrong_number_of_results_fails_every_caller():
+    calls = []
+
+    def short_once(items):
+        calls.append(items)
+        return items[:-1] if len(calls) == 1 else items
+
+    batcher = MicroBatcher(short_once, max_batch_size=8, max_wait=0.05)
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(batcher.submit, items) for items in ([1, 2], [3])]
+        errors = [future.exception() for future in futures]
+    # Both requests shared the short batch, so neither got a shifted slice
+    assert len(calls) == 1
+    assert all(isinstance(error, ValueError) and 'results for' in str(error) for error in errors)
+    # The worker keeps serving later batches
+    assert batcher.submit([4, 5]) == [4, 5]
@@ -0,0 +1,54 @@
+"""Retrieval quality measures of the offline benchmark"""
+from langchain_core.documents import Document
+import metrics
+import retrieval
+from benchmark import first_relevant_rank, run_configuration
+
+CRIMINAL_CODE = 'Уголовный кодекс.txt'
+LABOR_CODE = 'Трудовой кодекс.txt'
+
+
+def doc(law, article):
+    return Document(page_content=f'{law} {article}', metadata={'source_file': law, 'article': article})
+
+
+QUESTIONS = [
+    {'id': 'theft', 'question': 'кража', 'expected': {'law': CRIMINAL_CODE, 'articles': ['205']}},
+    {'id': 'leave', 'question': 'отпуск', 'expected': {'law': LABOR_CODE, 'articles': ['130', '131']}},
+    {'id': 'robbery', 'question': 'грабеж', 'expected': {'law': CRIMINAL_CODE, 'articles': ['206']}},
+]
+RESULTS = {
+    'кража': [doc(CRIMINAL_CODE, '205'), doc(CRIMINAL_CODE, '206')],
+    'отпуск': [doc(CRIMINAL_CODE, '131'), doc(LABOR_CODE, '100'), doc(LABOR_CODE, '131')],
+    'грабеж': [doc(CRIMINAL_CODE, '205'), doc(LABOR_CODE, '206')],
+}
+
+
+def test_rank_needs_the_expected_law_and_article():
+    expected = QUESTIONS[1]['expected']
+    assert first_relevant_rank(RESULTS['отпуск'], expected) == 3
+    assert first_relevant_rank(RESULTS['отпуск'][:2], expected) is None
+    assert first_relevant_rank([], expected) is None
+
+
+def test_configuration_reports_recall_mrr_and_misses(monkeypatch):
+    calls = []
+
+    def search_documents(question, db, k, **options):
+        calls.append((question, k, options))
+        metrics.record_stage('vector_search', 0.01)
+        return RESULTS[question]
+
+    monkeypatch.setattr(retrieval, 'search_documents', search_documents)
+    result = run_configuration(None, QUESTIONS, 5, {'use_bm25': False}, repeats=2)
+
+    # One warm-up call, then every question once per repeat
+    assert len(calls) == 1 + 2 * len(QUESTIONS)
+    assert all(call[1:] == (5, {'use_bm25': False}) for call in calls)
+    assert result['recall_at_k'] == round(2 / 3, 4)
+    assert result['mrr'] == round((1 + 1 / 3 + 0) / 3, 4)
+    assert result['law_recall_at_k'] == 1.0
+    assert result['misses'] == ['robbery']
+    # Stage timings cover the measured searches only, not the warm-up
+    assert metrics.snapshot()['stages_ms']['vector_search']['count'] == 2 * len(QUESTIONS)
+    assert set(result['stages_ms']) == {'vector_search'}
@@ -0,0 +1,69 @@
+"""BM25 keyword index"""
+import math
+from collections import Counter
+import pytest
+from bm25_index import BM25Index, tokenize
+
+TEXTS = [
+    'Кража, то есть тайное хищение чужого имущества',
+    'Грабеж, то есть открытое хищение чужого имущества, наказывается лишением свободы',
+    'Работник имеет право на отпуск',
+    'Разбой наказывается лишением свободы, кража наказывается штрафом',
+    'Брак заключается в органах записи актов гражданского состояния',
+]
+DOC_IDS = [101, 202, 303, 404, 505]
+
+
+def brute_force(query, k1=1.5, b=0.75):
+    """Okapi BM25 straight from the formula, with Lucene's idf"""
+    docs = [tokenize(text) for text in TEXTS]
+    avg_length = sum(map(len, docs)) / len(docs)
+    scores = {}
+    for doc_id, tokens in zip(DOC_IDS, docs):
+        counts = Counter(tokens)
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in doc for doc in docs)
+            if not counts[term]:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * counts[term] * (k1 + 1) / (counts[term] + k1 * (1 - b + b * len(tokens) / avg_length))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+
+@pytest.mark.parametrize('query', ['кража имущества', 'наказывается лишением свободы', 'отпуск', 'хищение'])
+def test_scores_match_brute_force(query):
+    index = BM25Index.build(DOC_IDS, TEXTS)
+    expected = brute_force(query)
+    found = index.search(query, len(TEXTS))
+    assert [doc_id for doc_id, _ in found] == sorted(expected, key=expected.get, reverse=True)
+    for doc_id, score in found:
+        assert score == pytest.approx(expected[doc_id], rel=1e-5)
+
+
+def test_unknown_terms_and_k():
+    index = BM25Index.build(DOC_IDS, TEXTS)
+    assert index.search('налог', 5) == []
+    assert index.search('кража', 0) == []
+    assert len(index.search('наказывается', 1)) == 1
+
+
+def test_saved_index_gives_the_same_results(tmp_path):
+    index = BM25Index.build(DOC_IDS, TEXTS)
+    index.save(str(tmp_path / 'bm25'))
+    loaded = BM25Index.load(str(tmp_path / 'bm25'))
+    assert len(loaded) == len(TEXTS)
+    assert loaded.search('кража наказывается', 3) == index.search('кража наказывается', 3)
+
+
+def test_saving_over_a_loaded_index_keeps_it_readable(tmp_path):
+    path = str(tmp_path / 'bm25')
+    BM25Index.build(DOC_IDS, TEXTS).save(path)
+    loaded = BM25Index.load(path)
+    expected = loaded.search('кража наказывается', 3)
+    BM25Index.build(DOC_IDS[:2], TEXTS[:2]).save(path)
+    assert loaded.search('кража наказывается', 3) == expected
+    assert len(BM25Index.load(path)) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['bm25']
@@ -0,0 +1,41 @@
+"""LRU/TTL retrieval cache"""
+import cache
+from cache import LRUCache, normalize_query
+
+
+def test_least_recently_used_entries_are_evicted():
+    lru = LRUCache(2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1  # 'b' is now the oldest
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert lru.stats() == {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_rate': 0.75}
+
+
+def test_expired_entries_are_not_returned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    lru = LRUCache(10, ttl=60)
+    lru.set('a', 1)
+    now[0] += 59
+    assert lru.get('a') == 1
+    now[0] += 2
+    assert lru.get('a', 'missing') == 'missing'
+    assert len(lru) == 0
+
+
+def test_index_change_clears_the_cache():
+    lru = LRUCache(10)
+    lru.validate('index-1')
+    lru.set('a', 1)
+    lru.validate('index-1')
+    assert lru.get('a') == 1
+    lru.validate('index-2')
+    assert lru.get('a') is None
+
+
+def test_trivial_variations_share_a_key():
+    assert normalize_query('  Что такое КРАЖА?! ') == normalize_query('что такое кража')
+    assert normalize_query('Ёлка') == 'елка'
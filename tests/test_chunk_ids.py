@@ -0,0 +1,65 @@
+"""Chunk IDs shared by the FAISS index and the chunk store"""
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from chunk_store import SQLiteDocstore, load_vectorstore, save_vectorstore
+from chunking import chunk_ids
+from vector_index import build_index, delete_chunks
+
+
+def make_store(backend, n=60, dim=8):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    texts = [f'Статья {i}. Текст' for i in range(n)]
+    ids = chunk_ids('Уголовный кодекс.txt', texts)
+    docs = {chunk_id: Document(id=str(chunk_id), page_content=text, metadata={'position': i})
+            for i, (chunk_id, text) in enumerate(zip(ids, texts))}
+    db = FAISS(None, build_index(vectors, backend), InMemoryDocstore(docs), dict(enumerate(ids)))
+    return db, dict(zip(ids, vectors))
+
+
+def test_ids_are_stable_and_content_addressed():
+    texts = ['Статья 1. Кража', 'Статья 2. Грабеж', 'Статья 1. Кража']
+    ids = chunk_ids('Уголовный кодекс.txt', texts)
+    assert ids == chunk_ids('Уголовный кодекс.txt', texts)
+    assert len(set(ids)) == 3  # Repeated text is told apart by occurrence
+    assert all(0 <= chunk_id < 2**63 for chunk_id in ids)
+    # Inserting a chunk in front does not change the IDs of the others
+    assert chunk_ids('Уголовный кодекс.txt', ['Статья 0. Общие'] + texts)[1:] == ids
+    assert chunk_ids('Гражданский кодекс.txt', texts) != ids
+
+
+@pytest.mark.parametrize('backend', ['flat', 'ivf_flat', 'hnsw'])
+def test_deleted_chunks_leave_index_and_docstore(backend):
+    db, vectors = make_store(backend)
+    deleted = list(vectors)[::3]
+    delete_chunks(db, deleted)
+
+    remaining = [chunk_id for chunk_id in vectors if chunk_id not in set(deleted)]
+    assert db.index.ntotal == len(remaining)
+    assert sorted(db.index_to_docstore_id.values()) == sorted(remaining)
+    for chunk_id in deleted:
+        assert not isinstance(db.docstore.search(chunk_id), Document)
+    # Positions still point at the vectors of their chunks
+    for position, chunk_id in db.index_to_docstore_id.items():
+        assert np.allclose(db.index.reconstruct(position), vectors[chunk_id], atol=1e-5)
+
+
+def test_saved_store_keeps_ids_and_chunks(tmp_path):
+    db, vectors = make_store('flat', n=10)
+    save_vectorstore(db, str(tmp_path))
+    loaded = load_vectorstore(str(tmp_path), embeddings=None)
+
+    assert isinstance(loaded.docstore, SQLiteDocstore)
+    assert loaded.index_to_docstore_id == db.index_to_docstore_id
+    chunk_id = db.index_to_docstore_id[4]
+    doc = loaded.docstore.search(chunk_id)
+    assert doc.page_content == 'Статья 4. Текст' and doc.metadata == {'position': 4}
+    assert [int(doc.id) for doc in loaded.docstore.search_many([chunk_id, 12345])] == [chunk_id]
+    assert np.allclose(loaded.index.reconstruct(4), vectors[chunk_id])
+
+    writable = load_vectorstore(str(tmp_path), embeddings=None, writable=True)
+    delete_chunks(writable, [chunk_id])
+    assert writable.index.ntotal == 9 and chunk_id not in writable.index_to_docstore_id.values()
@@ -0,0 +1,63 @@
+"""Structural chunking of law codes"""
+from chunking import chunk_law_text, parse_units, split_span
+
+CODE = '''СЕМЕЙНЫЙ КОДЕКС КЫРГЫЗСКОЙ РЕСПУБЛИКИ
+Вводные положения.
+РАЗДЕЛ I
+Общие положения
+Глава 1. Основные начала
+Статья 1. Основные начала семейного законодательства
+Семья находится под защитой государства.
+Статья 2. Отношения, регулируемые семейным законодательством
+Раздел имущества супругов производится по соглашению.
+Глава 2. Заключение брака
+Статья 3. Порядок заключения брака
+Брак заключается в органах записи актов гражданского состояния.
+РАЗДЕЛ II
+Права супругов
+Глава 3. Личные права
+Статья 4. Равенство супругов
+Супруги равны.
+'''
+
+
+def test_units_follow_section_chapter_and_article_headings():
+    units = parse_units(CODE)
+    assert [unit['article'] for unit in units] == [None, '1', '2', '3', '4']
+    preamble, first, second, third, fourth = units
+    assert CODE[preamble['start']:preamble['end']].startswith('СЕМЕЙНЫЙ КОДЕКС')
+    assert 'РАЗДЕЛ I' not in CODE[preamble['start']:preamble['end']]
+
+    # Headings open the next article's unit
+    assert CODE[first['start']:first['end']].startswith('РАЗДЕЛ I\n')
+    assert first['section'] == 'РАЗДЕЛ I. Общие положения'
+    assert first['chapter'] == 'Глава 1. Основные начала'
+    # "Раздел имущества" in a body line is not a heading
+    assert second['section'] == 'РАЗДЕЛ I. Общие положения'
+    assert 'Раздел имущества' in CODE[second['start']:second['end']]
+    assert CODE[third['start']:third['end']].startswith('Глава 2.')
+    assert third['chapter'] == 'Глава 2. Заключение брака'
+    assert (fourth['section'], fourth['chapter']) == ('РАЗДЕЛ II. Права супругов', 'Глава 3. Личные права')
+    assert units[-1]['end'] == len(CODE)
+
+
+def test_chunks_carry_metadata_and_offsets():
+    chunks = chunk_law_text(CODE, 'Семейный кодекс.txt', 'laws/Семейный кодекс.txt')
+    assert [chunk.metadata.get('article') for chunk in chunks] == [None, '1', '2', '3', '4']
+    for chunk in chunks:
+        metadata = chunk.metadata
+        assert CODE[metadata['start_index']:metadata['end_index']] == chunk.page_content
+        assert metadata['law_name'] == 'Семейный кодекс'
+        assert metadata['source_file'] == 'Семейный кодекс.txt'
+
+
+def test_long_articles_are_split_with_overlap():
+    text = ' '.join(f'Предложение номер {number}.' for number in range(200))
+    spans = split_span(text, 0, len(text), size=300, overlap=50)
+    assert len(spans) > 1
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert end - start <= 300
+        assert text[end - 1] == '.'  # Cut after a sentence
+        assert start < next_start < end  # Neighbours overlap
+        assert text[next_start - 1] == ' '  # at a word boundary
@@ -0,0 +1,82 @@
+"""Token-budgeted context packing"""
+from articles import ArticleIndex
+from chunking import chunk_ids, chunk_law_text
+from context import WHITESPACE, pack_context
+
+FAMILY_CODE = 'Семейный кодекс Кыргызской Республики.txt'
+
+
+def law_text(articles, sentences=20):
+    """A code whose articles each span a couple of chunks"""
+    return ''.join(
+        f'Статья {article}. Заголовок статьи {article}\n'
+        + ' '.join(f'Норма {number} статьи {article} о правах супругов.' for number in range(sentences)) + '\n'
+        for article in articles
+    )
+
+
+def law_chunks(file, articles, sentences=20):
+    docs = chunk_law_text(law_text(articles, sentences), file, f'laws/{file}')
+    for chunk_id, doc in zip(chunk_ids(file, [doc.page_content for doc in docs]), docs):
+        doc.id = chunk_id
+    return docs
+
+
+def test_multi_article_reference_packs_every_article():
+    docs = law_chunks(FAMILY_CODE, ['22', '23', '24', '25'])
+    by_id = {doc.id: doc for doc in docs}
+    chunk_ids_found = ArticleIndex.build((doc.id, doc) for doc in docs).lookup('статьи 22, 23, 24 и 25 Семейного кодекса')
+    found = [by_id[chunk_id] for chunk_id in chunk_ids_found]
+    assert len(found) == len(docs) > 4
+
+    context, sources = pack_context(found, max_per_law=None)
+    assert len(sources) == len(docs)
+    assert {source['article'] for source in sources} == {'22', '23', '24', '25'}
+    for article in ('22', '23', '24', '25'):
+        assert f'Норма 19 статьи {article}' in context
+
+    # The per-law cap applies to search results
+    _, sources = pack_context(found)
+    assert len(sources) == 3
+
+
+def test_only_adjacent_pieces_of_an_article_share_a_line():
+    docs = law_chunks(FAMILY_CODE, ['22'], sentences=40)
+    assert len(docs) >= 3
+
+    context, _ = pack_context(docs[:2])
+    assert context.count('\n') == 1 and '…' not in context
+
+    context, _ = pack_context([docs[0], docs[2]])
+    lines = context.split('\n')
+    assert len(lines) == 3 and lines[2].startswith('[Статья 22] … ')
+
+
+def test_overlapping_text_is_packed_once():
+    docs = law_chunks(FAMILY_CODE, ['22'], sentences=40)
+    first, second = docs[0], docs[1]
+    assert second.metadata['start_index'] < first.metadata['end_index']
+
+    context, sources = pack_context([second, first])
+    overlap = law_text(['22'], 40)[second.metadata['start_index']:first.metadata['end_index']].strip()
+    assert context.count(overlap) == 1
+    # The chunk packed first keeps its text; the other loses the shared part
+    assert sources[0]['start_index'] == second.metadata['start_index']
+    assert sources[1]['end_index'] == second.metadata['start_index']
+
+
+def test_budget_limits_packed_chunks():
+    docs = law_chunks(FAMILY_CODE, ['22', '23', '24', '25'])
+    _, sources = pack_context(docs, budget=400, max_per_law=None)
+    assert 0 < len(sources) < len(docs)
+    assert sum(source['tokens'] for source in sources) <= 400
+
+    # The best chunk is kept even when it alone exceeds the budget, cut to fit
+    context, sources = pack_context(docs, budget=50)
+    assert len(sources) == 1 and sources[0]['tokens'] <= 50
+    assert context.startswith('=== Семейный кодекс Кыргызской Республики ===\nСтатья 22.')
+    # Its source covers only the packed text
+    start, end = sources[0]['start_index'], sources[0]['end_index']
+    assert start == docs[0].metadata['start_index'] < end < docs[0].metadata['end_index']
+    packed = WHITESPACE.sub(' ', law_text(['22', '23', '24', '25'])[start:end]).strip()
+    assert context.endswith('\n' + packed)
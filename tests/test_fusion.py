@@ -0,0 +1,43 @@
+"""Score fusion of vector and BM25 results"""
+import pytest
+from fusion import BM25_WEIGHT, VECTOR_WEIGHT, candidate_pool, fuse, min_max, reciprocal_rank_fusion
+
+
+def test_rrf_deduplicates_by_chunk_id():
+    fused = fuse([[1, 2, 3], [2, 1]], {}, [(3, 9.0), (4, 5.0)], method='rrf')
+    chunk_ids = [chunk_id for chunk_id, _ in fused]
+    assert sorted(chunk_ids) == [1, 2, 3, 4]
+    # Near the top of both vector rankings outranks BM25's top hit
+    assert set(chunk_ids[:2]) == {1, 2} and chunk_ids[-1] == 4
+
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([[1, 2], [2]], [0.5, 1.0], k=60)
+    assert fused == pytest.approx({1: 0.5 / 61, 2: 0.5 / 62 + 1.0 / 61})
+
+
+def test_weighted_fusion_uses_normalized_scores():
+    fused = dict(fuse([[1, 2]], {1: 0.9, 2: 0.5}, [(2, 10.0), (3, 4.0)], method='weighted'))
+    assert fused == pytest.approx({1: VECTOR_WEIGHT, 2: BM25_WEIGHT, 3: 0.0})
+    assert min_max({1: 5.0, 2: 5.0}) == {1: 1.0, 2: 1.0}
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        fuse([[1]], {}, [], method='concat')
+
+
+def test_candidate_pool_keeps_at_least_k():
+    fused = [(1, 1.0), (2, 0.5), (3, 0.1), (4, 0.05)]
+    assert candidate_pool(fused, 1, max_size=10, min_ratio=0.25, method='weighted') == [1, 2]
+    assert candidate_pool(fused, 3, max_size=10, min_ratio=0.25, method='weighted') == [1, 2, 3]
+    assert candidate_pool(fused, 1, max_size=1, min_ratio=0.0, method='weighted') == [1]
+    assert candidate_pool([], 3) == []
+
+
+def test_rrf_pool_is_cut_by_rank():
+    # Disjoint lists: every RRF score is within 4x of the best, so a ratio keeps them all
+    fused = fuse([list(range(100, 108))], {}, [(chunk_id, 1.0) for chunk_id in range(16)], method='rrf')
+    assert min(score for _, score in fused) * 4 > fused[0][1]
+    assert candidate_pool(fused, 2, max_size=5, method='rrf') == [chunk_id for chunk_id, _ in fused[:5]]
+    assert len(candidate_pool(fused, 8, max_size=5, method='rrf')) == 8
@@ -0,0 +1,36 @@
+"""Append-only build checkpoint"""
+import numpy as np
+from ingestion import BuildCheckpoint
+
+
+def add(checkpoint, file, ids, dim=4):
+    vectors = [np.full(dim, chunk_id, dtype=np.float32) for chunk_id in ids]
+    checkpoint.add_file(file, f'hash-{file}', ids, [f'text {i}' for i in ids], [{'source_file': file}] * len(ids), vectors)
+
+
+def test_checkpoint_resumes_and_merges(tmp_path):
+    checkpoint = BuildCheckpoint(str(tmp_path))
+    checkpoint.set_chunker('v1')
+    add(checkpoint, 'a.txt', [1, 2])
+    add(checkpoint, 'b.txt', [3])
+    checkpoint.close()
+
+    checkpoint = BuildCheckpoint(str(tmp_path))
+    manifest = checkpoint.manifest()
+    assert manifest == {'chunker': 'v1', 'files': {'a.txt': {'hash': 'hash-a.txt', 'chunk_ids': [1, 2]},
+                                                   'b.txt': {'hash': 'hash-b.txt', 'chunk_ids': [3]}}}
+
+    checkpoint.remove_files(['a.txt'])
+    add(checkpoint, 'c.txt', [4, 5])
+    db = checkpoint.to_vectorstore(embeddings=None)
+    checkpoint.close()
+
+    assert db.index_to_docstore_id == {0: 3, 1: 4, 2: 5}
+    assert db.docstore.search(4).page_content == 'text 4'
+    assert db.index.reconstruct(2).tolist() == [5.0] * 4
+
+
+def test_empty_checkpoint_has_no_vectorstore(tmp_path):
+    checkpoint = BuildCheckpoint(str(tmp_path))
+    assert checkpoint.to_vectorstore(embeddings=None) is None
+    checkpoint.close()
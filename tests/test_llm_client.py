@@ -0,0 +1,72 @@
+"""Shared LLM client: sync use, retries and circuit breaking"""
+import asyncio
+import pytest
+import llm_client
+
+
+class LoopBoundModel:
+    """Like the Gemini async client: unusable on any loop but the first it ran on"""
+
+    def __init__(self, temperature):
+        self.loop = None
+
+    async def generate_content_async(self, prompt, stream=False):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif loop is not self.loop:
+            raise RuntimeError('attached to a different loop')
+        return type('Response', (), {'text': f'answer to {prompt}'})()
+
+
+def test_sync_calls_reuse_pooled_models(monkeypatch):
+    monkeypatch.setattr(llm_client, 'create_model', LoopBoundModel)
+    client = llm_client.LLMClient()
+    assert llm_client.run_sync(client.generate('first', 0.1)) == 'answer to first'
+    assert llm_client.run_sync(client.generate('second', 0.1)) == 'answer to second'
+    # An async caller on its own loop gets its own models
+    assert asyncio.run(client.generate('third', 0.1)) == 'answer to third'
+    assert client.stats()['failed'] == 0
+
+
+class BlockedModel:
+    """Answers whose text is blocked, as Gemini reports a safety block"""
+
+    def __init__(self, temperature):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        return BlockedResponse()
+
+
+class BlockedResponse:
+    @property
+    def text(self):
+        raise ValueError('finish_reason is SAFETY')
+
+    async def __aiter__(self):
+        yield self
+
+
+def test_blocked_answers_are_not_retried_and_keep_the_circuit_closed(monkeypatch):
+    monkeypatch.setattr(llm_client, 'create_model', BlockedModel)
+    client = llm_client.LLMClient()
+
+    async def ask(prompt):
+        with pytest.raises(llm_client.LLMUnavailable):
+            await client.generate(prompt, 0.1)
+        with pytest.raises(llm_client.LLMUnavailable):
+            async for _ in client.stream(prompt, 0.1):
+                pass
+
+    async def run():
+        for i in range(llm_client.CIRCUIT_FAILURE_THRESHOLD + 1):
+            await ask(f'question {i}')
+    asyncio.run(run())
+
+    stats = client.stats()
+    assert stats['circuit'] == 'closed'
+    assert client.breaker.failures == 0
+    assert stats['retries'] == 0 and stats['short_circuited'] == 0
+    assert stats['calls'] == 2 * (llm_client.CIRCUIT_FAILURE_THRESHOLD + 1)
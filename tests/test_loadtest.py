@@ -0,0 +1,73 @@
+"""Fake LLM failure injection and load test stream parsing"""
+import asyncio
+import json
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import fake_llm
+from fake_llm import FakeGenerativeModel, FakeLLMError, canned_answer
+from loadtest import ask
+
+PROMPT = 'The question is asked in: Russian\n=== Уголовный кодекс ===\n[Статья 205] Кража\nQUESTION: Что такое кража?'
+
+
+@pytest.fixture
+def instant(monkeypatch):
+    for name in ('first_token_ms', 'token_ms', 'error_rate', 'stream_error_rate'):
+        monkeypatch.setitem(fake_llm.settings, name, 0)
+
+
+def test_fake_model_streams_the_canned_answer(instant):
+    answer = canned_answer(PROMPT)
+    assert 'статья 205 (Уголовный кодекс): Что такое кража?' in answer
+    response = FakeGenerativeModel().generate_content(PROMPT, stream=True)
+    assert ''.join(chunk.text for chunk in response) == answer
+
+
+def test_injected_failures(instant):
+    model = FakeGenerativeModel()
+    fake_llm.configure(error_rate=1)
+    with pytest.raises(FakeLLMError):
+        model.generate_content(PROMPT)
+
+    fake_llm.configure(error_rate=0, stream_error_rate=1)
+    # Complete answers are unaffected; streams fail after their first token
+    assert model.generate_content(PROMPT).text == canned_answer(PROMPT)
+
+    async def stream():
+        tokens = []
+        with pytest.raises(FakeLLMError):
+            async for chunk in await model.generate_content_async(PROMPT, stream=True):
+                tokens.append(chunk.text)
+        return tokens
+    assert 1 <= len(asyncio.run(stream())) < len(canned_answer(PROMPT).split())
+
+    with pytest.raises(ValueError):
+        fake_llm.configure(error_rat=0.5)
+
+
+def sse(*events):
+    return ''.join(f'event: {event}\ndata: {json.dumps(data)}\n\n' for event, data in events)
+
+
+@pytest.mark.parametrize('status, body, outcome', [
+    (200, sse(('stage', 'retrieval'), ('token', 'Кража'), ('done', {'cached': True})), ('ok', True)),
+    (200, sse(('token', 'Статья'), ('done', {'fallback': True})), ('fallback', False)),
+    (200, sse(('token', 'Кра'), ('error', {'error': 'LLM failed'}), ('done', {})), ('error', False)),
+    (200, sse(('token', 'Кра')), ('error', False)),
+    (503, '', ('busy', False)),
+])
+def test_ask_reads_the_outcome_from_the_event_stream(status, body, outcome):
+    async def answer_stream(request):
+        return web.Response(status=status, text=body, content_type='text/event-stream')
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/answer/stream', answer_stream)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            return await ask(session, str(server.make_url('')).rstrip('/'), 'кража')
+    result = asyncio.run(run())
+
+    assert (result['status'], result['cached']) == outcome
+    assert (result['ttft'] is not None) == (result['latency'] is not None) == (status == 200)
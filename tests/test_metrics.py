@@ -0,0 +1,53 @@
+"""Latency histograms and the Prometheus export"""
+import pytest
+import metrics
+from metrics import Histogram
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_bucket_bounds_are_inclusive():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 2, 5, 7):
+        histogram.observe(value)
+    # le="1" counts 0.5 and 1, le="2" adds 1.5 and 2, le="5" adds 5, +Inf adds 7
+    assert histogram.bucket_counts == [2, 2, 1, 1]
+    assert histogram.count == 6 and histogram.sum == 17
+    assert metrics._format_histogram('x', histogram) == [
+        'x_bucket{le="1"} 2', 'x_bucket{le="2"} 4', 'x_bucket{le="5"} 5', 'x_bucket{le="+Inf"} 6',
+        'x_sum 17.0', 'x_count 6',
+    ]
+
+
+def test_prometheus_text_exports_every_metric():
+    metrics.record_stage('rerank', 0.03)
+    metrics.record_stage('rerank', 0.2)
+    metrics.record_prompt_tokens(1200)
+    metrics.record_cache('answer', hit=True)
+    metrics.record_cache('answer', hit=False)
+    metrics.record_cache('answer', hit=False)
+    metrics.record_fallback(partial=True)
+
+    lines = metrics.prometheus_text().splitlines()
+    assert '# TYPE rag_stage_seconds histogram' in lines
+    assert 'rag_stage_seconds_bucket{stage="rerank",le="0.025"} 0' in lines
+    assert 'rag_stage_seconds_bucket{stage="rerank",le="0.05"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="rerank",le="+Inf"} 2' in lines
+    assert 'rag_stage_seconds_count{stage="rerank"} 2' in lines
+    assert 'rag_prompt_tokens_bucket{le="1500"} 1' in lines
+    assert 'rag_prompt_tokens_bucket{le="1000"} 0' in lines
+    assert 'rag_cache_requests_total{cache="answer",result="hit"} 1' in lines
+    assert 'rag_cache_requests_total{cache="answer",result="miss"} 2' in lines
+    assert 'rag_fallback_answers_total{kind="context"} 0' in lines
+    assert 'rag_fallback_answers_total{kind="partial"} 1' in lines
+    # Every sample line belongs to a metric announced with HELP and TYPE
+    announced = {line.split()[2] for line in lines if line.startswith('# TYPE')}
+    for line in lines:
+        if not line.startswith('#'):
+            name = line.split('{')[0].split()[0]
+            assert name.removesuffix('_bucket').removesuffix('_sum').removesuffix('_count') in announced
@@ -0,0 +1,42 @@
+"""Batched MMR search over query expansions"""
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import retrieval
+from retrieval import batched_mmr_search
+
+
+def make_store(n=60, dim=16):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    ids = [5000 + i for i in range(n)]
+    docs = {chunk_id: Document(id=str(chunk_id), page_content=str(chunk_id)) for chunk_id in ids}
+    return FAISS(None, index, InMemoryDocstore(docs), dict(enumerate(ids))), vectors
+
+
+@pytest.mark.parametrize('lambda_mult', [0.5, 0.8])
+def test_batched_search_matches_langchain_per_query(monkeypatch, lambda_mult):
+    db, vectors = make_store()
+    rng = np.random.default_rng(2)
+    queries = (vectors[[3, 17, 40]] + rng.normal(0, 0.3, (3, vectors.shape[1]))).astype(np.float32)
+    monkeypatch.setattr(retrieval, 'embed_queries', lambda texts: queries[:len(texts)])
+
+    rankings, relevance, query_vector = batched_mmr_search(db, ['q1', 'q2', 'q3'], k=5, fetch_k=10, lambda_mult=lambda_mult)
+
+    for query, ranking in zip(queries, rankings):
+        expected = db.max_marginal_relevance_search_by_vector(query.tolist(), k=5, fetch_k=10, lambda_mult=lambda_mult)
+        assert ranking == [int(doc.page_content) for doc in expected]
+
+    # Every candidate fetched for any query has its similarity with the first query
+    _, fetched = db.index.search(queries, 10)
+    assert set(relevance) == {db.index_to_docstore_id[int(i)] for i in fetched.ravel()}
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for position, chunk_id in db.index_to_docstore_id.items():
+        if chunk_id in relevance:
+            assert relevance[chunk_id] == pytest.approx(float(unit[position] @ query_vector), abs=1e-5)
+    assert np.linalg.norm(query_vector) == pytest.approx(1.0)
@@ -0,0 +1,66 @@
+"""Tolerance checks of the quantized ONNX models"""
+import json
+import numpy as np
+import pytest
+import onnx_backend
+from onnx_backend import check_embedder, check_reranker, within_tolerance
+
+QUESTIONS = ['кража', 'грабеж']
+PASSAGES = [f'passage {i}' for i in range(12)]
+
+
+class StubEmbeddings:
+    def __init__(self, noise=0.0):
+        self.noise = noise
+
+    def embed_documents(self, texts):
+        rng = np.random.default_rng(0)
+        vectors = np.stack([np.random.default_rng(len(text) * 31 + sum(map(ord, text))).normal(size=16)
+                            for text in texts])
+        return vectors + rng.normal(0, self.noise, vectors.shape)
+
+
+class StubCrossEncoder:
+    def __init__(self, reverse=False):
+        self.reverse = reverse
+
+    def predict(self, pairs):
+        scores = np.array([float(passage.split()[-1]) for _, passage in pairs], dtype=np.float32)
+        return -scores if self.reverse else scores
+
+
+def test_identical_models_are_within_tolerance():
+    report = check_embedder(StubEmbeddings(), StubEmbeddings(), QUESTIONS, PASSAGES)
+    assert report == {'min_cosine': 1.0, 'mean_cosine': 1.0, 'top_k_overlap': 1.0}
+    assert within_tolerance(report)
+    assert within_tolerance(check_reranker(StubCrossEncoder(), StubCrossEncoder(), QUESTIONS, PASSAGES))
+
+
+def test_drifted_models_are_outside_tolerance():
+    report = check_embedder(StubEmbeddings(), StubEmbeddings(noise=1.0), QUESTIONS, PASSAGES)
+    assert report['min_cosine'] < 0.98 and not within_tolerance(report)
+    report = check_reranker(StubCrossEncoder(), StubCrossEncoder(reverse=True), QUESTIONS, PASSAGES)
+    assert report == {'top_k_overlap': 0.0} and not within_tolerance(report)
+
+
+@pytest.mark.parametrize('report, usable', [
+    ({'top_k_overlap': 0.9}, True),
+    ({'top_k_overlap': 0.5}, False),
+    (None, False),
+])
+def test_reranker_falls_back_to_the_float_model(tmp_path, monkeypatch, report, usable):
+    report_path = tmp_path / 'tolerance.json'
+    if report is not None:
+        report_path.write_text(json.dumps(report), encoding='utf-8')
+    else:
+        # No saved report and the check cannot run
+        def sample_passages():
+            raise FileNotFoundError('laws')
+        monkeypatch.setattr(onnx_backend, 'sample_passages', sample_passages)
+    monkeypatch.setattr(onnx_backend, '_report_path', lambda kind: str(report_path))
+    model = object()
+    monkeypatch.setattr(onnx_backend, 'OnnxCrossEncoder', lambda: model)
+
+    assert (onnx_backend.get_onnx_reranker() is model) == usable
+    # A failed check leaves no report, so it is retried next time
+    assert report_path.exists() == (report is not None)
@@ -0,0 +1,75 @@
+"""Stage limits and retrieval stage events"""
+import asyncio
+import threading
+import pytest
+import pipeline
+from pipeline import Overloaded, StageLimit
+
+
+def test_requests_beyond_the_waiting_limit_are_rejected():
+    async def run():
+        limit = StageLimit('test', 1, max_pending=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limit:
+                await release.wait()
+
+        first = asyncio.create_task(hold())
+        second = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert limit.stats() == {'limit': 1, 'waiting': 1, 'locked': True}
+        with pytest.raises(Overloaded):
+            await limit.acquire()
+        release.set()
+        await asyncio.gather(first, second)
+        assert limit.stats() == {'limit': 1, 'waiting': 0, 'locked': False}
+    asyncio.run(run())
+
+
+def test_stage_events_come_before_the_result(monkeypatch):
+    def get_message_content(question, db, k, on_stage):
+        for stage in ('article_lookup', 'vector_search', 'rerank'):
+            on_stage(stage)
+        return 'context', [], False
+
+    monkeypatch.setattr(pipeline, 'get_message_content', get_message_content)
+    monkeypatch.setattr(pipeline, 'retrieval_limit', StageLimit('retrieval', 1))
+
+    async def run():
+        return [event async for event in pipeline.retrieve_stream('кража', db=None, k=3)]
+    assert asyncio.run(run()) == [('stage', 'article_lookup'), ('stage', 'vector_search'), ('stage', 'rerank'),
+                                  ('result', ('context', [], False))]
+
+
+def test_cancelled_request_holds_its_slot_until_the_job_ends(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def get_message_content(question, db, k, on_stage):
+        started.set()
+        finish.wait(5)
+        return 'context', [], False
+
+    limit = StageLimit('retrieval', 1)
+    monkeypatch.setattr(pipeline, 'get_message_content', get_message_content)
+    monkeypatch.setattr(pipeline, 'retrieval_limit', limit)
+
+    async def run():
+        task = asyncio.create_task(pipeline.retrieve('кража', db=None, k=3))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The job is still running on the CPU pool, so its slot stays taken
+        await asyncio.sleep(0.05)
+        assert limit.stats()['locked']
+        finish.set()
+        for _ in range(100):
+            if not limit.stats()['locked']:
+                break
+            await asyncio.sleep(0.01)
+        assert not limit.stats()['locked']
+    try:
+        asyncio.run(run())
+    finally:
+        finish.set()
@@ -0,0 +1,108 @@
+"""Rerank gating and the cross-encoder score cache"""
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import reranker
+import retrieval
+from cache import LRUCache
+from retrieval import _rerank_gate
+
+
+def candidates(*chunk_ids):
+    return [(chunk_id, Document(page_content=f'chunk {chunk_id}')) for chunk_id in chunk_ids]
+
+
+def test_decisive_top_k_skips_reranking():
+    path, gated = _rerank_gate(candidates(1, 2, 3, 4), {1: 0.9, 2: 0.85, 3: 0.5, 4: 0.4}, k=2)
+    assert path == 'skip' and [chunk_id for chunk_id, _ in gated] == [1, 2]
+
+
+def test_far_candidates_are_not_reranked():
+    path, gated = _rerank_gate(candidates(1, 2, 3, 4), {1: 0.9, 2: 0.85, 3: 0.8, 4: 0.5}, k=2)
+    assert path == 'truncate' and [chunk_id for chunk_id, _ in gated] == [1, 2, 3]
+
+
+def test_close_candidates_are_all_reranked():
+    path, gated = _rerank_gate(candidates(1, 2, 3, 4), {1: 0.9, 2: 0.85, 3: 0.8, 4: 0.75}, k=2)
+    assert path == 'full' and len(gated) == 4
+
+
+def test_candidate_without_a_vector_score_forces_rerank():
+    path, gated = _rerank_gate(candidates(1, 2, 3, 5), {1: 0.9, 2: 0.85, 3: 0.5}, k=2)
+    assert path != 'skip' and 5 in [chunk_id for chunk_id, _ in gated]
+
+
+def make_store():
+    vectors = np.array([[1, 0.05, 0, 0], [1, 0, 0.1, 0]] + [[0.2, 0, 0.1 * i, 1] for i in range(7)] + [[0, 1, 0, 0]],
+                       dtype=np.float32)
+    index = faiss.IndexFlatL2(4)
+    index.add(vectors)
+    ids = [1000 + i for i in range(len(vectors))]
+    docs = {chunk_id: Document(id=str(chunk_id), page_content=f'chunk {chunk_id}') for chunk_id in ids}
+    return FAISS(None, index, InMemoryDocstore(docs), dict(enumerate(ids))), ids
+
+
+def test_bm25_only_candidates_get_a_vector_score(monkeypatch):
+    db, ids = make_store()
+    paths = []
+    monkeypatch.setattr(retrieval, 'embed_queries', lambda queries: [[1.0, 0.0, 0.0, 0.0]] * len(queries))
+    monkeypatch.setattr(retrieval, 'get_bm25_index', lambda db: SimpleNamespace(search=lambda query, k: [(ids[9], 5.0)]))
+    monkeypatch.setattr(retrieval, 'get_reranker', lambda: object())
+    monkeypatch.setattr(retrieval, 'record_rerank_path', paths.append)
+    monkeypatch.setattr(retrieval, 'rerank_candidates', lambda topic, gated: pytest.fail('reranked'))
+
+    docs = retrieval.search_documents('кража', db, k=2)
+    assert paths == ['skip']
+    assert docs[0].id == str(ids[0])
+    assert retrieval.vector_relevance(db, np.array([1, 0, 0, 0], dtype=np.float32), [ids[9], 42]) == {ids[9]: 0.0}
+
+
+def test_scores_are_cached_until_the_index_changes(monkeypatch):
+    scored = []
+
+    def rerank_scores(pairs):
+        scored.extend(pairs)
+        return [len(passage) for _, passage in pairs]
+
+    fingerprint = ['index-1']
+    monkeypatch.setattr(reranker, 'score_cache', LRUCache(100))
+    monkeypatch.setattr(reranker, 'rerank_scores', rerank_scores)
+    monkeypatch.setattr(reranker, 'get_index_fingerprint', lambda: fingerprint[0])
+
+    first = reranker.rerank_candidates('Что такое кража?', candidates(1, 2))
+    assert len(scored) == 2
+    # Same normalized question: served from the cache, plus one new chunk
+    assert reranker.rerank_candidates('что такое кража', candidates(2, 1, 3))[:2] == first[::-1]
+    assert len(scored) == 3
+
+    fingerprint[0] = 'index-2'
+    reranker.rerank_candidates('Что такое кража?', candidates(1, 2))
+    assert len(scored) == 5
+
+
+class StubCrossEncoder:
+    """Scores a pair by passage length and records each predict call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.calls.append((len(pairs), batch_size))
+        return np.array([len(passage) for _, passage in pairs], dtype=np.float32)
+
+
+def test_service_scores_concurrent_requests_in_one_batch():
+    model = StubCrossEncoder()
+    service = reranker.RerankService(model, max_batch_size=16, max_wait_ms=100)
+    requests = [[['кража', 'a' * n] for n in range(start, start + 3)] for start in (1, 10, 20)]
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(service.score, requests))
+
+    assert [list(scores) for scores in results] == [[1, 2, 3], [10, 11, 12], [20, 21, 22]]
+    assert model.calls == [(9, 9)]
+    assert service.stats()['batches'] == 1
@@ -0,0 +1,66 @@
+"""Concurrent self-consistency generation"""
+import asyncio
+import generation
+from generation import answer_similarity, self_consistent_answer_async, vote
+
+THEFT = 'Кража наказывается штрафом или лишением свободы на срок до трех лет.'
+THEFT_REWORDED = 'Кража наказывается штрафом или лишением свободы на срок до пяти лет.'
+ROBBERY = 'Грабеж наказывается исправительными работами.'
+
+
+class StubClient:
+    """Answers each temperature with (delay in seconds, text or exception)"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.cancelled = []
+
+    async def generate(self, prompt, temperature):
+        delay, reply = self.replies[temperature]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(temperature)
+            raise
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def run(monkeypatch, replies, **kwargs):
+    client = StubClient(replies)
+    monkeypatch.setattr(generation, 'get_llm_client', lambda: client)
+
+    async def main():
+        answer = await self_consistent_answer_async('prompt', temperatures=list(replies), **kwargs)
+        # Let cancelled variants finish, before asyncio.run would cancel them itself
+        await asyncio.sleep(0)
+        return answer, list(client.cancelled)
+    return asyncio.run(main())
+
+
+def test_votes_count_answers_above_the_agreement_threshold():
+    assert answer_similarity(THEFT, THEFT_REWORDED) >= 0.6 > answer_similarity(THEFT, ROBBERY)
+    assert vote([ROBBERY, THEFT, THEFT_REWORDED], threshold=0.6) == (1, 2)
+    # Without agreement the earliest answer wins
+    assert vote([ROBBERY, THEFT], threshold=0.6) == (0, 1)
+    assert vote([THEFT, THEFT_REWORDED], threshold=1.0) == (0, 1)
+
+
+def test_majority_stops_early_and_cancels_the_rest(monkeypatch):
+    answer, cancelled = run(monkeypatch, {0.1: (0.01, THEFT), 0.2: (0.02, THEFT_REWORDED), 0.3: (30, ROBBERY)})
+    assert answer == THEFT
+    assert cancelled == [0.3]
+
+
+def test_deadline_votes_on_answers_received(monkeypatch):
+    answer, cancelled = run(monkeypatch, {0.1: (0.01, ROBBERY), 0.2: (30, THEFT), 0.3: (30, THEFT)}, deadline=0.1)
+    assert answer == ROBBERY
+    assert sorted(cancelled) == [0.2, 0.3]
+
+
+def test_failed_variants_are_skipped(monkeypatch):
+    answer, _ = run(monkeypatch, {0.1: (0, RuntimeError('quota')), 0.2: (0.01, THEFT), 0.3: (0.02, ROBBERY)})
+    assert answer == THEFT
+    answer, _ = run(monkeypatch, {0.1: (0, RuntimeError('quota')), 0.2: (0, '')})
+    assert answer is None
@@ -0,0 +1,75 @@
+"""Semantic answer cache matching"""
+import os
+import numpy as np
+import generation
+import semantic_cache
+from semantic_cache import SemanticCache, question_numbers
+
+
+def make_cache(tmp_path):
+    return SemanticCache(str(tmp_path), threshold=0.9, max_size=10)
+
+
+def test_question_numbers_are_normalized():
+    assert question_numbers('статья 240¹ УК, 2024 год') == ['2024', '240-1']
+    assert question_numbers('What does article 45 say?') == ['45']
+    assert question_numbers('Что такое кража?') == []
+
+
+def test_article_number_variants_do_not_share_answers(tmp_path):
+    cache = make_cache(tmp_path)
+    vector = np.ones(8, dtype=np.float32)
+    cache.add(vector, 'Что говорит статья 45 Трудового кодекса?', 'Russian', 'answer 45',
+              question_numbers('Что говорит статья 45 Трудового кодекса?'))
+
+    # Identical embeddings: only the article number differs
+    assert cache.lookup(vector, 'Russian', question_numbers('Что говорит статья 46 Трудового кодекса?')) is None
+    assert cache.lookup(vector, 'Russian', question_numbers('Что говорит статья 45 Трудового кодекса?'))['answer'] == 'answer 45'
+
+
+def test_numbers_survive_reload(tmp_path):
+    cache = make_cache(tmp_path)
+    vector = np.ones(8, dtype=np.float32)
+    cache.add(vector, 'Штраф в 2023 году', 'Russian', 'answer', ['2023'])
+    cache.flush()
+    reloaded = make_cache(tmp_path)
+    assert reloaded.lookup(vector, 'Russian', ['2024']) is None
+    assert reloaded.lookup(vector, 'Russian', ['2023']) is not None
+
+
+def test_article_references_skip_the_semantic_cache():
+    assert not generation._semantic_cacheable('статья 45 Трудового кодекса', '')
+    assert not generation._semantic_cacheable('article 10 of the Criminal Code', '')
+    assert generation._semantic_cacheable('What is the punishment for theft?', '')
+    assert not generation._semantic_cacheable('What is the punishment for theft?', 'User: hi\n')
+
+
+def test_answers_are_saved_in_batches(tmp_path):
+    cache = SemanticCache(str(tmp_path), threshold=0.9, max_size=10, save_interval=3600)
+    cache.add(np.ones(8, dtype=np.float32), 'Что такое кража?', 'Russian', 'answer', [])
+    assert not os.path.exists(tmp_path / 'entries.json')
+    cache.flush()
+    assert len(make_cache(tmp_path)) == 1
+
+
+def test_unknown_index_fingerprint_keeps_the_cache(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    cache.validate('index-1')
+    cache.add(np.ones(8, dtype=np.float32), 'Что такое кража?', 'Russian', 'answer', [])
+    cache.flush()
+
+    monkeypatch.setattr(semantic_cache, '_semantic_cache', None)
+    monkeypatch.setattr(semantic_cache, 'SEMANTIC_CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(semantic_cache, 'get_index_fingerprint', lambda: None)
+    assert len(semantic_cache.get_semantic_cache()) == 1
+    assert len(make_cache(tmp_path)) == 1
+
+
+def test_context_and_sources_survive_reload(tmp_path):
+    cache = make_cache(tmp_path)
+    vector = np.ones(8, dtype=np.float32)
+    sources = [{'chunk_id': 7, 'article': '158', 'tokens': 120}]
+    cache.add(vector, 'Что такое кража?', 'Russian', 'answer', [], context='=== УК ===\nСтатья 158', sources=sources)
+    cache.flush()
+    entry = make_cache(tmp_path).lookup(vector, 'Russian', [])
+    assert entry['context'] == '=== УК ===\nСтатья 158' and entry['sources'] == sources
@@ -0,0 +1,81 @@
+"""Coalescing of identical in-flight requests"""
+import asyncio
+from singleflight import FlightCancelled, SingleFlight
+
+
+async def slow_source(log):
+    log.append('started')
+    for i in range(3):
+        await asyncio.sleep(0.01)
+        yield i
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_identical_requests_share_one_flight():
+    async def run():
+        flights, log = SingleFlight('test'), []
+        results = await asyncio.gather(*(collect(flights.stream('key', lambda: slow_source(log))) for _ in range(5)))
+        return results, log, flights.stats()
+    results, log, stats = asyncio.run(run())
+    assert results == [[0, 1, 2]] * 5
+    assert log == ['started']
+    assert stats == {'flights': 1, 'joined': 4, 'in_flight': 0}
+
+
+def test_cancelling_the_first_caller_keeps_the_flight_for_joined_ones():
+    async def run():
+        flights, log = SingleFlight('test'), []
+        first = asyncio.create_task(collect(flights.stream('key', lambda: slow_source(log))))
+        await asyncio.sleep(0.015)
+        joined = flights.stream('key', lambda: slow_source(log))
+        first.cancel()
+        # The first caller is gone before the joined one starts iterating
+        await asyncio.gather(first, return_exceptions=True)
+        return await collect(joined), log
+    items, log = asyncio.run(run())
+    assert items == [0, 1, 2]
+    assert log == ['started']
+
+
+def test_cancelled_flight_is_an_error_for_subscribers():
+    async def run():
+        flights = SingleFlight('test')
+        first = flights.stream('key', lambda: slow_source([]))
+        second = flights.stream('key', lambda: slow_source([]))
+        await asyncio.sleep(0.015)
+        next(iter(flights._flights.values())).task.cancel()
+        return await asyncio.gather(collect(first), collect(second), return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(result, FlightCancelled) for result in results)
+
+
+def test_errors_reach_every_subscriber():
+    async def failing():
+        yield 1
+        raise ValueError('boom')
+
+    async def run():
+        flights = SingleFlight('test')
+        return await asyncio.gather(*(collect(flights.stream('key', failing)) for _ in range(3)), return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_subscriber_that_never_iterates_does_not_keep_the_flight():
+    async def run():
+        flights, log = SingleFlight('test'), []
+        first = flights.stream('key', lambda: slow_source(log))
+        flight = flights._flights['key']
+        idle = flights.stream('key', lambda: slow_source(log))
+        closed = flights.stream('key', lambda: slow_source(log))
+        await closed.aclose()
+        assert await first.__anext__() == 0
+        del idle
+        await first.aclose()
+        await asyncio.wait([flight.task])
+        await asyncio.sleep(0)
+        return flight.task.cancelled(), flights.stats()
+    assert asyncio.run(run()) == (True, {'flights': 1, 'joined': 2, 'in_flight': 0})
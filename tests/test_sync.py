@@ -0,0 +1,88 @@
+"""Incremental sync of the knowledge base with the law files"""
+import hashlib
+import os
+import numpy as np
+import pytest
+import database
+from articles import ArticleIndex
+from bm25_index import BM25Index
+from chunk_store import load_vectorstore, save_vectorstore
+from chunking import chunk_ids, chunk_law_text
+from ingestion import load_manifest
+from vector_index import convert_vectorstore, index_backend
+
+
+class FakeEmbeddings:
+    """Deterministic vectors derived from the text"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'big')
+        return np.random.default_rng(seed).normal(size=8).astype(np.float32).tolist()
+
+
+def law(name, *articles):
+    return ''.join(f'Статья {article}. Заголовок\nТекст статьи {article} закона {name} о правах и обязанностях.\n'
+                   for article in articles)
+
+
+def write_laws(laws):
+    for file, text in laws.items():
+        with open(os.path.join('laws', file), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def expected_ids(laws):
+    ids = {}
+    for file, text in laws.items():
+        chunks = chunk_law_text(text, file, os.path.join('laws', file))
+        ids[file] = chunk_ids(file, [chunk.page_content for chunk in chunks])
+    return ids
+
+
+@pytest.mark.parametrize('backend', ['flat', 'hnsw', 'ivf_flat', 'sq8'])
+def test_sync_applies_added_changed_and_removed_files(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(database, 'get_embeddings', lambda: embeddings)
+    monkeypatch.setattr(database, 'INDEX_BACKEND', backend)
+    for name in ('_bm25_cache', '_article_index_cache', '_index_fingerprint'):
+        monkeypatch.setattr(database, name, None)
+
+    os.makedirs('laws')
+    laws = {'a.txt': law('a', 1, 2), 'b.txt': law('b', 1, 2, 3), 'c.txt': law('c', 7)}
+    write_laws(laws)
+    db = database.get_index_db()
+    if backend != 'flat':
+        db = load_vectorstore(database.DB_PATH, embeddings, writable=True)
+        convert_vectorstore(db, backend)
+        save_vectorstore(db, database.DB_PATH)
+
+    laws['b.txt'] = law('b', 1, 2, 3, 4)
+    laws['d.txt'] = law('d', 9, 10)
+    del laws['c.txt']
+    os.remove(os.path.join('laws', 'c.txt'))
+    write_laws({file: laws[file] for file in ('b.txt', 'd.txt')})
+    assert database.sync_index_db()
+    assert not database.sync_index_db()
+
+    ids = expected_ids(laws)
+    all_ids = [chunk_id for file_ids in ids.values() for chunk_id in file_ids]
+    db = load_vectorstore(database.DB_PATH, embeddings)
+    assert index_backend(db.index) == backend
+    assert db.index.ntotal == len(db.index_to_docstore_id) == len(all_ids)
+    assert sorted(db.index_to_docstore_id.values()) == sorted(all_ids)
+    # Each chunk's own vector finds its position, even through lossy sq8 codes
+    for position, chunk_id in db.index_to_docstore_id.items():
+        vector = embeddings.embed_query(db.docstore.search(chunk_id).page_content)
+        _, found = db.index.search(np.array([vector], dtype=np.float32), 1)
+        assert found[0][0] == position
+
+    manifest = load_manifest()
+    assert {file: entry['chunk_ids'] for file, entry in manifest['files'].items()} == ids
+    assert sorted(BM25Index.load(database.BM25_PATH).doc_ids.tolist()) == sorted(all_ids)
+    articles = ArticleIndex.load(database.ARTICLE_INDEX_PATH).articles
+    assert sorted(articles) == ['a.txt', 'b.txt', 'd.txt']
+    assert sorted(articles['b.txt']) == ['1', '2', '3', '4']
@@ -0,0 +1,44 @@
+"""FAISS index backends"""
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from vector_index import convert_vectorstore, evaluate_backends, index_backend
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize('backend', ['ivf_flat', 'hnsw', 'sq8'])
+def test_converted_store_keeps_positions(backend):
+    vectors = random_vectors(200)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    ids = [7000 + i for i in range(len(vectors))]
+    docs = {chunk_id: Document(id=str(chunk_id), page_content=str(chunk_id)) for chunk_id in ids}
+    db = FAISS(None, index, InMemoryDocstore(docs), dict(enumerate(ids)))
+
+    convert_vectorstore(db, backend)
+    assert index_backend(db.index) == backend
+    assert db.index.ntotal == len(vectors)
+    _, found = db.index.search(vectors[:20], 1)
+    assert found[:, 0].tolist() == list(range(20))
+
+
+def test_report_sweeps_search_settings_against_flat():
+    vectors = random_vectors(400)
+    queries = vectors[:30] + np.random.default_rng(1).normal(0, 0.01, (30, 16)).astype(np.float32)
+    report = evaluate_backends(vectors, queries, k=5, backends=('flat', 'ivf_flat', 'hnsw'))
+
+    assert [row['backend'] for row in report if row['backend'] == 'flat'] == ['flat']
+    assert next(row for row in report if row['backend'] == 'flat')['recall_at_k'] == 1.0
+    # 400 vectors give 10 lists, so nprobe stops at 8
+    ivf = [row for row in report if row['backend'] == 'ivf_flat']
+    assert [row['nprobe'] for row in ivf] == [1, 4, 8]
+    assert ivf[0]['recall_at_k'] <= ivf[-1]['recall_at_k']
+    assert [row['ef_search'] for row in report if row['backend'] == 'hnsw'] == [16, 32, 64, 128, 256]
+    for row in report:
+        assert 0 <= row['recall_at_k'] <= 1 and row['index_mb'] > 0
@@ -0,0 +1,191 @@
+"""FAISS index backends for the vector store"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from loguru import logger
+from config import *
+
+INDEX_BACKENDS = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq', 'sq8')
+
+
+def index_backend(index):
+    """Name of the backend an index was built with"""
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'ivf_flat'
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return 'sq8'
+    return 'flat'
+
+
+def create_index(backend, dim, n_vectors):
+    """Create an empty index. All backends use L2 distance like LangChain's default flat index."""
+    if backend == 'flat':
+        return faiss.IndexFlatL2(dim)
+    if backend == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    if backend == 'sq8':
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+
+    # k-means needs about 39 training points per list
+    nlist = max(1, min(IVF_NLIST, n_vectors // 39))
+    quantizer = faiss.IndexFlatL2(dim)
+    if backend == 'ivf_flat':
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    if backend == 'ivf_pq':
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+    raise ValueError(f'Unknown index backend {backend!r}, expected one of {INDEX_BACKENDS}')
+
+
+def apply_search_params(index, nprobe=None, ef_search=None):
+    """Apply query-time settings from config (or the given overrides)"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or IVF_NPROBE
+        # Needed to reconstruct vectors for MMR; kept up to date on add and saved with the index
+        if ivf.direct_map.type != faiss.DirectMap.Array:
+            ivf.make_direct_map()
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+def build_index(vectors, backend=INDEX_BACKEND):
+    """Create, train and fill an index with vectors"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = create_index(backend, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > INDEX_TRAIN_SIZE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(len(vectors), INDEX_TRAIN_SIZE, replace=False)]
+        logger.debug(f'Training {backend} index on {len(sample)} vectors')
+        index.train(sample)
+    index.add(vectors)
+    return apply_search_params(index)
+
+
+def all_vectors(index):
+    """Stored vectors in position order (approximate for quantized indexes)"""
+    apply_search_params(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def convert_vectorstore(db, backend=INDEX_BACKEND):
+    """Rebuild the store's index with another backend, keeping positions"""
+    current = index_backend(db.index)
+    if current in ('ivf_pq', 'sq8'):
+        logger.warning(f'Converting from quantized {current} index, vectors are approximate; rebuild for exact ones')
+    logger.info(f'Converting vector index from {current} to {backend}')
+    db.index = build_index(all_vectors(db.index), backend)
+    return db
+
+
+def delete_chunks(db, ids):
+    """Delete chunks from a vector store with any backend.
+
+    Flat-coded indexes compact on removal, which is what LangChain's
+    FAISS.delete relies on. IVF indexes keep their labels and HNSW cannot
+    remove at all, so those are refilled from the remaining vectors; the
+    trained quantizers are kept.
+    """
+    if index_backend(db.index) in ('flat', 'sq8'):
+        db.delete(ids)
+        return
+
+    ids = set(ids)
+    keep = [position for position, doc_id in sorted(db.index_to_docstore_id.items()) if doc_id not in ids]
+    vectors = all_vectors(db.index)[keep]
+    db.index.reset()
+    db.index.add(vectors)
+    apply_search_params(db.index)
+    db.docstore.delete(list(ids))
+    db.index_to_docstore_id = {new: db.index_to_docstore_id[old] for new, old in enumerate(keep)}
+
+
+def _search_latencies(index, queries, k):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(found[0])
+    return np.array(latencies), np.array(results)
+
+
+def evaluate_backends(vectors, queries, k=RETRIEVAL_K, backends=INDEX_BACKENDS):
+    """Compare recall@k and latency of each backend against exact flat search.
+
+    IVF backends are swept over nprobe and HNSW over efSearch.
+    """
+    flat = build_index(vectors, 'flat')
+    flat_latencies, truth = _search_latencies(flat, queries, k)
+    report = []
+
+    for backend in backends:
+        start = time.perf_counter()
+        index = build_index(vectors, backend)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+
+        if backend in ('ivf_flat', 'ivf_pq'):
+            settings = [{'nprobe': n} for n in (1, 4, 8, 16, 32, 64) if n <= faiss.extract_index_ivf(index).nlist]
+        elif backend == 'hnsw':
+            settings = [{'ef_search': ef} for ef in (16, 32, 64, 128, 256)]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            apply_search_params(index, **setting)
+            latencies, found = _search_latencies(index, queries, k)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            report.append({
+                'backend': backend,
+                **setting,
+                'recall_at_k': round(float(recall), 4),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 4),
+                'flat_p50_ms': round(float(np.percentile(flat_latencies, 50)), 4),
+                'index_mb': round(size_mb, 2),
+                'build_s': round(build_seconds, 2),
+            })
+    return report
+
+
+def main():
+    """Print a recall-vs-latency report for the saved knowledge base"""
+    parser = argparse.ArgumentParser(description='Compare FAISS index backends against flat search')
+    parser.add_argument('--k', type=int, default=RETRIEVAL_K)
+    parser.add_argument('--queries', type=int, default=200, help='Number of chunks sampled as queries')
+    parser.add_argument('--backends', nargs='+', default=list(INDEX_BACKENDS), choices=INDEX_BACKENDS)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    from database import get_index_db
+    vectors = all_vectors(get_index_db().index)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    # Perturb sampled chunks so queries are not exact copies of stored vectors
+    queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+    report = evaluate_backends(vectors, queries, args.k, args.backends)
+    print(f"{'backend':<10}{'setting':<14}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'MB':>8}{'build s':>9}")
+    for row in report:
+        setting = ', '.join(f'{key}={row[key]}' for key in ('nprobe', 'ef_search') if key in row)
+        print(f"{row['backend']:<10}{setting:<14}{row['recall_at_k']:>10.3f}{row['p50_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['index_mb']:>8.1f}{row['build_s']:>9.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()